@@ -18,6 +18,9 @@
 #
 """Artifacts defintions internally used to refer to intermediate results."""
 
+import os
+import shutil
+import hashlib
 from enum import Enum
 from pathlib import Path
 
@@ -69,8 +72,25 @@ def lookup_artifacts(artifacts, name=None, fmt=None, flags=None, first_only=Fals
     return matches
 
 
+def link_or_copy(src, dest):
+    """Create a hardlink of a file if possible, else fall back to a copy."""
+    if os.path.lexists(dest):
+        if os.path.samefile(src, dest):
+            return
+        os.unlink(dest)
+    try:
+        os.link(src, dest)
+    except OSError:  # e.g. different filesystems
+        shutil.copyfile(src, dest)
+
+
 class Artifact:
-    """Artifact type."""
+    """Artifact type.
+
+    The content of TEXT/SOURCE artifacts and the data of RAW/BIN/MLF/SHARED_OBJECT artifacts can either be held
+    in memory or be backed by a file (see file argument and spill()). File-backed data is only read when accessed,
+    hence the backing file must not be modified afterwards.
+    """
 
     def __init__(
         self,
@@ -83,14 +103,17 @@ class Artifact:
         flags=None,
         archive=False,
         optional=False,
+        file=None,
     ):
-        # TODO: Allow to store filenames as well as raw data
         self.name = name
         # TODO: too many attributes...
-        self.content = content
+        self._content = content
+        self._raw = raw
+        self.file = Path(file) if file is not None else None
+        self._digest = None
+        self.exports = {}  # Exported files (and extraction directories) with the digest of the written data
         self.path = path
         self.data = data
-        self.raw = raw
         self.fmt = fmt
         self.flags = flags if flags is not None else {}
         self.archive = archive
@@ -100,6 +123,122 @@ class Artifact:
     def __repr__(self):
         return f"Artifact({self.name}, fmt={self.fmt}, flags={self.flags})"
 
+    def __setstate__(self, state):
+        # Artifacts pickled by older versions (e.g. in the stage cache) store their data in public attributes
+        for key in ["content", "raw"]:
+            if key in state:
+                state[f"_{key}"] = state.pop(key)
+        state.setdefault("file", None)
+        state.setdefault("_digest", None)
+        state.setdefault("exports", {})
+        self.__dict__.update(state)
+
+    @property
+    def is_text(self):
+        """Returns true if the data of the artifact is a string."""
+        return self.fmt in [ArtifactFormat.TEXT, ArtifactFormat.SOURCE]
+
+    @property
+    def content(self):
+        """Get the content of a TEXT/SOURCE artifact (read from the backing file if not in memory)."""
+        if self._content is None and self.file is not None and self.is_text:
+            with open(self.file, "r", encoding="utf-8") as handle:
+                return handle.read()
+        return self._content
+
+    @content.setter
+    def content(self, value):
+        self._content = value
+        self._digest = None
+        self.file = None
+
+    @property
+    def raw(self):
+        """Get the data of a binary artifact (read from the backing file if not in memory)."""
+        if self._raw is None and self.file is not None and not self.is_text:
+            with open(self.file, "rb") as handle:
+                return handle.read()
+        return self._raw
+
+    @raw.setter
+    def raw(self, value):
+        self._raw = value
+        self._digest = None
+        self.file = None
+
+    def _compute_digest(self):
+        if self._content is not None:
+            return hashlib.sha256(self._content.encode()).hexdigest()
+        if self._raw is not None:
+            return hashlib.sha256(self._raw).hexdigest()
+        if self.file is not None:
+            hasher = hashlib.sha256()
+            with open(self.file, "rb") as handle:
+                for chunk in iter(lambda: handle.read(1024 * 1024), b""):
+                    hasher.update(chunk)
+            return hasher.hexdigest()
+        return None
+
+    @property
+    def digest(self):
+        """Get the SHA256 digest of the data of the artifact (None for PATH artifacts)."""
+        if self._digest is None:
+            # The backing file is not modified, hence it only has to be hashed once
+            self._digest = self._compute_digest()
+        return self._digest
+
+    @property
+    def in_memory(self):
+        """Returns true if the data of the artifact is held in memory."""
+        return self._content is not None or self._raw is not None
+
+    @property
+    def size(self):
+        """Get the size of the data in bytes (None for PATH artifacts)."""
+        if self._content is not None:
+            return len(self._content)
+        if self._raw is not None:
+            return len(self._raw)
+        if self.file is not None:
+            return os.path.getsize(self.file)
+        return None
+
+    def spill(self, filename):
+        """Move the in-memory data of the artifact to the given file and only keep a reference to it."""
+        if not self.in_memory:
+            return
+        if self._digest is None:
+            self._digest = self._compute_digest()  # Cheap while the data is still in memory
+        filename = Path(filename)
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        if self.is_text:
+            with open(filename, "w", encoding="utf-8") as handle:
+                handle.write(self._content)
+        else:
+            with open(filename, "wb") as handle:
+                handle.write(self._raw)
+        self._content = None
+        self._raw = None
+        self.file = filename
+
+    def materialize(self):
+        """Return a copy of the artifact which holds its data in memory (e.g. to be stored in a cache)."""
+        if self.file is None:
+            return self
+        ret = Artifact(
+            self.name,
+            content=self.content if self.is_text else None,
+            raw=None if self.is_text else self.raw,
+            path=self.path,
+            data=self.data,
+            fmt=self.fmt,
+            flags=self.flags,
+            archive=self.archive,
+            optional=self.optional,
+        )
+        ret._digest = self._digest
+        return ret
+
     @property
     def exported(self):
         """Returns true if the artifact was writtem to disk."""
@@ -108,11 +247,11 @@ class Artifact:
     def validate(self):
         """Checker for artifact attributes for the given format."""
         if self.fmt in [ArtifactFormat.TEXT, ArtifactFormat.SOURCE]:
-            assert self.content is not None
+            assert self._content is not None or self.file is not None
         elif self.fmt in [ArtifactFormat.RAW, ArtifactFormat.BIN]:
-            assert self.raw is not None
+            assert self._raw is not None or self.file is not None
         elif self.fmt in [ArtifactFormat.MLF, ArtifactFormat.SHARED_OBJECT]:
-            assert self.raw is not None
+            assert self._raw is not None or self.file is not None
         elif self.fmt in [ArtifactFormat.PATH]:
             assert self.path is not None
         else:
@@ -121,6 +260,8 @@ class Artifact:
     def export(self, dest, extract=False):
         """Export the artifact to a given path (file or directory) and update its path.
 
+        Files which were already written by this artifact with the same content are not written again.
+
         Arguments
         ---------
         dest : str
@@ -135,26 +276,47 @@ class Artifact:
             filename = dest / self.name
         else:
             filename = dest
-        if self.fmt in [ArtifactFormat.TEXT, ArtifactFormat.SOURCE]:
-            assert not extract, "extract option is only available for ArtifactFormat.MLF"
-            with open(filename, "w", encoding="utf-8") as handle:
-                handle.write(self.content)
-        elif self.fmt in [ArtifactFormat.RAW, ArtifactFormat.BIN]:
-            assert not extract, "extract option is only available for ArtifactFormat.MLF"
-            with open(filename, "wb") as handle:
-                handle.write(self.raw)
-        elif self.fmt in [ArtifactFormat.MLF, ArtifactFormat.SHARED_OBJECT]:
-            with open(filename, "wb") as handle:
-                handle.write(self.raw)
-            if extract:
-                utils.extract(filename, dest)
-                # os.remove(filename)
-        elif self.fmt in [ArtifactFormat.PATH]:
-            assert not extract, "extract option is only available for ArtifactFormat.MLF"
+        if extract:
+            assert self.fmt in [
+                ArtifactFormat.MLF,
+                ArtifactFormat.SHARED_OBJECT,
+            ], "extract option is only available for ArtifactFormat.MLF"
+        if self.fmt == ArtifactFormat.PATH:
             utils.copy(self.path, filename)
+        elif not self.is_exported(filename):
+            self._write(filename)
+            self.exports[(str(filename),)] = self.digest
+        if extract and not self.is_exported(filename, extracted_to=dest):
+            utils.extract(filename, dest)
+            self.exports[(str(filename), str(dest))] = self.digest
+        self.path = filename if self.path is None else self.path
+
+    def is_exported(self, filename, extracted_to=None):
+        """Returns true if the current data of the artifact was already exported to the given file."""
+        key = (str(filename),) if extracted_to is None else (str(filename), str(extracted_to))
+        if key not in self.exports or not os.path.lexists(filename):
+            return False
+        return self.exports[key] == self.digest
+
+    def _write(self, filename):
+        if os.path.lexists(filename) and not filename.is_dir():
+            # The existing file might be a hardlink to the backing file of another artifact
+            if self.file is None or not os.path.samefile(self.file, filename):
+                os.unlink(filename)
+        if self.fmt in [ArtifactFormat.TEXT, ArtifactFormat.SOURCE]:
+            if self.in_memory:
+                with open(filename, "w", encoding="utf-8") as handle:
+                    handle.write(self.content)
+            else:
+                link_or_copy(self.file, filename)
+        elif self.fmt in [ArtifactFormat.RAW, ArtifactFormat.BIN, ArtifactFormat.MLF, ArtifactFormat.SHARED_OBJECT]:
+            if self.in_memory:
+                with open(filename, "wb") as handle:
+                    handle.write(self.raw)
+            else:
+                link_or_copy(self.file, filename)
         else:
             raise NotImplementedError
-        self.path = filename if self.path is None else self.path
 
     def print_summary(self):
         """Utility to print information about an artifact to the cmdline."""
@@ -164,9 +326,9 @@ class Artifact:
             print("Content:")
             print(self.content)
         elif self.fmt in [ArtifactFormat.RAW, ArtifactFormat.BIN]:
-            print(f"Data Size: {len(self.raw)}B")
+            print(f"Data Size: {self.size}B")
         elif self.fmt in [ArtifactFormat.MLF, ArtifactFormat.SHARED_OBJECT]:
-            print(f"Archive Size: {len(self.raw)}B")
+            print(f"Archive Size: {self.size}B")
         elif self.fmt in [ArtifactFormat.PATH]:
             print(f"File Location: {self.path}")
         else:
@@ -33,6 +33,7 @@ import mlonmcu.cli.cleanup as cleanup
 import mlonmcu.cli.export as export
 import mlonmcu.cli.env as env
 import mlonmcu.cli.models as models
+import mlonmcu.cli.worker as worker
 from .common import handle_logging_flags, add_common_options
 from ..version import __version__
 
@@ -96,6 +97,7 @@ def main(args=None):
     export.get_parser(subparsers)
     env.get_parser(subparsers)
     models.get_parser(subparsers)
+    worker.get_parser(subparsers)
     if args:
         args = parser.parse_args(args)
     else:
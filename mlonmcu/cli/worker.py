@@ -0,0 +1,102 @@
+#
+# Copyright (c) 2022 TUM Department of Electrical and Computer Engineering.
+#
+# This file is part of MLonMCU.
+# See https://github.com/tum-ei-eda/mlonmcu.git for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Command line subcommand for processing runs which are distributed by other sessions."""
+import multiprocessing
+from pathlib import Path
+
+from mlonmcu.context.context import MlonMcuContext
+from mlonmcu.session.distributed import DirectoryQueue, process_jobs
+from mlonmcu.setup.jobserver import use_jobserver
+from mlonmcu.logging import get_logger
+
+from mlonmcu.cli.common import (
+    add_common_options,
+    add_context_options,
+)
+
+logger = get_logger()
+
+
+def get_parser(subparsers):
+    """ "Define and return a subparser for the worker subcommand."""
+    parser = subparsers.add_parser(
+        "worker",
+        description="Process the runs of sessions using the queue executor (session.executor=queue).",
+    )
+    parser.set_defaults(func=handle)
+    add_common_options(parser)
+    add_context_options(parser)
+    parser.add_argument(
+        "--queue",
+        metavar="DIR",
+        type=str,
+        default=None,
+        help="Shared queue directory (default: the queue in the environments cache directory)",
+    )
+    parser.add_argument(
+        "-p",
+        "--parallel",
+        metavar="WORKERS",
+        type=int,
+        default=1,
+        help="Number of jobs to process in parallel on this machine (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--max-jobs",
+        type=int,
+        default=None,
+        help="Exit after the given number of jobs per worker (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=None,
+        help="Exit if no job was available for the given number of seconds (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--num-jobs",
+        type=int,
+        default=None,
+        help="Maximum number of concurrent build processes on this machine (default: number of cpu cores)",
+    )
+    return parser
+
+
+def handle(args):
+    with MlonMcuContext(path=args.home, deps_lock="read") as context:
+        if args.queue:
+            queue_dir = Path(args.queue)
+        else:
+            queue_dir = context.environment.paths["temp"].path / "cache" / "queue"
+        queue = DirectoryQueue(queue_dir)
+        logger.info("Waiting for jobs in %s", queue.directory)
+        kwargs = {"max_jobs": args.max_jobs, "idle_timeout": args.idle_timeout}
+        with use_jobserver(args.num_jobs):
+            if args.parallel > 1:
+                workers = [
+                    multiprocessing.Process(target=process_jobs, args=(queue,), kwargs=kwargs)
+                    for _ in range(args.parallel)
+                ]
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+            else:
+                count = process_jobs(queue, **kwargs)
+                logger.info("Processed %d jobs", count)
@@ -47,10 +47,8 @@ def remove_config_prefix(config, prefix, skip=None):
     if skip is None:
         skip = []
 
-    def helper(key):
-        return key.split(f"{prefix}.")[-1]
-
-    return {helper(key): value for key, value in config.items() if f"{prefix}." in key and key not in skip}
+    pattern = f"{prefix}."
+    return {key.split(pattern)[-1]: value for key, value in config.items() if pattern in key and key not in skip}
 
 
 def filter_config(config, prefix, defaults, optionals, required_keys):
@@ -184,9 +184,8 @@ def load_recent_sessions(env: Environment, count: int = None) -> List[Session]:
         runs = []
         for rid in run_ids:
             run_directory = runs_directory / str(rid)
-            # run_file = run_directory / "run.txt"
-            # run = Run.from_file(run_file)  # TODO: actually implement run restore
-            run = Run()  # TODO: fix
+            # The actual state of the runs is only restored when resuming the session (see Session.resume)
+            run = Run()
             run.archived = True
             run.dir = run_directory
             runs.append(run)
@@ -306,7 +305,9 @@ class MlonMcuContext:
                 temp_directory = self.environment.paths["temp"].path
                 sessions_directory = temp_directory / "sessions"
                 session_dir = sessions_directory / str(idx)
-                session = Session(idx=idx, label=label, dir=session_dir, config=config)
+                session = Session(
+                    idx=idx, label=label, dir=session_dir, config=config, cache_dir=temp_directory / "cache"
+                )
                 self.sessions.append(session)
                 self.session_idx = idx
                 # TODO: move this to a helper function
@@ -363,9 +364,10 @@ class MlonMcuContext:
         """
         if resume:
             assert len(self.sessions) > 0, "There is no recent session available"
-            # session = self.sessions[-1]
-            assert False, "The latest session can not be resumed"
-            raise NotImplementedError
+            session = self.sessions[-1]
+            if session.archived:
+                session.resume()
+            return session
 
         if self.session_idx < 0 or not self.sessions[-1].active:
             self.create_session(label=label, config=config)
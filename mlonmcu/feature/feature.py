@@ -165,6 +165,13 @@ class TargetFeature(FeatureBase):
         if post_callback is not None and post_callbacks is not None:
             post_callbacks.append(post_callback)
 
+    def get_target_matchers(self, target):
+        # pylint: disable=unused-argument
+        return []
+
+    def add_target_matchers(self, target, matchers):
+        matchers.extend(self.get_target_matchers(target))
+
 
 class PlatformFeature(FeatureBase):
     """Platform/Compile related feature"""
@@ -18,13 +18,12 @@
 #
 """Definition of MLonMCU features and the feature registry."""
 
-import re
 import pandas as pd
 from typing import Union
 
 from mlonmcu.utils import is_power_of_two
 from mlonmcu.config import str2bool
-from mlonmcu.artifact import Artifact, ArtifactFormat
+from mlonmcu.artifact import ArtifactFormat
 from .feature import (
     BackendFeature,
     FrameworkFeature,
@@ -966,40 +965,39 @@ class CacheSim(TargetFeature):
                 spike_args.append("--log-cache-miss")
             config.update({f"{target}.extra_args": spike_args})
 
-    def get_target_callbacks(self, target):
+    def get_target_matchers(self, target):
         assert target in ["spike"], f"Unsupported feature '{self.name}' for target '{target}'"
-        if self.enabled:
+        if not self.enabled:
+            return []
+        from mlonmcu.target.matcher import LineMatcher  # Local import to avoid circular dependencies
 
-            def cachesim_callback(stdout, metrics, artifacts):
-                """Callback which parses the targets output and updates the generated metrics and artifacts."""
-                expr = (
-                    r"(D|I|L2)\$ ((?:Bytes (?:Read|Written))|(?:Read|Write) "
-                    r"(?:Accesses|Misses)|(?:Writebacks)|(?:Miss Rate)):\s*(\d+\.?\d*%?)*"
-                )
-                matches = re.compile(expr).findall(stdout)
-                prefixes = [
-                    x for (x, y) in zip(["I", "D", "L2"], [self.ic_enable, self.dc_enable, self.l2_enable]) if y
-                ]
-                for groups in matches:
-                    assert len(groups) == 3
-                    prefix, label, value = groups
-                    if not self.detailed:
-                        if "Rate" not in label:
-                            continue
-                    value = int(value) if "%" not in value else float(value[:-1]) / 100
-                    if prefix in prefixes:
-                        for m in metrics:
-                            m.add(f"{prefix}-Cache {label}", value)
-                return stdout
+        expr = (
+            r"(D|I|L2)\$ ((?:Bytes (?:Read|Written))|(?:Read|Write) "
+            r"(?:Accesses|Misses)|(?:Writebacks)|(?:Miss Rate)):\s*(\d+\.?\d*%?)*"
+        )
+        prefixes = [x for (x, y) in zip(["I", "D", "L2"], [self.ic_enable, self.dc_enable, self.l2_enable]) if y]
+
+        def cachesim_metrics(matches, metrics):
+            """Add the cache statistics parsed from the output of the target to the metrics."""
+            for match in matches:
+                prefix, label, value = match.groups()
+                if not self.detailed:
+                    if "Rate" not in label:
+                        continue
+                if value is None:
+                    continue
+                value = int(value) if "%" not in value else float(value[:-1]) / 100
+                if prefix in prefixes:
+                    metrics.add(f"{prefix}-Cache {label}", value)
 
-            return None, cachesim_callback
+        return [LineMatcher("cachesim", expr, multiple=True, metrics_func=cachesim_metrics)]
 
 
 @register_feature("log_instrs")
 class LogInstructions(TargetFeature):
     """Enable logging of the executed instructions of a simulator-based target."""
 
-    DEFAULTS = {**FeatureBase.DEFAULTS, "to_file": False}
+    DEFAULTS = {**FeatureBase.DEFAULTS, "to_file": False, "fmt": "npz"}  # fmt: npz (binary trace) or text
 
     def __init__(self, features=None, config=None):
         super().__init__("log_instrs", features=features, config=config)
@@ -1009,6 +1007,12 @@ class LogInstructions(TargetFeature):
         value = self.config["to_file"]
         return str2bool(value, allow_none=True) if not isinstance(value, (bool, int)) else value
 
+    @property
+    def fmt(self):
+        value = self.config["fmt"]
+        assert value in ["npz", "text"], f"Unsupported format for instruction logs: {value}"
+        return value
+
     def add_target_config(self, target, config):
         assert target in ["spike", "etiss_pulpino", "ovpsim", "gvsoc_pulp"]
         if not self.enabled:
@@ -1049,49 +1053,46 @@ class LogInstructions(TargetFeature):
                 extra_args_new.append("--trace=insn")
             config.update({f"{target}.extra_args": extra_args_new})
 
-    def get_target_callbacks(self, target):
+    def get_target_matchers(self, target):
         assert target in [
             "spike",
             "etiss_pulpino",
             "ovpsim",
             "gvsoc_pulp",
         ], f"Unsupported feature '{self.name}' for target '{target}'"
-        if self.enabled:
-            if not target == "gvsoc_pulp":
-
-                def log_instrs_callback(stdout, metrics, artifacts):
-                    """Callback which parses the targets output and updates the generated metrics and artifacts."""
-                    new_lines = []
-                    if self.to_file:
-                        # TODO: update stdout and remove log_instrs lines
-                        instrs = []
-                        for line in stdout.split("\n"):
-                            if target == "etiss_pulpino":
-                                expr = re.compile(r"0x[a-fA-F0-9]+: .* \[.*\]")
-                            elif target == "spike":
-                                expr = re.compile(r"core\s+\d+: 0x[a-fA-F0-9]+ \(0x[a-fA-F0-9]+\) .*")
-                            elif target == "ovpsim":
-                                expr = re.compile(
-                                    r"Info 'riscvOVPsim\/cpu',\s0x[0-9abcdef]+\(.*\):\s[0-9abcdef]+\s+\w+\s+.*"
-                                )
-                            match = expr.match(line)
-                            if match is not None:
-                                instrs.append(line)
-                            else:
-                                new_lines.append(line)
-                        instrs_artifact = Artifact(
-                            f"{target}_instrs.log",
-                            content="\n".join(instrs),
-                            fmt=ArtifactFormat.TEXT,
-                            flags=(self.name, target),
-                        )
-                        artifacts.append(instrs_artifact)
-                        return "\n".join(new_lines)
-                    else:
-                        return stdout
-
-                return None, log_instrs_callback
-        return None, None
+        if not self.enabled or not self.to_file or target == "gvsoc_pulp":
+            return []
+        # Local imports to avoid circular dependencies
+        from mlonmcu.target.matcher import LineMatcher
+        from mlonmcu.target.instr_trace import InstructionTraceMatcher
+
+        flags = (self.name, target)
+        if self.fmt == "npz":
+            # The matching lines are converted to a compact binary trace (see mlonmcu.target.instr_trace)
+            encoding_base = 16
+            if target == "etiss_pulpino":
+                expr = r"^0x(?P<pc>[0-9a-fA-F]+):\s(?P<name>\w+)\s#\s(?P<encoding>[01]+)\s.*\[.*\]"
+                encoding_base = 2
+            elif target == "spike":
+                expr = r"^core\s+\d+: 0x(?P<pc>[0-9a-fA-F]+) \(0x(?P<encoding>[0-9a-fA-F]+)\) (?P<name>[\w.]+)"
+            elif target == "ovpsim":
+                expr = (
+                    r"^Info 'riscvOVPsim\/cpu',\s0x(?P<pc>[0-9a-fA-F]+)\(.*\):\s(?P<encoding>[0-9a-fA-F]+)\s+"
+                    r"(?P<name>\w+)\s+.*"
+                )
+            return [
+                InstructionTraceMatcher(
+                    "instrs", expr, f"{target}_instrs.npz", encoding_base=encoding_base, flags=flags
+                )
+            ]
+        # The matching lines are directly written to the log file instead of being kept in the stdout
+        if target == "etiss_pulpino":
+            expr = r"^0x[a-fA-F0-9]+: .* \[.*\]"
+        elif target == "spike":
+            expr = r"^core\s+\d+: 0x[a-fA-F0-9]+ \(0x[a-fA-F0-9]+\) .*"
+        elif target == "ovpsim":
+            expr = r"^Info 'riscvOVPsim\/cpu',\s0x[0-9abcdef]+\(.*\):\s[0-9abcdef]+\s+\w+\s+.*"
+        return [LineMatcher("instrs", expr, consume=True, file=f"{target}_instrs.log", flags=flags)]
 
 
 @register_feature("arm_mvei")
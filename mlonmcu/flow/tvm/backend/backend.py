@@ -20,6 +20,7 @@ import multiprocessing
 
 from mlonmcu.flow.backend import Backend
 from mlonmcu.setup import utils
+from mlonmcu.setup.jobserver import job_slots
 from mlonmcu.config import str2bool
 from .model_info import get_model_info, get_supported_formats
 from .python_utils import prepare_python_environment
@@ -258,17 +259,16 @@ class TVMBackend(Backend):
             tophub_url=self.tophub_url,
             num_threads=self.num_threads,
         )
-        if self.use_tlcpack:
-            pre = ["tvmc"]
-            return utils.exec_getout(
-                *pre, command, *args, live=self.print_outputs, print_output=False, env=env, cwd=cwd
-            )
-        else:
-            if self.tvmc_custom_script is None:
-                pre = ["-m", "tvm.driver.tvmc"]
+        with job_slots(1, env=env, cwd=cwd) as (_, kwargs):
+            if self.use_tlcpack:
+                pre = ["tvmc"]
+                return utils.exec_getout(*pre, command, *args, live=self.print_outputs, print_output=False, **kwargs)
             else:
-                pre = [self.tvmc_custom_script]
-            return utils.python(*pre, command, *args, live=self.print_outputs, print_output=False, env=env, cwd=cwd)
+                if self.tvmc_custom_script is None:
+                    pre = ["-m", "tvm.driver.tvmc"]
+                else:
+                    pre = [self.tvmc_custom_script]
+                return utils.python(*pre, command, *args, live=self.print_outputs, print_output=False, **kwargs)
 
     def invoke_tvmc_compile(self, out, dump=None, cwd=None):
         args = self.get_tvmc_compile_args(out)
@@ -29,6 +29,8 @@ from mlonmcu.logging import get_logger
 
 logger = get_logger()
 
+_lookup_cache = {}  # (directories, formats) -> (modification times, result of lookup_models_and_groups)
+
 
 def get_model_directories(context):
     dirs = context.environment.paths["models"]
@@ -154,7 +156,47 @@ def list_modelgroups(directory):
     return groups
 
 
+def _scan_mtimes(directory, depth):
+    ret = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            children = None
+            if depth > 0 and entry.is_dir() and not entry.name.startswith("."):
+                children = _scan_mtimes(entry.path, depth - 1)
+            ret.append((entry.name, entry.stat().st_mtime_ns, children))
+    return tuple(sorted(ret))
+
+
+def _get_mtimes(directories):
+    # The files of the models (including the metadata) are located in the subdirectories, hence editing them
+    # in place does not change the modification time of the parent directory
+    ret = []
+    for directory in directories:
+        if not os.path.isdir(directory):
+            ret.append(None)
+            continue
+        ret.append(_scan_mtimes(directory, depth=1))
+    return tuple(ret)
+
+
 def lookup_models_and_groups(directories, formats):
+    """Find all models and model groups in the given directories.
+
+    The results are cached until one of the directories or model files is modified, because parsing the metadata
+    of every model is expensive if thousands of runs are created. The returned models are shared between the
+    callers and must not be modified.
+    """
+    key = (tuple(str(directory) for directory in directories), tuple(formats))
+    mtimes = _get_mtimes(directories)
+    cached = _lookup_cache.get(key)
+    if cached is not None and cached[0] == mtimes:
+        return cached[1]
+    ret = _lookup_models_and_groups(directories, formats)
+    _lookup_cache[key] = (mtimes, ret)
+    return ret
+
+
+def _lookup_models_and_groups(directories, formats):
     all_models = []
     all_groups = []
     duplicates = {}
@@ -108,6 +108,10 @@ class Model:
         else:
             return False
 
+    def __deepcopy__(self, memo):
+        # Models are not modified after the lookup, hence copies of a run (see Run.copy) can share them
+        return self
+
     def __repr__(self):
         if self.alt:
             return f"Model({self.name},alt={self.alt})"
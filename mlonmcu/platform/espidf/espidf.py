@@ -20,15 +20,14 @@
 
 import os
 import time
-import signal
 import shutil
 import tempfile
-import subprocess
 from pathlib import Path
 import pkg_resources
 
 
 from mlonmcu.setup import utils
+from mlonmcu.setup.jobserver import job_slots
 from mlonmcu.artifact import Artifact, ArtifactFormat
 from mlonmcu.logging import get_logger
 from mlonmcu.target.target import Target
@@ -106,14 +105,18 @@ class EspIdfPlatform(CompilePlatform, TargetPlatform):
         return str2bool(value) if not isinstance(value, (bool, int)) else value
 
     def invoke_idf_exe(self, *args, **kwargs):
-        env = os.environ.copy()
+        return self.invoke_idf_tool(self.idf_exe, *args, **kwargs)
+
+    def invoke_idf_tool(self, tool, *args, **kwargs):
+        """Run a program (e.g. idf.py or cmake) in the environment of ESP-IDF."""
+        env = kwargs.pop("env", None) or os.environ.copy()
         env["IDF_PATH"] = str(self.espidf_src_dir)
         env["IDF_TOOLS_PATH"] = str(self.espidf_install_dir)
         cmd = (
             ". "
             + str(self.espidf_src_dir / "export.sh")
-            + f" && {self.idf_exe} "
-            # + f" > /dev/null && {self.idf_exe} "
+            + f" && {tool} "
+            # + f" > /dev/null && {tool} "
             + " ".join([str(arg) for arg in args])
         )
         out = utils.exec_getout(
@@ -267,14 +270,22 @@ class EspIdfPlatform(CompilePlatform, TargetPlatform):
         out = ""
         # TODO: build with cmake options
         out += self.prepare(target, src)
-        # TODO: support self.num_threads (e.g. patch esp-idf)
         idfArgs = [
             "-C",
             self.project_dir,
             *self.get_idf_cmake_args(),
-            "build",
+            "reconfigure",
         ]
-        out += self.invoke_idf_exe(*idfArgs, live=self.print_outputs)
+        env = os.environ.copy()
+        env.update(self.get_ccache_vars(self.project_dir, base_dir=self.project_dir.parent))
+        with job_slots(1, env=env) as (_, kwargs):
+            out += self.invoke_idf_exe(*idfArgs, live=self.print_outputs, **kwargs)
+        # Equivalent to `idf.py build`, which does not allow to limit the number of jobs. As ninja does not use the
+        # jobserver, it is limited to the number of acquired tokens instead.
+        with job_slots(self.num_threads, env=env) as (num_jobs, kwargs):
+            out += self.invoke_idf_tool(
+                "cmake", "--build", self.project_dir / "build", "--", f"-j{num_jobs}", live=self.print_outputs, **kwargs
+            )
         return out
 
     def generate(self, src, target, model=None):
@@ -338,22 +349,10 @@ class EspIdfPlatform(CompilePlatform, TargetPlatform):
 
         if self.use_idf_monitor:
 
-            def _kill_monitor():
-                import psutil
-
-                for proc in psutil.process_iter():
-                    # check whether the process name matches
-                    cmdline = " ".join(proc.cmdline())
-                    if "idf_monitor.py" in cmdline:  # TODO: do something less "dangerous"?
-                        proc.kill()
-
             def _monitor_helper(*args, verbose=False, start_match=None, end_match=None, timeout=60):
                 # start_match and end_match are inclusive
-                if timeout:
-                    pass  # TODO: implement timeout
-                found_start = start_match is None
-                logger.debug("- Executing: %s", str(args))
-                outStr = ""
+                state = {"found_start": start_match is None, "found_end": False}
+                lines = []
                 env = os.environ.copy()
                 env["IDF_PATH"] = str(self.espidf_src_dir)
                 env["IDF_TOOLS_PATH"] = str(self.espidf_install_dir)
@@ -363,42 +362,43 @@ class EspIdfPlatform(CompilePlatform, TargetPlatform):
                     + f"> /dev/null && {self.idf_exe} "
                     + " ".join([str(arg) for arg in args])
                 )
-                process = subprocess.Popen(
-                    cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, shell=True, executable="/bin/bash", env=env
-                )
+
+                def _handle_line(line):
+                    if verbose:
+                        print(line)
+                    if start_match and start_match in line:
+                        lines.clear()
+                        state["found_start"] = True
+                    lines.append(line)
+                    if state["found_start"] and end_match and end_match in line:
+                        # Stops the monitor by killing its process group
+                        state["found_end"] = True
+                        return True
+                    return False
+
+                def _handle_exit(code):
+                    return 0 if state["found_end"] else code
+
                 try:
-                    exit_code = None
-                    for line in process.stdout:
-                        new_line = line.decode(errors="replace")
-                        if verbose:
-                            print(new_line.replace("\n", ""))
-                        if start_match and start_match in new_line:
-                            outStr = new_line
-                            found_start = True
-                        else:
-                            outStr = outStr + new_line
-                        if found_start:
-                            if end_match and end_match in new_line:
-                                _kill_monitor()
-                                process.terminate()
-                                exit_code = 0
-                    while exit_code is None:
-                        exit_code = process.poll()
-                    if not verbose and exit_code != 0:
-                        logger.error(outStr)
-                    assert exit_code == 0, "The process returned an non-zero exit code {}! (CMD: `{}`)".format(
-                        exit_code, cmd
+                    exit_code, _ = utils.run_process(
+                        ["/bin/bash", "-c", cmd],
+                        line_callback=_handle_line,
+                        capture=False,
+                        handle_exit=_handle_exit,
+                        timeout=timeout if timeout else None,
+                        env=env,
                     )
-                except KeyboardInterrupt:
-                    logger.debug("Interrupted subprocess. Sending SIGINT signal...")
-                    _kill_monitor()
-                    pid = process.pid
-                    os.kill(pid, signal.SIGINT)
-                os.system("reset")
+                finally:
+                    os.system("reset")
+                outStr = "\n".join(lines)
+                if not verbose and exit_code != 0:
+                    logger.error(outStr)
+                assert exit_code == 0, "The process returned an non-zero exit code {}! (CMD: `{}`)".format(
+                    exit_code, cmd
+                )
                 return outStr
 
             logger.debug("Monitoring target software")
-            # TODO: implement timeout
             idfArgs = [
                 "-C",
                 self.project_dir,
@@ -475,7 +475,6 @@ class EspIdfPlatform(CompilePlatform, TargetPlatform):
                 return outStr
 
             logger.debug("Monitoring target software")
-            # TODO: implement timeout
             return _monitor_helper2(
                 port,
                 baud,
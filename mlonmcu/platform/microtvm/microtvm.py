@@ -27,6 +27,7 @@ from typing import Tuple
 from mlonmcu.setup import utils
 from mlonmcu.config import str2bool
 from mlonmcu.logging import get_logger
+from mlonmcu.setup.jobserver import job_slots
 from mlonmcu.artifact import Artifact, ArtifactFormat
 
 from mlonmcu.flow.tvm.backend.python_utils import prepare_python_environment
@@ -305,15 +306,28 @@ class MicroTvmPlatform(CompilePlatform, TargetPlatform, BuildPlatform, TunePlatf
             ret.append("--help")
         return ret
 
-    def invoke_tvmc(self, command, *args, target=None, prefix=""):
+    def invoke_tvmc(self, command, *args, target=None, prefix="", extra_env=None, timeout=None):
         env = prepare_python_environment(self.tvm_pythonpath, self.tvm_build_dir, self.tvm_configs_dir)
         if target:
             target.update_environment(env)
+        if extra_env:
+            env.update(extra_env)
         if self.tvmc_custom_script is None:
             pre = ["-m", "tvm.driver.tvmc"]
         else:
             pre = [self.tvmc_custom_script]
-        return utils.python(*pre, command, *args, live=self.print_outputs, print_output=False, env=env, prefix=prefix)
+        # The make/cmake processes spawned by the project API take additional tokens from the jobserver (if any)
+        with job_slots(1, env=env) as (_, kwargs):
+            return utils.python(
+                *pre,
+                command,
+                *args,
+                live=self.print_outputs,
+                print_output=False,
+                prefix=prefix,
+                timeout=timeout,
+                **kwargs,
+            )
 
     def collect_available_project_options(self, command, path, mlf_path, template, micro=True, target=None):
         args = self.get_tvmc_micro_args(command, path, mlf_path, template, list_options=True)
@@ -321,7 +335,18 @@ class MicroTvmPlatform(CompilePlatform, TargetPlatform, BuildPlatform, TunePlatf
         return parse_project_options_from_stdout(out)
 
     def invoke_tvmc_micro(
-        self, command, path, mlf_path, template, target, extra_args=None, micro=True, tune_args=None, prefix=""
+        self,
+        command,
+        path,
+        mlf_path,
+        template,
+        target,
+        extra_args=None,
+        micro=True,
+        tune_args=None,
+        prefix="",
+        extra_env=None,
+        timeout=None,
     ):
         args = self.get_tvmc_micro_args(command, path, mlf_path, template, tune_args=tune_args)
         options = filter_project_options(
@@ -329,21 +354,21 @@ class MicroTvmPlatform(CompilePlatform, TargetPlatform, BuildPlatform, TunePlatf
             target.get_project_options(),
         )
         args += get_project_option_args(template, command, options)
-        return self.invoke_tvmc("micro", *args, target=target, prefix=prefix)
+        return self.invoke_tvmc("micro", *args, target=target, prefix=prefix, extra_env=extra_env, timeout=timeout)
 
     def collect_available_run_project_options(self, path, device):
         args = self.get_tvmc_run_args(path, device, list_options=True)
         out = self.invoke_tvmc("run", *args)
         return parse_project_options_from_stdout(out)
 
-    def invoke_tvmc_run(self, path, device, template, target, micro=True):
+    def invoke_tvmc_run(self, path, device, template, target, micro=True, timeout=None):
         args = self.get_tvmc_run_args(path, device)
         if micro:
             options = filter_project_options(
                 self.collect_available_run_project_options(path, device), target.get_project_options()
             )
             args.extend(get_project_option_args(template, "run", options))
-        return self.invoke_tvmc("run", *args, target=target)
+        return self.invoke_tvmc("run", *args, target=target, timeout=timeout)
 
     def close(self):
         if self.tempdir:
@@ -372,7 +397,10 @@ class MicroTvmPlatform(CompilePlatform, TargetPlatform, BuildPlatform, TunePlatf
     def compile(self, target):
         out = ""
         # TODO: build with cmake options
-        out += self.invoke_tvmc_micro("build", self.project_dir, None, self.get_template_args(target), target)
+        ccache_vars = self.get_ccache_vars(self.project_dir.parent, base_dir=self.project_dir.parent)
+        out += self.invoke_tvmc_micro(
+            "build", self.project_dir, None, self.get_template_args(target), target, extra_env=ccache_vars
+        )
         # TODO: support self.num_threads (e.g. patch esp-idf)
         return out
 
@@ -393,16 +421,17 @@ class MicroTvmPlatform(CompilePlatform, TargetPlatform, BuildPlatform, TunePlatf
         # TODO: add alternative approach which allows passing elf instead
         if elf is not None:
             logger.debug("Ignoring ELF file for microtvm platform")
-        # TODO: implement timeout
         logger.debug("Flashing target software using MicroTVM ProjectAPI")
-        output = self.invoke_tvmc_micro("flash", self.project_dir, None, self.get_template_args(target), target)
+        output = self.invoke_tvmc_micro(
+            "flash", self.project_dir, None, self.get_template_args(target), target, timeout=timeout
+        )
         return output
 
     def run(self, elf, target, timeout=120):
-        # TODO: implement timeout
-        output = self.flash(elf, target)
+        # The timeout applies to flashing and running separately
+        output = self.flash(elf, target, timeout=timeout)
         output += self.invoke_tvmc_run(
-            str(self.project_dir), "micro", self.get_template_args(target), target, micro=True
+            str(self.project_dir), "micro", self.get_template_args(target), target, micro=True, timeout=timeout
         )
         return output
 
@@ -17,10 +17,14 @@
 # limitations under the License.
 #
 """MLIF Platform"""
+import os
+import json
+import shutil
 import tempfile
 from typing import Tuple
 
 from pathlib import Path
+from filelock import FileLock
 
 from mlonmcu.config import str2bool
 from mlonmcu.setup import utils  # TODO: Move one level up?
@@ -29,6 +33,7 @@ from mlonmcu.logging import get_logger
 from mlonmcu.target import get_targets
 from mlonmcu.target.target import Target
 from mlonmcu.models.utils import get_data_source
+from mlonmcu.session.cache import StageCache as ElfCache, hash_file, hash_tree, get_tree_signature
 
 from ..platform import CompilePlatform, TargetPlatform
 from .mlif_target import get_mlif_platform_targets, create_mlif_platform_target
@@ -72,8 +77,14 @@ class MlifPlatform(CompilePlatform, TargetPlatform):
         "mem_only": False,
         "debug_symbols": False,
         "verbose_makefile": False,
+        "elf_cache": False,  # Reuse ELF files of previous builds with identical inputs
+        "elf_cache_max_size": "2G",
+        "shared_build": False,  # Reuse a single build directory for all runs with equivalent cmake arguments
     }
 
+    # Files in the codegen directory which do not affect the build
+    FINGERPRINT_IGNORE = ["*.csv", "*.log", "run.txt"]
+
     REQUIRED = ["mlif.src_dir"]
     OPTIONAL = ["llvm.install_dir"]
 
@@ -216,6 +227,22 @@ class MlifPlatform(CompilePlatform, TargetPlatform):
         value = self.config["verbose_makefile"]
         return str2bool(value) if not isinstance(value, (bool, int)) else value
 
+    @property
+    def shared_build(self):
+        value = self.config["shared_build"]
+        return str2bool(value) if not isinstance(value, (bool, int)) else value
+
+    @property
+    def elf_cache(self):
+        value = self.config["elf_cache"]
+        enabled = str2bool(value) if not isinstance(value, (bool, int)) else value
+        if not enabled:
+            return None
+        cache_dir = self.cache_dir
+        if cache_dir is None:
+            cache_dir = self.build_dir / "cache"
+        return ElfCache(cache_dir, max_size=self.config["elf_cache_max_size"])
+
     def get_supported_targets(self):
         target_names = get_mlif_platform_targets()
         return target_names
@@ -241,13 +268,16 @@ class MlifPlatform(CompilePlatform, TargetPlatform):
             args.append(f"-DMODEL_SUPPORT_DIR={self.model_support_dir}")
         else:
             pass
+        # Passed explicitly as the environment variables are only used for the initial configuration
+        launcher = self.ccache_exe if self.ccache_available else ""
+        args.append(f"-DCMAKE_C_COMPILER_LAUNCHER={launcher}")
+        args.append(f"-DCMAKE_CXX_COMPILER_LAUNCHER={launcher}")
         return args
 
     def prepare(self):
         self.init_directory()
 
-    def configure(self, target, src, _model):
-        del target
+    def get_cmake_args(self, src):
         if not isinstance(src, Path):
             src = Path(src)
         cmakeArgs = []
@@ -274,40 +304,275 @@ class MlifPlatform(CompilePlatform, TargetPlatform):
             data_artifact.export(data_file)
             cmakeArgs.append("-DDATA_SRC=" + str(data_file))
             artifacts = [data_artifact]
-        utils.mkdirs(self.build_dir)
+        return cmakeArgs, artifacts
+
+    def configure(self, target, src, _model, cmake_args=None, build_dir=None, env=None):
+        del target
+        if cmake_args is None:
+            cmakeArgs, artifacts = self.get_cmake_args(src)
+        else:
+            cmakeArgs, artifacts = cmake_args
+        build_dir = build_dir if build_dir is not None else self.build_dir
+        utils.mkdirs(build_dir)
         out = utils.cmake(
             self.mlif_dir,
             *cmakeArgs,
-            cwd=self.build_dir,
+            cwd=build_dir,
             debug=self.debug,
             live=self.print_outputs,
+            env=env,
         )
         return out, artifacts
 
-    def compile(self, target, src=None, model=None, data_file=None):
+    def get_run_independent_args(self, cmake_args, hash_data=False):
+        """Drop the run-specific paths from the cmake arguments."""
+        args = []
+        for arg in cmake_args[0]:
+            if arg.startswith("-DSRC_DIR="):
+                continue
+            if arg.startswith("-DDATA_SRC=") and len(arg) > len("-DDATA_SRC="):
+                if not hash_data:
+                    continue
+                arg = "-DDATA_SRC=" + hash_file(arg.split("=", 1)[1])
+            args.append(arg)
+        return args
+
+    def get_build_inputs(self, args):
+        """Hashes of the MLIF sources, the support directories and the toolchain used by the build.
+
+        Toolchains are identified by the sizes and modification times of their executables instead of the content.
+        """
+        ret = {"mlif": hash_tree(self.mlif_dir, ignore_dirs=[self.mlif_dir / ".git"])}
+        has_toolchain = False
+        for arg in args:
+            if not arg.startswith("-D") or "=" not in arg:
+                continue
+            key, value = arg[2:].split("=", 1)
+            key = key.split(":")[0]
+            if not value or not Path(value).is_dir():
+                continue
+            if key.endswith("_PREFIX") or key == "LLVM_DIR":
+                ret[key] = get_tree_signature(Path(value) / "bin")
+                has_toolchain = True
+            elif key.endswith("_DIR"):
+                ret[key] = hash_tree(value, ignore_dirs=[Path(value) / ".git"])
+        if not has_toolchain:  # Compiler of the host
+            compiler = shutil.which("clang" if self.toolchain == "llvm" else "gcc")
+            ret["compiler"] = get_tree_signature(compiler) if compiler else None
+        return ret
+
+    def get_fingerprint(self, src, cmake_args):
+        """Hash of all inputs of the MLIF build which is used as key for the ELF cache."""
+        ignore_dirs = [self.build_dir.resolve()]
+        src_hash = hash_file(src, ignore_dirs=ignore_dirs, ignore=self.FINGERPRINT_IGNORE)
+        args = self.get_run_independent_args(cmake_args, hash_data=True)
+        inputs = self.get_build_inputs(args)
+        return ElfCache.compute_key(str(self.mlif_dir), self.goal, self.debug, args, src_hash, inputs)
+
+    def get_shared_build_dir(self, cmake_args):
+        """Build directory which is shared by all runs using the same toolchain, target and features."""
+        if not self.shared_build or self.cache_dir is None:
+            return None
+        args = self.get_run_independent_args(cmake_args)
+        key = ElfCache.compute_key(str(self.mlif_dir), self.goal, self.debug, args)
+        return self.cache_dir / "builds" / key[:16]
+
+    def get_build_env(self, *build_dirs):
+        """Environment used for configuring and building in the given directories."""
+        env = os.environ.copy()
+        paths = [self.mlif_dir.resolve(), self.build_dir.resolve()] + [path.resolve() for path in build_dirs]
+        env.update(self.get_ccache_vars(self.build_dir, base_dir=os.path.commonpath(paths)))
+        return env
+
+    def _compile(self, target, src=None, model=None, cmake_args=None, build_dir=None, env=None):
         out = ""
+        artifacts = cmake_args[1] if cmake_args is not None else []
+        build_dir = build_dir if build_dir is not None else self.build_dir
+        if env is None:
+            env = self.get_build_env(build_dir)
         if src:
-            configure_out, artifacts = self.configure(target, src, model)
+            configure_out, artifacts = self.configure(
+                target, src, model, cmake_args=cmake_args, build_dir=build_dir, env=env
+            )
             out += configure_out
         out += utils.make(
             self.goal,
-            cwd=self.build_dir,
+            cwd=build_dir,
             threads=self.num_threads,
             live=self.print_outputs,
+            env=env,
         )
         return out, artifacts
 
+    def get_run_paths(self, src, cmake_args):
+        """Paths of the inputs which differ between runs sharing a build directory."""
+        paths = [Path(src).resolve()]
+        for arg in cmake_args[0]:
+            if arg.startswith("-DDATA_SRC=") and len(arg) > len("-DDATA_SRC="):
+                paths.append(Path(arg.split("=", 1)[1]).resolve())
+        return paths
+
+    def compile(self, target, src=None, model=None, data_file=None, cmake_args=None):
+        if src and cmake_args is None:
+            cmake_args = self.get_cmake_args(src)
+        shared_build_dir = self.get_shared_build_dir(cmake_args) if cmake_args is not None else None
+        if shared_build_dir is None or not src:
+            return self._compile(target, src=src, model=model, cmake_args=cmake_args)
+        # The framework and kernel libraries are only rebuilt if their configuration changes. Concurrent runs only
+        # have to wait for each other while these are built. The model specific targets are built afterwards in the
+        # build directory of the run, linking against copies of the prebuilt libraries.
+        shared_build_dir.mkdir(parents=True, exist_ok=True)
+        env = self.get_build_env(shared_build_dir)
+        with FileLock(shared_build_dir.parent / f"{shared_build_dir.name}.lock"):
+            logger.debug("Using shared build directory: %s", shared_build_dir)
+            query_cmake_codemodel(shared_build_dir)
+            out, artifacts = self.configure(
+                target, src, model, cmake_args=cmake_args, build_dir=shared_build_dir, env=env
+            )
+            targets = split_cmake_targets(shared_build_dir, self.goal, self.get_run_paths(src, cmake_args))
+            if targets is None:
+                logger.debug("Unable to determine the run specific targets of %s", shared_build_dir)
+                out += utils.make(
+                    self.goal, cwd=shared_build_dir, threads=self.num_threads, live=self.print_outputs, env=env
+                )
+                (self.build_dir / "bin").mkdir(exist_ok=True)
+                utils.copy(shared_build_dir / "bin" / self.goal, self.build_dir / "bin" / self.goal)
+                return out, artifacts
+            shared_targets, run_targets = targets
+            if len(shared_targets) > 0:
+                out += utils.make(
+                    *shared_targets.keys(),
+                    cwd=shared_build_dir,
+                    threads=self.num_threads,
+                    live=self.print_outputs,
+                    env=env,
+                )
+            for paths in shared_targets.values():
+                for path in paths:
+                    (self.build_dir / path).parent.mkdir(parents=True, exist_ok=True)
+                    utils.copy(shared_build_dir / path, self.build_dir / path)
+        configure_out, _ = self.configure(target, src, model, cmake_args=cmake_args, env=env)
+        out += configure_out
+        for name in run_targets:
+            # The fast variant of a target does not rebuild its dependencies
+            out += utils.make(
+                f"{name}/fast", cwd=self.build_dir, threads=self.num_threads, live=self.print_outputs, env=env
+            )
+        return out, artifacts
+
     def generate(self, src, target, model=None) -> Tuple[dict, dict]:
-        out, artifacts = self.compile(target, src=src, model=model)
-        elf_file = self.build_dir / "bin" / "generic_mlif"
-        # TODO: just use path instead of raw data?
-        with open(elf_file, "rb") as handle:
-            data = handle.read()
-            artifact = Artifact("generic_mlif", raw=data, fmt=ArtifactFormat.RAW)
-            artifacts.insert(0, artifact)  # First artifact should be the ELF
-        metrics = self.get_metrics(elf_file)
+        cache = self.elf_cache
+        cmake_args = self.get_cmake_args(src)
+        if cache is not None:
+            fingerprint = self.get_fingerprint(src, cmake_args)
+            entry = cache.lookup(fingerprint)
+        else:
+            entry = None
+        if entry is not None:
+            logger.debug("Using cached ELF file (fingerprint: %s)", fingerprint)
+            artifacts = cmake_args[1]
+            data = entry["elf"]
+            metrics = entry["metrics"]
+            out = entry["out"]
+        else:
+            out, artifacts = self.compile(target, src=src, model=model, cmake_args=cmake_args)
+            elf_file = self.build_dir / "bin" / "generic_mlif"
+            # TODO: just use path instead of raw data?
+            with open(elf_file, "rb") as handle:
+                data = handle.read()
+            metrics = self.get_metrics(elf_file)
+            if cache is not None:
+                cache.store(fingerprint, {"elf": data, "metrics": metrics, "out": out})
+        artifact = Artifact("generic_mlif", raw=data, fmt=ArtifactFormat.RAW)
+        artifacts.insert(0, artifact)  # First artifact should be the ELF
+        if cache is not None:
+            metrics.add("Compile Cache Hits", int(entry is not None), optional=True)
+            metrics.add("Compile Cache Misses", int(entry is None), optional=True)
         stdout_artifact = Artifact(
             "mlif_out.log", content=out, fmt=ArtifactFormat.TEXT
         )  # TODO: rename to tvmaot_out.log?
         artifacts.append(stdout_artifact)
         return {"default": artifacts}, {"default": metrics}
+
+
+def query_cmake_codemodel(build_dir):
+    """Request the codemodel of the CMake file API, which is written during the next configuration."""
+    query_dir = Path(build_dir) / ".cmake" / "api" / "v1" / "query"
+    query_dir.mkdir(parents=True, exist_ok=True)
+    (query_dir / "codemodel-v2").touch()
+
+
+def _load_cmake_targets(build_dir):
+    reply_dir = Path(build_dir) / ".cmake" / "api" / "v1" / "reply"
+    indices = sorted(reply_dir.glob("index-*.json"))
+    if len(indices) == 0:
+        return None, None
+    with open(indices[-1], "r") as handle:
+        index = json.load(handle)
+    codemodel_file = index.get("reply", {}).get("codemodel-v2", {}).get("jsonFile")
+    if codemodel_file is None:
+        return None, None
+    with open(reply_dir / codemodel_file, "r") as handle:
+        codemodel = json.load(handle)
+    targets = {}
+    for info in codemodel["configurations"][0]["targets"]:
+        with open(reply_dir / info["jsonFile"], "r") as handle:
+            targets[info["id"]] = json.load(handle)
+    return Path(codemodel["paths"]["source"]), targets
+
+
+def split_cmake_targets(build_dir, goal, run_paths):
+    """Split the targets required for the goal of a configured build directory using the CMake file API.
+
+    Returns a dict of the library targets which do not depend on the given run specific paths (name -> artifacts
+    relative to the build directory) and the list of the remaining targets in build order. Returns None if this is
+    not possible.
+    """
+    source_dir, targets = _load_cmake_targets(build_dir)
+    if targets is None:
+        return None
+
+    def _is_run_path(path):
+        path = Path(path)
+        if not path.is_absolute():
+            path = source_dir / path
+        path = path.resolve()
+        return any(path == run_path or run_path in path.parents for run_path in run_paths)
+
+    def _is_run_specific(target):
+        if target["name"] == goal:
+            return True
+        if any(_is_run_path(source["path"]) for source in target.get("sources", [])):
+            return True
+        for group in target.get("compileGroups", []):
+            if any(_is_run_path(include["path"]) for include in group.get("includes", [])):
+                return True
+        return False
+
+    goal_ids = [target_id for target_id, target in targets.items() if target["name"] == goal]
+    if len(goal_ids) != 1:
+        return None
+    shared, run, visited = {}, [], set()
+
+    def _visit(target_id):
+        if target_id in visited:
+            return True
+        visited.add(target_id)
+        target = targets[target_id]
+        for dep in target.get("dependencies", []):
+            if not _visit(dep["id"]):
+                return False
+        if _is_run_specific(target):
+            if target["type"] not in ["EXECUTABLE", "STATIC_LIBRARY", "OBJECT_LIBRARY"]:
+                return False
+            run.append(target["name"])  # Dependencies first
+        else:
+            paths = [artifact["path"] for artifact in target.get("artifacts", [])]
+            if target["type"] not in ["STATIC_LIBRARY", "OBJECT_LIBRARY"] or any(map(os.path.isabs, paths)):
+                return False
+            shared[target["name"]] = paths
+        return True
+
+    if not _visit(goal_ids[0]):
+        return None
+    return shared, run
@@ -17,6 +17,7 @@
 # limitations under the License.
 #
 import time
+import shutil
 import tempfile
 import multiprocessing
 
@@ -32,6 +33,7 @@ from mlonmcu.feature.type import FeatureType
 from mlonmcu.target.metrics import Metrics
 from mlonmcu.target.elf import get_results as get_static_mem_usage
 from mlonmcu.logging import get_logger
+from mlonmcu.trace import span
 from mlonmcu.config import str2bool
 from mlonmcu.artifact import Artifact, ArtifactFormat
 
@@ -57,6 +59,7 @@ class Platform:
         self.features = self.process_features(features)
         self.config = filter_config(self.config, self.name, self.DEFAULTS, self.OPTIONAL, self.REQUIRED)
         self.artifacts = []
+        self.cache_dir = None  # Directory for data shared across sessions (provided by the run)
 
     def init_directory(self, path=None, context=None):
         raise NotImplementedError
@@ -191,14 +194,84 @@ class CompilePlatform(Platform):
         "debug": False,
         "build_dir": None,
         "num_threads": multiprocessing.cpu_count(),
+        "ccache": False,
+        "ccache_exe": "ccache",
+        "ccache_max_size": "5G",
     }
 
     REQUIRED = []
 
+    def __init__(self, name, features=None, config=None):
+        super().__init__(name, features=features, config=config)
+        self.ccache_stats_file = None
+
     @property
     def supports_compile(self):
         return True
 
+    @property
+    def ccache(self):
+        value = self.config["ccache"]
+        return str2bool(value) if not isinstance(value, (bool, int)) else value
+
+    @property
+    def ccache_exe(self):
+        return str(self.config["ccache_exe"])
+
+    @property
+    def ccache_max_size(self):
+        return str(self.config["ccache_max_size"])
+
+    @property
+    def ccache_dir(self):
+        # Use the default cache of the user if the platform is used outside of a session
+        return self.cache_dir / "ccache" if self.cache_dir is not None else None
+
+    @property
+    def ccache_available(self):
+        """Check whether the compiler cache is enabled and installed."""
+        return self.ccache and shutil.which(self.ccache_exe) is not None
+
+    def get_ccache_vars(self, directory, base_dir=None):
+        """Return the environment variables which enable the compiler cache for CMake based builds.
+
+        The result of every compiler invocation is logged to a file in the given directory.
+        """
+        if not self.ccache:
+            return {}
+        if shutil.which(self.ccache_exe) is None:
+            logger.warning("Compiler cache '%s' not found. Continuing without it.", self.ccache_exe)
+            return {}
+        ret = {f"CMAKE_{lang}_COMPILER_LAUNCHER": self.ccache_exe for lang in ["C", "CXX"]}
+        if self.ccache_dir is not None:
+            ret["CCACHE_DIR"] = str(self.ccache_dir)
+        ret["CCACHE_MAXSIZE"] = self.ccache_max_size
+        ret["CCACHE_NOHASHDIR"] = "1"
+        if base_dir is not None:
+            ret["CCACHE_BASEDIR"] = str(base_dir)  # Allows cache hits for sources in different run directories
+        self.ccache_stats_file = Path(directory) / "ccache_stats.log"
+        if self.ccache_stats_file.is_file():
+            self.ccache_stats_file.unlink()
+        ret["CCACHE_STATSLOG"] = str(self.ccache_stats_file)
+        return ret
+
+    def get_ccache_metrics(self):
+        """Return the number of cache hits and misses of the compiler cache for the latest build."""
+        if self.ccache_stats_file is None or not self.ccache_stats_file.is_file():
+            return None
+        hits, misses = 0, 0
+        with open(self.ccache_stats_file, "r", encoding="utf-8", errors="replace") as handle:
+            for line in handle:
+                line = line.strip()
+                if len(line) == 0 or line.startswith("#"):
+                    continue
+                # Examples: direct_cache_hit, preprocessed_cache_hit, cache_miss (older: cache hit (direct))
+                if "hit" in line:
+                    hits += 1
+                elif "miss" in line:
+                    misses += 1
+        return hits, misses
+
     @property
     def debug(self):
         value = self.config["debug"]
@@ -209,7 +282,8 @@ class CompilePlatform(Platform):
         return int(self.config["num_threads"])
 
     def get_metrics(self, elf):
-        static_mem = get_static_mem_usage(elf)
+        with span("get_static_mem_usage", cat="metrics", platform=self.name):
+            static_mem = get_static_mem_usage(elf)
         rom_ro, rom_code, rom_misc, ram_data, ram_zdata = (
             static_mem["rom_rodata"],
             static_mem["rom_code"],
@@ -235,15 +309,22 @@ class CompilePlatform(Platform):
 
     def generate_artifacts(self, src, target, model=None) -> List[Artifact]:
         start_time = time.time()
+        self.ccache_stats_file = None
         artifacts, metrics = self.generate(src, target, model=None)
         # TODO: do something with out?
         end_time = time.time()
         diff = end_time - start_time
         if len(metrics) == 0:
             metrics = {"default": Metrics()}
+        ccache_metrics = self.get_ccache_metrics()
         for name, metrics_ in metrics.items():
             if name == "default":
                 metrics_.add("Compile Stage Time [s]", diff, True)
+                if ccache_metrics is not None:
+                    hits, misses = ccache_metrics
+                    metrics_.add("Ccache Hits", hits, True)
+                    metrics_.add("Ccache Misses", misses, True)
+                    metrics_.add("Ccache Hit Rate", hits / (hits + misses) if (hits + misses) > 0 else None, True)
             content = metrics_.to_csv(include_optional=True)
             artifact = Artifact("compile_metrics.csv", content=content, fmt=ArtifactFormat.TEXT, flags=["metrics"])
             if name not in artifacts:
@@ -242,24 +242,23 @@ class TvmPlatform(BuildPlatform, TargetPlatform, TunePlatform):
             *get_rpc_tvmc_args(self.use_rpc, self.rpc_key, self.rpc_hostname, self.rpc_port),
         ]
 
-    def invoke_tvmc(self, command, *args):
+    def invoke_tvmc(self, command, *args, timeout=None):
         env = prepare_python_environment(self.tvm_pythonpath, self.tvm_build_dir, self.tvm_configs_dir)
         if self.tvmc_custom_script is None:
             pre = ["-m", "tvm.driver.tvmc"]
         else:
             pre = [self.tvmc_custom_script]
-        return utils.python(*pre, command, *args, live=self.print_outputs, print_output=False, env=env)
+        return utils.python(*pre, command, *args, live=self.print_outputs, print_output=False, env=env, timeout=timeout)
 
-    def invoke_tvmc_run(self, path, device):
+    def invoke_tvmc_run(self, path, device, timeout=None):
         args = self.get_tvmc_run_args(path, device)
-        return self.invoke_tvmc("run", *args)
+        return self.invoke_tvmc("run", *args, timeout=timeout)
 
     def run(self, elf, target, timeout=120):
-        # TODO: implement timeout
         # Here, elf is actually a directory
         # TODO: replace workaround with possibility to pass TAR directly
         tar_path = elf
-        output = self.invoke_tvmc_run(str(tar_path), target.device)
+        output = self.invoke_tvmc_run(str(tar_path), target.device, timeout=timeout)
 
         return output
 
@@ -61,10 +61,8 @@ def create_tvm_platform_target(name, platform, base=Target):
 
             assert self.platform is not None, "TVM targets need a platform to execute programs"
 
-            if self.timeout_sec > 0:
-                raise NotImplementedError
-
-            ret = self.platform.run(program, self)
+            timeout = self.timeout_sec if self.timeout_sec > 0 else None
+            ret = self.platform.run(program, self, timeout=timeout)
             return ret
 
         def parse_stdout(self, out):
@@ -29,6 +29,7 @@ from typing import Tuple
 
 
 from mlonmcu.setup import utils
+from mlonmcu.setup.jobserver import job_slots
 from mlonmcu.artifact import Artifact, ArtifactFormat
 from mlonmcu.logging import get_logger
 from mlonmcu.target import get_targets
@@ -107,7 +108,7 @@ class ZephyrPlatform(CompilePlatform, TargetPlatform):
         return self.config["optimize"]
 
     def invoke_west(self, *args, **kwargs):
-        env = os.environ.copy()
+        env = kwargs.pop("env", None) or os.environ.copy()
         env["ZEPHYR_BASE"] = str(self.zephyr_install_dir / "zephyr")
         env["ZEPHYR_SDK_INSTALL_DIR"] = str(self.zephyr_sdk_dir)
         cmd = ". " + str(self.zephyr_venv_dir / "bin" / "activate") + " && west " + " ".join([str(arg) for arg in args])
@@ -303,16 +304,19 @@ project(ProjectName)
         # TODO: support self.num_threads
         # self.build_dir.mkdir()
         zephyr_target = target.name.split("_", 1)[-1]
-        westArgs = [
-            "build",
-            "-d",
-            self.build_dir,
-            "-b",
-            zephyr_target,
-            self.project_dir,
-            f"-o=-j{self.num_threads}",
-        ]
-        out += self.invoke_west(*westArgs, live=self.print_outputs)
+        env = os.environ.copy()
+        env.update(self.get_ccache_vars(self.project_dir, base_dir=self.project_dir.parent))
+        with job_slots(self.num_threads, env=env) as (num_jobs, kwargs):
+            westArgs = [
+                "build",
+                "-d",
+                self.build_dir,
+                "-b",
+                zephyr_target,
+                self.project_dir,
+                f"-o=-j{num_jobs}",
+            ]
+            out += self.invoke_west(*westArgs, live=self.print_outputs, **kwargs)
         return out
 
     def generate(self, src, target, model=None) -> Tuple[dict, dict]:
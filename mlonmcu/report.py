@@ -17,6 +17,10 @@
 # limitations under the License.
 #
 """Definitions of the Report class used by MLonMCU sessions and runs."""
+import csv
+import importlib.util
+import json
+import math
 from pathlib import Path
 import pandas as pd
 
@@ -25,7 +29,23 @@ pd.set_option("display.max_columns", None)
 pd.set_option("display.max_rows", None)
 pd.set_option("display.width", 0)
 
-SUPPORTED_FMTS = ["csv", "xlsx"]
+SUPPORTED_FMTS = ["csv", "xlsx", "parquet"]
+
+
+def check_report_fmt(fmt):
+    """Make sure that the optional dependencies of a report format are installed.
+
+    Arguments
+    ---------
+    fmt : str
+        The report format.
+
+    """
+    if fmt == "parquet":
+        if not any(importlib.util.find_spec(engine) for engine in ["pyarrow", "fastparquet"]):
+            raise RuntimeError(
+                "Parquet reports require pyarrow or fastparquet (install via: pip install mlonmcu[parquet])"
+            )
 
 
 class Report:
@@ -60,6 +80,9 @@ class Report:
             self.df.to_csv(path, index=False)
         elif ext in ["xlsx", "xls"]:
             self.df.to_excel(path, index=False)
+        elif ext == "parquet":
+            # Requires pyarrow or fastparquet
+            self.df.to_parquet(path, index=False)
         else:
             raise RuntimeError()
 
@@ -93,7 +116,113 @@ class Report:
         """Helper function to append a line to an existing report."""
         if not isinstance(reports, list):
             reports = [reports]
-        for report in reports:
-            self.pre_df = pd.concat([self.pre_df, report.pre_df], axis=0).reset_index(drop=True)
-            self.main_df = pd.concat([self.main_df, report.main_df], axis=0).reset_index(drop=True)
-            self.post_df = pd.concat([self.post_df, report.post_df], axis=0).reset_index(drop=True)
+        if len(reports) == 0:
+            return
+        # A single concatenation per dataframe instead of one per report
+        self.pre_df = pd.concat([self.pre_df] + [report.pre_df for report in reports], axis=0).reset_index(drop=True)
+        self.main_df = pd.concat([self.main_df] + [report.main_df for report in reports], axis=0).reset_index(drop=True)
+        self.post_df = pd.concat([self.post_df] + [report.post_df for report in reports], axis=0).reset_index(drop=True)
+
+
+def _to_json(value):
+    if hasattr(value, "item"):  # numpy scalars
+        return value.item()
+    return str(value)
+
+
+def _get_index(value):
+    return value if isinstance(value, int) else -1
+
+
+def _get_records(df, size):
+    records = df.to_dict("records") if len(df.columns) > 0 else [{}] * size
+    # Drop missing values which are only introduced by other rows
+    return [
+        {key: value for key, value in record.items() if not (isinstance(value, float) and math.isnan(value))}
+        for record in records
+    ]
+
+
+class ReportWriter:
+    """Writes the rows of a session report to the disk while the runs are still being processed.
+
+    Every row is appended to a JSON-lines file, which keeps the split between pre, main and post columns. The same
+    rows are appended to a CSV file which can be inspected (e.g. via tail) during long sessions. As the set of
+    columns is not known in advance, the header of the CSV file is fixed by the first row and columns introduced by
+    later rows are only added when the rows are consolidated (see read).
+    """
+
+    def __init__(self, directory, name="report"):
+        self.rows_file = Path(directory) / f"{name}.jsonl"
+        self.csv_file = Path(directory) / f"{name}.csv"
+        self.columns = []
+        self.keys = set()
+        for path in [self.rows_file, self.csv_file]:
+            if path.is_file():
+                path.unlink()
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def _write_csv(self, rows, mode="a"):
+        with open(self.csv_file, mode, newline="", encoding="utf-8") as handle:
+            writer = csv.DictWriter(handle, fieldnames=self.columns, extrasaction="ignore")
+            if mode == "w":
+                writer.writeheader()
+            for row in rows:
+                writer.writerow({**row["pre"], **row["main"], **row["post"]})
+
+    def append(self, report, key=None):
+        """Append the rows of a report (usually of a single run)."""
+        size = len(report.pre_df)
+        rows = [
+            {"pre": pre, "main": main, "post": post}
+            for pre, main, post in zip(
+                _get_records(report.pre_df, size),
+                _get_records(report.main_df, size),
+                _get_records(report.post_df, size),
+            )
+        ]
+        with open(self.rows_file, "a", encoding="utf-8") as handle:
+            for row in rows:
+                handle.write(json.dumps(row, default=_to_json) + "\n")
+        if len(self.columns) == 0 and len(rows) > 0:
+            self.columns = self._get_columns(rows)
+            self._write_csv(rows, mode="w")
+        else:
+            self._write_csv(rows)
+        if key is not None:
+            self.keys.add(key)
+
+    @staticmethod
+    def _get_columns(rows):
+        columns = {}  # Ordered set
+        for row in rows:
+            for part in row.values():
+                columns.update(dict.fromkeys(part))
+        return list(columns)
+
+    def read_rows(self):
+        """Return all rows written so far."""
+        if not self.rows_file.is_file():
+            return []
+        with open(self.rows_file, "r", encoding="utf-8") as handle:
+            return [json.loads(line) for line in handle if len(line.strip()) > 0]
+
+    def read(self, sort_by=("Session", "Run")):
+        """Consolidate the written rows into a single report ordered by the given columns.
+
+        The CSV file is rewritten once if the header does not cover the columns of all rows.
+        """
+        rows = self.read_rows()
+        rows.sort(key=lambda row: tuple(_get_index(row["pre"].get(column)) for column in sort_by))
+        columns = self._get_columns(rows)
+        if set(columns) != set(self.columns):
+            self.columns = self.columns + [column for column in columns if column not in self.columns]
+            self._write_csv(rows, mode="w")
+        report = Report()
+        if len(rows) > 0:
+            report.set(
+                pre=[row["pre"] for row in rows], main=[row["main"] for row in rows], post=[row["post"] for row in rows]
+            )
+        return report
@@ -0,0 +1,215 @@
+#
+# Copyright (c) 2022 TUM Department of Electrical and Computer Engineering.
+#
+# This file is part of MLonMCU.
+# See https://github.com/tum-ei-eda/mlonmcu.git for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Content-addressed on-disk cache for the artifacts of run stages."""
+import os
+import json
+import fnmatch
+import pickle
+import hashlib
+import tempfile
+from pathlib import Path
+
+from filelock import FileLock
+
+from mlonmcu.logging import get_logger
+from mlonmcu.utils import parse_size
+
+logger = get_logger()
+
+
+def hash_file(path, hasher=None, ignore=None, ignore_dirs=None):
+    """Compute the SHA256 digest of a file (or all files in a directory).
+
+    Parameters
+    ----------
+    path : Path
+        File or directory.
+    ignore : list
+        Glob patterns for filenames which are skipped in directories.
+    ignore_dirs : list
+        Subdirectories which are skipped.
+    """
+    path = Path(path)
+    hasher = hasher if hasher is not None else hashlib.sha256()
+    if path.is_dir():
+        ignore = ignore if ignore is not None else []
+        ignore_dirs = [Path(directory).resolve() for directory in ignore_dirs] if ignore_dirs else []
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(name for name in dirs if (Path(root) / name).resolve() not in ignore_dirs)
+            for name in sorted(files):
+                if any(fnmatch.fnmatch(name, pattern) for pattern in ignore):
+                    continue
+                child = Path(root) / name
+                hasher.update(str(child.relative_to(path)).encode())
+                hash_file(child, hasher=hasher)
+    else:
+        with open(path, "rb") as handle:
+            for chunk in iter(lambda: handle.read(1024 * 1024), b""):
+                hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def get_tree_signature(path, ignore_dirs=None):
+    """Compute a cheap signature of a file (or all files in a directory) based on the sizes and modification times."""
+    path = Path(path)
+    entries = []
+    if path.is_dir():
+        ignore_dirs = [Path(directory).resolve() for directory in ignore_dirs] if ignore_dirs else []
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(name for name in dirs if (Path(root) / name).resolve() not in ignore_dirs)
+            for name in sorted(files):
+                try:
+                    stat = (Path(root) / name).stat()
+                except FileNotFoundError:  # Broken symlink
+                    continue
+                entries.append((os.path.relpath(os.path.join(root, name), path), stat.st_size, stat.st_mtime_ns))
+    elif path.exists():
+        stat = path.stat()
+        entries.append((str(path.resolve()), stat.st_size, stat.st_mtime_ns))
+    return hashlib.sha256(json.dumps(entries).encode()).hexdigest()
+
+
+_tree_hashes = {}  # resolved path -> (signature, digest)
+
+
+def hash_tree(path, ignore_dirs=None):
+    """Compute the SHA256 digest of all files in a directory (None if it does not exist).
+
+    The digest is only recomputed if the signature of the directory has changed (see get_tree_signature).
+    """
+    path = Path(path)
+    if not path.exists():
+        return None
+    key = str(path.resolve())
+    signature = get_tree_signature(path, ignore_dirs=ignore_dirs)
+    cached = _tree_hashes.get(key)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    digest = hash_file(path, ignore_dirs=ignore_dirs)
+    _tree_hashes[key] = (signature, digest)
+    return digest
+
+
+def hash_artifact(artifact):
+    """Compute the SHA256 digest of the data of an artifact."""
+    if artifact.digest is not None:
+        return artifact.digest
+    if artifact.path is not None:
+        return hash_file(artifact.path)
+    raise RuntimeError(f"Unable to hash artifact: {artifact.name}")
+
+
+class StageCache:
+    """Cache which stores the artifacts of a stage on disk using a hash of the stage inputs as key.
+
+    Entries are shared across runs and sessions. If the total size of all entries exceeds max_size, the least
+    recently used entries are evicted.
+    """
+
+    SUFFIX = ".pkl"
+
+    def __init__(self, directory, max_size=None):
+        self.directory = Path(directory)
+        self.max_size = parse_size(max_size) if max_size is not None else None
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def __repr__(self):
+        return f"StageCache({self.directory})"
+
+    @staticmethod
+    def compute_key(*parts):
+        """Compute a key for the given (JSON serializable) inputs. Objects which are not serializable are converted
+        to strings."""
+        data = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    @property
+    def lock(self):
+        """Get lock which protects the cache directory against concurrent evictions."""
+        return FileLock(self.directory / ".lock")
+
+    def get_path(self, key):
+        """Return the file for a given key."""
+        return self.directory / key[:2] / f"{key}{self.SUFFIX}"
+
+    def lookup(self, key):
+        """Return the cached value for the given key or None if there is no such entry."""
+        path = self.get_path(key)
+        try:
+            with open(path, "rb") as handle:
+                value = pickle.load(handle)
+        except FileNotFoundError:
+            return None
+        except Exception as e:  # Corrupted entries are handled like misses
+            logger.warning("Dropping invalid stage cache entry %s: %s", key, e)
+            self.remove(key)
+            return None
+        try:
+            os.utime(path)  # Used for LRU eviction
+        except FileNotFoundError:
+            pass
+        return value
+
+    def store(self, key, value):
+        """Add a new entry to the cache. Existing entries are replaced."""
+        path = self.get_path(key)
+        path.parent.mkdir(exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as handle:
+            pickle.dump(value, handle)
+        os.replace(handle.name, path)  # Atomic, hence no lock is required for concurrent readers
+        self.evict()
+
+    def remove(self, key):
+        """Remove the entry for the given key."""
+        path = self.get_path(key)
+        if path.is_file():
+            path.unlink()
+
+    def get_entries(self):
+        """Return list of (mtime, size, path) tuples for all entries."""
+        entries = []
+        for path in self.directory.glob(f"*/*{self.SUFFIX}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    @property
+    def size(self):
+        """Get total size of the cache in bytes."""
+        return sum(size for _, size, _ in self.get_entries())
+
+    def evict(self):
+        """Remove the least recently used entries until the size limit is satisfied."""
+        if self.max_size is None:
+            return
+        with self.lock:
+            entries = sorted(self.get_entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_size:
+                    break
+                logger.debug("Evicting stage cache entry: %s", path.name)
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+                total -= size
@@ -0,0 +1,341 @@
+#
+# Copyright (c) 2022 TUM Department of Electrical and Computer Engineering.
+#
+# This file is part of MLonMCU.
+# See https://github.com/tum-ei-eda/mlonmcu.git for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Shared-directory job queue used to distribute the processing of runs across multiple machines.
+
+The coordinator (a session using the ``queue`` executor) puts pickled jobs into the ``pending`` directory.
+Workers (see ``mlonmcu worker``) claim a job by atomically moving it into the ``claimed`` directory and
+write the result into the ``done`` directory. Claimed jobs are touched periodically by the worker, hence
+jobs of workers which died or lost the connection to the shared filesystem are put back into the queue.
+A running job is cancelled by creating a marker in the ``cancelled`` directory, which makes the worker kill
+its subprocesses.
+"""
+import os
+import time
+import uuid
+import pickle
+import signal
+import socket
+import tempfile
+import threading
+import itertools
+import multiprocessing
+import concurrent.futures
+from pathlib import Path
+
+from mlonmcu.logging import get_logger
+from mlonmcu.setup.utils import cancel_processes, reset_cancel
+
+logger = get_logger()
+
+
+class DirectoryQueue:
+    """Job queue which is stored in a (shared) directory."""
+
+    SUFFIX = ".pkl"
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.pending_dir = self.directory / "pending"
+        self.claimed_dir = self.directory / "claimed"
+        self.done_dir = self.directory / "done"
+        self.cancelled_dir = self.directory / "cancelled"
+        for path in [self.pending_dir, self.claimed_dir, self.done_dir, self.cancelled_dir]:
+            path.mkdir(parents=True, exist_ok=True)
+        self._counter = itertools.count()
+
+    def __repr__(self):
+        return f"DirectoryQueue({self.directory})"
+
+    def _write(self, value, dest):
+        with tempfile.NamedTemporaryFile(dir=dest.parent, suffix=".tmp", delete=False) as handle:
+            pickle.dump(value, handle)
+        os.replace(handle.name, dest)  # Atomic, hence readers never see partial files
+
+    def _list(self, directory):
+        return sorted(name[: -len(self.SUFFIX)] for name in os.listdir(directory) if name.endswith(self.SUFFIX))
+
+    def put(self, payload):
+        """Add a new job to the queue and return its id."""
+        # The prefix keeps the jobs in the order of submission
+        job_id = f"{time.time_ns()}_{next(self._counter):06d}_{uuid.uuid4().hex[:8]}"
+        self._write(payload, self.pending_dir / f"{job_id}{self.SUFFIX}")
+        return job_id
+
+    def claim(self):
+        """Take the oldest pending job. Returns a (job_id, payload) tuple or None if there is nothing to do."""
+        for job_id in self._list(self.pending_dir):
+            src = self.pending_dir / f"{job_id}{self.SUFFIX}"
+            dest = self.claimed_dir / f"{job_id}{self.SUFFIX}"
+            try:
+                os.rename(src, dest)  # Only one of the competing workers will succeed
+            except FileNotFoundError:
+                continue
+            os.utime(dest)
+            with open(dest, "rb") as handle:
+                try:
+                    payload = pickle.load(handle)
+                except Exception as e:
+                    self.complete(job_id, error=e)
+                    continue
+            return job_id, payload
+        return None
+
+    def heartbeat(self, job_id):
+        """Mark a claimed job as alive."""
+        try:
+            os.utime(self.claimed_dir / f"{job_id}{self.SUFFIX}")
+        except FileNotFoundError:
+            pass
+
+    def complete(self, job_id, result=None, error=None):
+        """Publish the result (or the exception) of a claimed job."""
+        dest = self.done_dir / f"{job_id}{self.SUFFIX}"
+        try:
+            self._write({"result": result, "error": error}, dest)
+        except Exception as e:  # Unpicklable exception or result
+            self._write({"result": None, "error": RuntimeError(str(error or e))}, dest)
+        claimed = self.claimed_dir / f"{job_id}{self.SUFFIX}"
+        if claimed.is_file():
+            claimed.unlink()
+        marker = self.cancelled_dir / job_id
+        if marker.is_file():
+            marker.unlink()
+
+    def collect(self, job_ids):
+        """Return the results of the given jobs which are already done as a dict (job_id -> (result, error))."""
+        ret = {}
+        done = set(self._list(self.done_dir))
+        for job_id in job_ids:
+            if job_id not in done:
+                continue
+            path = self.done_dir / f"{job_id}{self.SUFFIX}"
+            with open(path, "rb") as handle:
+                value = pickle.load(handle)
+            path.unlink()
+            ret[job_id] = (value["result"], value["error"])
+        return ret
+
+    def remove(self, job_id):
+        """Remove a job from the queue if it was not claimed yet. Returns True on success."""
+        try:
+            os.unlink(self.pending_dir / f"{job_id}{self.SUFFIX}")
+        except FileNotFoundError:
+            return False
+        return True
+
+    def cancel(self, job_id):
+        """Ask the worker of a claimed job to stop processing it."""
+        (self.cancelled_dir / job_id).touch()
+
+    def is_cancelled(self, job_id):
+        """Check whether the given job was cancelled."""
+        return (self.cancelled_dir / job_id).is_file()
+
+    def requeue_stale(self, timeout, job_ids=None):
+        """Put claimed jobs without a heartbeat for more than timeout seconds back into the queue."""
+        ret = []
+        now = time.time()
+        for job_id in self._list(self.claimed_dir):
+            if job_ids is not None and job_id not in job_ids:
+                continue
+            path = self.claimed_dir / f"{job_id}{self.SUFFIX}"
+            try:
+                if now - os.path.getmtime(path) < timeout:
+                    continue
+                os.rename(path, self.pending_dir / f"{job_id}{self.SUFFIX}")
+            except FileNotFoundError:  # Completed in the meantime
+                continue
+            ret.append(job_id)
+        return ret
+
+    @property
+    def num_pending(self):
+        """Get the number of jobs which are not claimed yet."""
+        return len(self._list(self.pending_dir))
+
+
+def _heartbeat(queue, job_id, interval, stop, poll_interval):
+    last = time.time()
+    while not stop.wait(poll_interval):
+        if queue.is_cancelled(job_id):
+            logger.warning("Job %s was cancelled", job_id)
+            cancel_processes()
+            return
+        if time.time() - last >= interval:
+            queue.heartbeat(job_id)
+            last = time.time()
+
+
+def _exit_on_sigterm(signum, frame):
+    # Raised in the main thread, hence the subprocesses of the current job are killed as well (see popen_group)
+    raise SystemExit(128 + signum)
+
+
+def process_jobs(queue, max_jobs=None, idle_timeout=None, heartbeat_interval=10, poll_interval=0.5):
+    """Worker loop which processes jobs of the given queue. Returns the number of processed jobs.
+
+    Parameters
+    ----------
+    queue : DirectoryQueue
+        The queue to pull the jobs from.
+    max_jobs : int
+        Stop after the given number of jobs (never if None).
+    idle_timeout : float
+        Stop if there were no jobs for the given number of seconds (never if None).
+    """
+    name = f"{socket.gethostname()}:{os.getpid()}"
+    count = 0
+    idle_since = time.time()
+    previous = None
+    if threading.current_thread() is threading.main_thread():
+        previous = signal.signal(signal.SIGTERM, _exit_on_sigterm)
+    try:
+        while max_jobs is None or count < max_jobs:
+            job = queue.claim()
+            if job is None:
+                if idle_timeout is not None and time.time() - idle_since > idle_timeout:
+                    break
+                time.sleep(poll_interval)
+                continue
+            job_id, payload = job
+            logger.debug("Worker %s processing job %s", name, job_id)
+            stop = threading.Event()
+            thread = threading.Thread(
+                target=_heartbeat, args=(queue, job_id, heartbeat_interval, stop, poll_interval), daemon=True
+            )
+            thread.start()
+            try:
+                func, args, kwargs = payload
+                result = func(*args, **kwargs)
+            except Exception as e:
+                logger.exception(e)
+                queue.complete(job_id, error=e)
+            else:
+                queue.complete(job_id, result=result)
+            finally:
+                stop.set()
+                thread.join()
+                reset_cancel()  # The cancellation only affects the current job
+            count += 1
+            idle_since = time.time()
+    finally:
+        if previous is not None:
+            signal.signal(signal.SIGTERM, previous)
+    return count
+
+
+class QueueExecutor(concurrent.futures.Executor):
+    """Executor which distributes the submitted jobs via a DirectoryQueue.
+
+    The submitted function and arguments have to be picklable and importable by the workers.
+
+    Parameters
+    ----------
+    queue : DirectoryQueue
+        The shared queue.
+    timeout : float
+        Seconds without a heartbeat after which the job of a worker is put back into the queue.
+    num_local_workers : int
+        Number of worker processes to start on the local machine additionally.
+    """
+
+    def __init__(self, queue, timeout=300, num_local_workers=0, poll_interval=0.5):
+        self.queue = queue
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._warned = False
+        self._started_at = time.time()
+        heartbeat_interval = max(timeout / 4, poll_interval)
+        self._local_workers = [
+            multiprocessing.Process(
+                target=process_jobs,
+                args=(queue,),
+                kwargs={"heartbeat_interval": heartbeat_interval, "poll_interval": poll_interval},
+                daemon=True,
+            )
+            for _ in range(num_local_workers)
+        ]
+        for worker in self._local_workers:
+            worker.start()
+        self._thread = threading.Thread(target=self._poll, daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        future = concurrent.futures.Future()
+        with self._lock:
+            job_id = self.queue.put((fn, args, kwargs))
+            self._futures[job_id] = future
+        return future
+
+    def _update(self):
+        with self._lock:
+            job_ids = list(self._futures.keys())
+        if len(job_ids) == 0:
+            return
+        for job_id, (result, error) in self.queue.collect(job_ids).items():
+            with self._lock:
+                future = self._futures.pop(job_id)
+            if not future.set_running_or_notify_cancel():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        for job_id in self.queue.requeue_stale(self.timeout, job_ids=job_ids):
+            logger.warning("Lost connection to the worker of job %s. Putting it back into the queue.", job_id)
+        if not self._warned and time.time() - self._started_at > self.timeout:
+            if self.queue.num_pending == len(job_ids):
+                logger.warning("No job was claimed so far. Did you start any workers via `mlonmcu worker`?")
+                self._warned = True
+
+    def _poll(self):
+        while not self._stop.is_set():
+            try:
+                self._update()
+            except Exception as e:  # Do not let the futures hang forever
+                logger.exception(e)
+            self._stop.wait(self.poll_interval)
+
+    def cancel_running(self):
+        """Cancel the jobs which were already claimed by a worker."""
+        with self._lock:
+            job_ids = list(self._futures.keys())
+        for job_id in job_ids:
+            if not self.queue.remove(job_id):  # Pending jobs are simply dropped
+                self.queue.cancel(job_id)
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        if cancel_futures:
+            with self._lock:
+                for job_id, future in list(self._futures.items()):
+                    if self.queue.remove(job_id):
+                        future.cancel()
+                        del self._futures[job_id]
+        if wait:
+            with self._lock:
+                futures = list(self._futures.values())
+            concurrent.futures.wait(futures)
+        self._stop.set()
+        self._thread.join()
+        for worker in self._local_workers:
+            worker.terminate()
+            worker.join()
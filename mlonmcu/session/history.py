@@ -0,0 +1,122 @@
+#
+# Copyright (c) 2022 TUM Department of Electrical and Computer Engineering.
+#
+# This file is part of MLonMCU.
+# See https://github.com/tum-ei-eda/mlonmcu.git for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""History of stage durations which is used to predict the cost of runs."""
+import os
+import json
+import tempfile
+from pathlib import Path
+
+from filelock import FileLock
+
+from mlonmcu.logging import get_logger
+
+from .run import RunStage
+
+logger = get_logger()
+
+
+class CostHistory:
+    """Stage durations of previous runs, keyed by model, backend, target and features.
+
+    Durations are tracked as an exponential moving average. Predictions fall back to coarser keys (same backend and
+    target, same target, any run) if a combination was not processed before.
+    """
+
+    DEFAULT_COST = 1.0
+
+    def __init__(self, path, alpha=0.5):
+        self.path = Path(path)
+        self.alpha = alpha
+        self.entries = {}
+        self.pending = []
+        self.load()
+
+    def __repr__(self):
+        return f"CostHistory({self.path})"
+
+    def _read(self):
+        if not self.path.is_file():
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as handle:
+                return json.load(handle)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring invalid cost history %s: %s", self.path, e)
+            return {}
+
+    def load(self):
+        """Read the history from the disk."""
+        self.entries = self._read()
+
+    @staticmethod
+    def get_keys(run, stage):
+        """Return the keys for a stage of a run, ordered from the most to the least specific one."""
+        model = run.model.name if run.model is not None else "-"
+        backend = run.backend.name if run.backend is not None else "-"
+        target = run.target.name if run.target is not None else "-"
+        features = ",".join(sorted(run.get_all_feature_names()))
+        stage = RunStage(stage).name
+        return [
+            f"{stage}|{model}|{backend}|{target}|{features}",
+            f"{stage}|*|{backend}|{target}|*",
+            f"{stage}|*|*|{target}|*",
+            f"{stage}|*|*|*|*",
+        ]
+
+    def predict_stage(self, run, stage):
+        """Return the expected duration of a single stage in seconds."""
+        for key in self.get_keys(run, stage):
+            if key in self.entries:
+                return self.entries[key]["mean"]
+        return self.DEFAULT_COST
+
+    def predict(self, run, stages):
+        """Return the expected duration of the given stages of a run in seconds."""
+        return sum(self.predict_stage(run, stage) for stage in stages)
+
+    def _apply(self, entries, keys, duration):
+        for key in keys:
+            if key in entries:
+                entry = entries[key]
+                entry["mean"] = self.alpha * duration + (1 - self.alpha) * entry["mean"]
+                entry["count"] += 1
+            else:
+                entries[key] = {"mean": duration, "count": 1}
+
+    def update(self, run):
+        """Add the measured stage durations of a run."""
+        for stage, duration in getattr(run, "stage_times", {}).items():
+            keys = self.get_keys(run, stage)
+            self._apply(self.entries, keys, duration)
+            self.pending.append((keys, duration))
+
+    def save(self):
+        """Merge the new measurements into the history on disk (which may be updated by other sessions)."""
+        if len(self.pending) == 0:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with FileLock(str(self.path) + ".lock"):
+            entries = self._read()
+            for keys, duration in self.pending:
+                self._apply(entries, keys, duration)
+            with tempfile.NamedTemporaryFile("w", dir=self.path.parent, delete=False) as handle:
+                json.dump(entries, handle, indent=2, sort_keys=True)
+            os.replace(handle.name, self.path)
+        self.entries = entries
+        self.pending = []
@@ -28,6 +28,7 @@ from .postprocesses import (
     Bytes2kBPostprocess,
     Artifact2ColumnPostprocess,
     AnalyseInstructionsPostprocess,
+    ProfilePostprocess,
     CompareRowsPostprocess,
 )
 
@@ -41,5 +42,6 @@ SUPPORTED_POSTPROCESSES = {
     "bytes2kb": Bytes2kBPostprocess,
     "artifact2cols": Artifact2ColumnPostprocess,
     "analyse_instructions": AnalyseInstructionsPostprocess,
+    "profile": ProfilePostprocess,
     "compare_rows": CompareRowsPostprocess,
 }
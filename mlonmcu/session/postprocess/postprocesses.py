@@ -18,16 +18,21 @@
 #
 """Collection of (example) postprocesses integrated in MLonMCU."""
 
+import io
 import re
 import ast
 import tempfile
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 
 from mlonmcu.artifact import Artifact, ArtifactFormat, lookup_artifacts
 from mlonmcu.config import str2dict, str2bool, str2list
 from mlonmcu.logging import get_logger
+from mlonmcu.target.elf import get_functions
+from mlonmcu.target.instr_trace import load_instruction_trace
+from mlonmcu.target.metrics import Metrics
 
 from .postprocess import SessionPostprocess, RunPostprocess
 
@@ -328,10 +333,122 @@ class Artifact2ColumnPostprocess(RunPostprocess):
             report.main_df[colname] = matches[0].content
 
 
+RISCV_MAJOR_OPCODES = {
+    0b0010011: "OP-IMM",
+    0b0110111: "LUI",
+    0b0010111: "AUIPC",
+    0b0110011: "OP",
+    0b1101111: "JAL",
+    0b1100111: "JALR",
+    0b1100011: "BRANCH",
+    0b0000011: "LOAD",
+    0b0100011: "STORE",
+    0b0001111: "MISC-MEM",
+    0b1110011: "SYSTEM",
+    0b1000011: "MADD",
+    0b1000111: "MSUB",
+    0b1001011: "MNSUB",
+    0b1001111: "MNADD",
+    0b0000111: "LOAD-FP",
+    0b0100111: "STORE-FP",
+    0b0001011: "custom-0",
+    0b0101011: "custom-1",
+    0b1011011: "custom-2/rv128",
+    0b1111011: "custom-3/rv128",
+    0b1101011: "reserved",
+    0b0101111: "AMO",
+    0b1010011: "OP-FP",
+    0b1010111: "OP-V",
+    0b1110111: "OP-P",
+    0b0011011: "OP-IMM-32",
+    0b0111011: "OP-32",
+}
+
+# Indexed by funct3 (bits 13-15) and the quadrant (bits 0-1) of 16-bit instructions
+RISCV_RVC_MAJOR_OPCODES = {
+    0b00000: "OP-IMM",
+    0b00001: "OP-IMM",
+    0b00010: "OP-IMM",
+    0b00100: "LOAD",
+    0b00101: "JAL",
+    0b00110: "LOAD-FP",
+    0b01000: "LOAD",
+    0b01001: "OP-IMM",
+    0b01010: "LOAD",
+    0b01100: "LOAD-FP",
+    0b01101: "OP-IMM",
+    0b01110: "LOAD-FP",
+    0b10000: "reserved",
+    0b10001: "MISC-ALU",
+    0b10010: "JALR",
+    0b10100: "STORE-FP",
+    0b10101: "JAL",
+    0b10110: "STORE-FP",
+    0b11000: "STORE",
+    0b11001: "BRANCH",
+    0b11010: "STORE",
+    0b11100: "STORE-FP",
+    0b11101: "BRANCH",
+    0b11110: "STORE-FP",
+}
+
+
+def classify_riscv_major_opcodes(encodings):
+    """Determine the major opcode groups of an array of RISC-V instruction encodings.
+
+    Returns the group ids of the instructions and the list of group labels.
+    """
+    labels = sorted(set(RISCV_MAJOR_OPCODES.values())) + ["UNKNOWN"]
+    labels += [f"{label} (Compressed)" for label in sorted(set(RISCV_RVC_MAJOR_OPCODES.values()))]
+    invalid = len(labels)
+    lookup = np.full(128, labels.index("UNKNOWN"), dtype=np.int64)
+    for opcode, label in RISCV_MAJOR_OPCODES.items():
+        lookup[opcode] = labels.index(label)
+    rvc_lookup = np.full(32, invalid, dtype=np.int64)
+    for combined, label in RISCV_RVC_MAJOR_OPCODES.items():
+        rvc_lookup[combined] = labels.index(f"{label} (Compressed)")
+    encodings = np.asarray(encodings, dtype=np.uint32)
+    lsbs = encodings & 0b11
+    combined = ((encodings >> 13) & 0b111) << 2 | lsbs
+    ret = np.where(lsbs == 0b11, lookup[encodings & 0b1111111], rvc_lookup[combined])
+    assert not (ret == invalid).any(), "Invalid compressed instruction found"
+    return ret, labels
+
+
+def count_sequences(ids, length, num_ids):
+    """Count the occurrences of all sequences of the given length in an array of integer ids (0 <= id < num_ids).
+
+    Returns the unique sequences (one row per sequence) and their counts.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    num = len(ids) - length + 1
+    if num <= 0:
+        return np.empty((0, length), dtype=np.int64), np.empty(0, dtype=np.int64)
+    base = max(num_ids, 1)
+    if base**length < 2**63:
+        # Encode every sequence as a single integer
+        codes = ids[:num].copy()
+        for i in range(1, length):
+            codes *= base
+            codes += ids[i : i + num]
+        if base**length <= 2 * len(ids):
+            counts = np.bincount(codes, minlength=base**length)
+            codes = np.flatnonzero(counts)
+            counts = counts[codes]
+        else:
+            codes, counts = np.unique(codes, return_counts=True)
+        sequences = np.empty((len(codes), length), dtype=np.int64)
+        for i in reversed(range(length)):
+            codes, sequences[:, i] = np.divmod(codes, base)
+        return sequences, counts
+    windows = np.stack([ids[i : i + num] for i in range(length)], axis=1)
+    return np.unique(windows, axis=0, return_counts=True)
+
+
 class AnalyseInstructionsPostprocess(RunPostprocess):
     """Counting specific types of instructions."""
 
-    DEFAULTS = {**RunPostprocess.DEFAULTS, "groups": True, "sequences": True, "top": 10}
+    DEFAULTS = {**RunPostprocess.DEFAULTS, "groups": True, "sequences": True, "top": 10, "max_sequence_length": 3}
 
     def __init__(self, features=None, config=None):
         super().__init__("analyse_instructions", features=features, config=config)
@@ -353,17 +470,28 @@ class AnalyseInstructionsPostprocess(RunPostprocess):
         """get sequences property."""
         return int(self.config["top"])
 
+    @property
+    def max_sequence_length(self):
+        """Get max_sequence_length property."""
+        return int(self.config["max_sequence_length"])
+
     def post_run(self, report, artifacts):
         """Called at the end of a run."""
         ret_artifacts = []
-        log_artifact = lookup_artifacts(artifacts, flags=("log_instrs",), fmt=ArtifactFormat.TEXT, first_only=True)
+        log_artifact = lookup_artifacts(artifacts, flags=("log_instrs",), first_only=True)
         assert len(log_artifact) == 1, "To use analyse_instructions process, please enable feature log_instrs."
         log_artifact = log_artifact[0]
         is_spike = "spike" in log_artifact.flags
         is_etiss = "etiss_pulpino" in log_artifact.flags
         is_ovpsim = "ovpsim" in log_artifact.flags
         is_riscv = is_spike or is_etiss or is_ovpsim
-        if is_spike:
+        if log_artifact.fmt == ArtifactFormat.RAW:
+            # Binary trace (see mlonmcu.target.instr_trace) which is memory-mapped if possible
+            source = log_artifact.file if log_artifact.file is not None else log_artifact.raw
+            trace, table = load_instruction_trace(source)
+            encodings = trace["encoding"]
+            ids = trace["mnemonic"]
+        elif is_spike:
             content = log_artifact.content
             if self.groups:
                 encodings = re.compile(r"\((0x[0-9abcdef]+)\)").findall(content)
@@ -389,111 +517,39 @@ class AnalyseInstructionsPostprocess(RunPostprocess):
                 )
         else:
             raise RuntimeError("Uable to determine the used target.")
+        if log_artifact.fmt != ArtifactFormat.RAW:
+            if self.groups:
+                encodings = np.array([int(enc, 0) for enc in encodings], dtype=np.uint32)
+            if self.sequences:
+                table, ids = np.unique(np.array(names, dtype=str), return_inverse=True)
 
-        def _helper(x, top=100):
-            counts = pd.Series(x).value_counts()
-            probs = counts / len(x)
-            return dict(counts.head(top)), dict(probs.head(top))
+        def _helper(counts, total, top=100):
+            # Sort by count (descending), ties are sorted by label
+            order = np.argsort(-counts, kind="stable")[:top]
+            return order, counts[order], counts[order] / total if total > 0 else counts[order]
 
-        def _gen_csv(label, counts, probs):
+        def _gen_csv(label, labels, counts, probs):
             lines = [f"{label},Count,Probablity"]
-            for x in counts:
-                line = f"{x},{counts[x]},{probs[x]:.3f}"
+            for x, count, prob in zip(labels, counts, probs):
+                line = f"{x},{count},{prob:.3f}"
                 lines.append(line)
             return "\n".join(lines)
 
         if self.groups:
             assert is_riscv, "Currently only riscv instrcutions can be analysed by groups"
-
-            def _extract_major_opcode(enc):
-                mapping = {
-                    0b0010011: "OP-IMM",
-                    0b0110111: "LUI",
-                    0b0010111: "AUIPC",
-                    0b0110011: "OP",
-                    0b1101111: "JAL",
-                    0b1100111: "JALR",
-                    0b1100011: "BRANCH",
-                    0b0000011: "LOAD",
-                    0b0100011: "STORE",
-                    0b0001111: "MISC-MEM",
-                    0b1110011: "SYSTEM",
-                    0b1000011: "MADD",
-                    0b1000111: "MSUB",
-                    0b1001011: "MNSUB",
-                    0b1001111: "MNADD",
-                    0b0000111: "LOAD-FP",
-                    0b0100111: "STORE-FP",
-                    0b0001011: "custom-0",
-                    0b0101011: "custom-1",
-                    0b1011011: "custom-2/rv128",
-                    0b1111011: "custom-3/rv128",
-                    0b1101011: "reserved",
-                    0b0101111: "AMO",
-                    0b1010011: "OP-FP",
-                    0b1010111: "OP-V",
-                    0b1110111: "OP-P",
-                    0b0011011: "OP-IMM-32",
-                    0b0111011: "OP-32",
-                }
-                enc = int(enc, 0)  # Convert from hexadecimal
-                opcode = enc & 0b1111111
-                lsbs = opcode & 0b11
-                if lsbs == 0b11:
-                    major = mapping.get(opcode, "UNKNOWN")
-                else:
-                    # 16-bit instruction
-                    msbs = (enc & 0b1110000000000000) >> 13
-                    rvc_mapping = {
-                        0b00000: "OP-IMM",
-                        0b00001: "OP-IMM",
-                        0b00010: "OP-IMM",
-                        0b00100: "LOAD",
-                        0b00101: "JAL",
-                        0b00110: "LOAD-FP",
-                        0b01000: "LOAD",
-                        0b01001: "OP-IMM",
-                        0b01010: "LOAD",
-                        0b01100: "LOAD-FP",
-                        0b01101: "OP-IMM",
-                        0b01110: "LOAD-FP",
-                        0b10000: "reserved",
-                        0b10001: "MISC-ALU",
-                        0b10010: "JALR",
-                        0b10100: "STORE-FP",
-                        0b10101: "JAL",
-                        0b10110: "STORE-FP",
-                        0b11000: "STORE",
-                        0b11001: "BRANCH",
-                        0b11010: "STORE",
-                        0b11100: "STORE-FP",
-                        0b11101: "BRANCH",
-                        0b11110: "STORE-FP",
-                    }
-                    combined = msbs << 2 | lsbs
-                    assert combined in rvc_mapping.keys()
-                    return f"{rvc_mapping[combined]} (Compressed)"
-                return major
-
-            majors = list(map(_extract_major_opcode, encodings))
-            major_counts, major_probs = _helper(majors, top=self.top)
-            majors_csv = _gen_csv("Major", major_counts, major_probs)
+            majors, labels = classify_riscv_major_opcodes(encodings)
+            major_counts = np.bincount(majors, minlength=len(labels))
+            order, counts, probs = _helper(major_counts, len(majors), top=self.top)
+            order = [idx for idx, count in zip(order, counts) if count > 0]
+            majors_csv = _gen_csv("Major", [labels[idx] for idx in order], counts, probs)
             artifact = Artifact("analyse_instructions_majors.csv", content=majors_csv, fmt=ArtifactFormat.TEXT)
             ret_artifacts.append(artifact)
         if self.sequences:
-            max_len = 3
-
-            def _get_sublists(lst, length):
-                ret = []
-                for i in range(len(lst) - length + 1):
-                    lst_ = lst[i : i + length]
-                    ret.append(";".join(lst_))
-                return ret
-
-            for length in range(1, max_len + 1):
-                names_ = _get_sublists(names, length)
-                counts, probs = _helper(names_, top=self.top)
-                sequence_csv = _gen_csv("Sequence", counts, probs)
+            for length in range(1, self.max_sequence_length + 1):
+                sequences, sequence_counts = count_sequences(ids, length, len(table))
+                order, counts, probs = _helper(sequence_counts, sequence_counts.sum(), top=self.top)
+                labels = [";".join(table[sequences[idx]]) for idx in order]
+                sequence_csv = _gen_csv("Sequence", labels, counts, probs)
                 artifact = Artifact(
                     f"analyse_instructions_seq{length}.csv", content=sequence_csv, fmt=ArtifactFormat.TEXT
                 )
@@ -501,6 +557,137 @@ class AnalyseInstructionsPostprocess(RunPostprocess):
         return ret_artifacts
 
 
+def attribute_pcs(pcs, starts, ends, chunk_size=2**24, max_histogram_size=2**26):
+    """Count the executed instructions per function using a sorted interval index (see get_functions).
+
+    The last entry of the returned array counts the instructions outside of any function.
+    """
+    counts = np.zeros(len(starts) + 1, dtype=np.int64)
+    unknown = len(starts)
+
+    def _lookup(addrs, weights=None):
+        idx = np.searchsorted(starts, addrs, side="right") - 1
+        valid = idx >= 0
+        valid[valid] = addrs[valid] < ends[idx[valid]]
+        idx[~valid] = unknown
+        return np.bincount(idx, weights=weights, minlength=len(counts))
+
+    if len(starts) == 0:
+        counts[unknown] = len(pcs)
+        return counts
+    base = int(starts[0])
+    size = int(ends.max()) - base
+    histogram = np.zeros(size, dtype=np.int64) if size <= max_histogram_size else None
+    for offset in range(0, len(pcs), chunk_size):
+        chunk = np.asarray(pcs[offset : offset + chunk_size], dtype=np.uint64)
+        if histogram is None:
+            counts += _lookup(chunk)
+            continue
+        # The code section is small, hence the executions are counted per address first
+        inside = (chunk >= base) & (chunk < base + size)
+        histogram += np.bincount((chunk[inside] - base).astype(np.int64), minlength=size)
+        counts[unknown] += len(chunk) - int(inside.sum())
+    if histogram is not None:
+        addrs = np.flatnonzero(histogram)
+        counts += _lookup(addrs.astype(np.uint64) + np.uint64(base), weights=histogram[addrs]).astype(np.int64)
+    return counts
+
+
+class ProfilePostprocess(RunPostprocess):
+    """Attribute the executed instructions and cycles to the functions of the program (flat profile).
+
+    The instruction trace does not contain timing information. Hence the cycles of the run are distributed by the
+    number of executed instructions (constant CPI) and reported as an estimate (Est. Cycles).
+    """
+
+    DEFAULTS = {
+        **RunPostprocess.DEFAULTS,
+        "elf_name": "generic_mlif",
+        "layer_pattern": r"^tvmgen_\w+_fused_",  # Functions which are counted as layers
+        "to_metrics": False,
+        "top": 5,  # Number of functions and layers added to the report (with to_metrics)
+    }
+
+    def __init__(self, features=None, config=None):
+        super().__init__("profile", features=features, config=config)
+
+    @property
+    def elf_name(self):
+        """Get elf_name property."""
+        return self.config["elf_name"]
+
+    @property
+    def layer_pattern(self):
+        """Get layer_pattern property."""
+        return self.config["layer_pattern"]
+
+    @property
+    def to_metrics(self):
+        """Get to_metrics property."""
+        value = self.config["to_metrics"]
+        return str2bool(value) if not isinstance(value, (bool, int)) else value
+
+    @property
+    def top(self):
+        """Get top property."""
+        return int(self.config["top"])
+
+    def post_run(self, report, artifacts):
+        """Called at the end of a run."""
+        log_artifact = lookup_artifacts(artifacts, flags=("log_instrs",), first_only=True)
+        assert len(log_artifact) == 1, "To use profile postprocess, please enable feature log_instrs."
+        log_artifact = log_artifact[0]
+        assert log_artifact.fmt == ArtifactFormat.RAW, "The profile postprocess requires log_instrs.fmt=npz"
+        elf_artifact = lookup_artifacts(artifacts, name=self.elf_name, first_only=True)
+        assert len(elf_artifact) == 1, f"ELF artifact '{self.elf_name}' not found"
+        elf_artifact = elf_artifact[0]
+        if elf_artifact.fmt == ArtifactFormat.PATH:
+            starts, ends, names = get_functions(elf_artifact.path)
+        elif elf_artifact.file is not None:
+            starts, ends, names = get_functions(elf_artifact.file)
+        else:
+            starts, ends, names = get_functions(io.BytesIO(elf_artifact.raw))
+        source = log_artifact.file if log_artifact.file is not None else log_artifact.raw
+        trace, _ = load_instruction_trace(source)
+        counts = attribute_pcs(trace["pc"], starts, ends)
+        names = names + ["[unknown]"]
+        total = int(counts.sum())
+
+        # Without a cycle-accurate trace the cycles are distributed by the number of instructions (constant CPI)
+        total_cycles = None
+        metrics_artifact = lookup_artifacts(artifacts, name="run_metrics.csv", first_only=True)
+        if metrics_artifact:
+            total_cycles = Metrics.from_csv(metrics_artifact[0].content).get_data().get("Cycles")
+        cpi = total_cycles / total if total_cycles and total > 0 else None
+
+        def _gen_df(labels, counts_):
+            df = pd.DataFrame({"Function": labels, "Instructions": counts_})
+            df = df.groupby("Function", sort=False, as_index=False).sum()
+            df = df[df["Instructions"] > 0].sort_values("Instructions", ascending=False, kind="stable")
+            df["Fraction"] = df["Instructions"] / total if total > 0 else 0.0
+            if cpi is not None:
+                df["Est. Cycles"] = (df["Instructions"] * cpi).round().astype(int)
+            return df
+
+        functions_df = _gen_df(names, counts)
+        pattern = re.compile(self.layer_pattern)
+        is_layer = [pattern.search(name) is not None for name in names]
+        layer_names = [re.sub(r"_compute_$", "", name) for name, layer in zip(names, is_layer) if layer]
+        layers_df = _gen_df(layer_names, counts[is_layer]).rename(columns={"Function": "Layer"})
+
+        ret_artifacts = [
+            Artifact("profile_functions.csv", content=functions_df.to_csv(index=False), fmt=ArtifactFormat.TEXT),
+            Artifact("profile_layers.csv", content=layers_df.to_csv(index=False), fmt=ArtifactFormat.TEXT),
+        ]
+        if self.to_metrics:
+            for label, df in [("Function", functions_df.head(self.top)), ("Layer", layers_df.head(self.top))]:
+                for _, row in df.iterrows():
+                    report.main_df[f"{label} {row[label]} Instructions"] = row["Instructions"]
+                    if cpi is not None:
+                        report.main_df[f"{label} {row[label]} Est. Cycles"] = row["Est. Cycles"]
+        return ret_artifacts
+
+
 class CompareRowsPostprocess(SessionPostprocess):
     """TODO"""
 
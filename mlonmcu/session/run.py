@@ -20,6 +20,8 @@
 import itertools
 import os
 import copy
+import time
+import pickle
 import tempfile
 from pathlib import Path
 from enum import IntEnum
@@ -35,6 +37,10 @@ from mlonmcu.models.lookup import lookup_models
 from mlonmcu.feature.type import FeatureType
 from mlonmcu.feature.features import get_matching_features, get_available_features
 from mlonmcu.target.metrics import Metrics
+from mlonmcu.utils import parse_size
+from mlonmcu.trace import span
+from mlonmcu.setup.utils import deadline, ProcessTimeoutError, ProcessCancelledError
+from mlonmcu.session.cache import hash_file, hash_artifact
 from mlonmcu.models import SUPPORTED_FRONTENDS
 from mlonmcu.platform import get_platforms
 from mlonmcu.flow import SUPPORTED_FRAMEWORKS, SUPPORTED_BACKENDS
@@ -68,15 +74,38 @@ class Run:
         "tune_enabled": False,
         "target_to_backend": False,
         "stage_subdirs": False,
+        "save_state": True,
+        "spill_artifacts_size": "1M",  # Larger artifacts are moved to the disk after every stage (None: disable)
+        "stage_timeout": None,  # Kill the subprocesses of a stage after the given number of seconds (None: disable)
     }
 
     REQUIRED = []
     OPTIONAL = []
 
     @classmethod
-    def from_file(cls, path):
-        """Restore a run object which was written to the disk."""
-        raise NotImplementedError
+    def from_file(cls, path, session=None):
+        """Restore a run object which was written to the disk (see write_state_file)."""
+        path = Path(path)
+        with open(path, "rb") as handle:
+            state = pickle.load(handle)
+        run = cls.__new__(cls)
+        run.compacted = False  # Missing in older state files
+        run.failure_reason = None
+        run.artifact_paths = {}
+        run.__dict__.update(state)
+        run.session = session
+        run.tempdir = None
+        run.dir = path.parent.parent
+        run.locked = False
+        run.artifacts_per_stage = {}
+        for stage in RunStage:
+            if not run.completed[stage]:
+                continue
+            stage_file = path.parent / f"{stage.name.lower()}.pkl"
+            if stage_file.is_file():
+                with open(stage_file, "rb") as handle:
+                    run.artifacts_per_stage[stage] = pickle.load(handle)
+        return run
 
     def __init__(
         self,
@@ -107,6 +136,7 @@ class Run:
         self.comment = comment
         # self.stage = RunStage.NOP  # max executed stage
         self.completed = {stage: stage == RunStage.NOP for stage in RunStage}
+        self.stage_times = {}  # Wall time of the processed stages in seconds
 
         self.init_directory()
         self.target = target
@@ -120,6 +150,9 @@ class Run:
         self.sub_parents = {}
         self.result = None
         self.failing = False  # -> RunStatus
+        self.failure_reason = None  # timeout, cancelled or error
+        self.compacted = False  # See compact()
+        self.artifact_paths = {}
         # self.lock = threading.Lock()  # FIXME: use mutex instead of boolean
         self.locked = False
         self.report = None
@@ -160,6 +193,24 @@ class Run:
         value = self.run_config["stage_subdirs"]
         return str2bool(value) if not isinstance(value, (bool, int)) else value
 
+    @property
+    def spill_artifacts_size(self):
+        """Get spill_artifacts_size property."""
+        value = self.run_config["spill_artifacts_size"]
+        return parse_size(value) if value is not None else None
+
+    @property
+    def stage_timeout(self):
+        """Get stage_timeout property."""
+        value = self.run_config["stage_timeout"]
+        return float(value) if value is not None else None
+
+    @property
+    def save_state(self):
+        """Get save_state property."""
+        value = self.run_config["save_state"]
+        return str2bool(value) if not isinstance(value, (bool, int)) else value
+
     @property
     def build_platform(self):
         """Get platform for build stage."""
@@ -270,19 +321,144 @@ class Run:
                 os.mkdir(self.dir)
             # This is not a good idea, but else we would need a mutex/lock on the shared build_dir
             # A solution would be to split up the framework runtime libs from the mlif...
+            # (MLIF can instead share a locked build directory between equivalent runs, see mlif.shared_build)
             for platform in self.platforms:  # TODO: only do this if needed! (not for every platform)
                 # The stage_subdirs setting is ignored here because platforms can be multi-stage!
                 platform.init_directory(path=Path(self.dir) / platform.name)
+                platform.cache_dir = self.session.cache_dir / platform.name
 
     def copy(self):
         """Create a new run based on this instance."""
         new = copy.deepcopy(self)
+        new.session = self.session  # Only a stripped-down copy of the session was created
         if self.session:
             new_idx = self.session.request_run_idx()
             new.idx = new_idx
             self.init_directory()
         return new
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["tempdir"] = None  # The temporary directory is owned by the original instance
+        return state
+
+    def get_state(self, stages=None):
+        """Return the state of the run which can be merged into another instance via update_state.
+
+        Parameters
+        ----------
+        stages : list
+            If provided, only the artifacts of the given stages are included.
+        """
+        state = self.__getstate__()
+        del state["session"]
+        if stages is not None:
+            state["artifacts_per_stage"] = {
+                stage: artifacts for stage, artifacts in self.artifacts_per_stage.items() if stage in stages
+            }
+        return state
+
+    def update_state(self, state):
+        """Merge the state of a run which was processed by another process into this instance."""
+        state = state.copy()
+        artifacts_per_stage = state.pop("artifacts_per_stage")
+        self.__dict__.update(state)
+        self.artifacts_per_stage.update(artifacts_per_stage)
+
+    def spill_artifacts(self, stage, threshold=None):
+        """Move the data of large artifacts of a stage to the run directory to keep the memory usage flat.
+
+        The artifacts only keep a reference to the written files and read them on demand.
+
+        Parameters
+        ----------
+        stage : RunStage
+            The stage whose artifacts should be spilled.
+        threshold : int
+            Minimal size of the spilled artifacts (default: spill_artifacts_size).
+        """
+        if threshold is None:
+            threshold = self.spill_artifacts_size
+        if threshold is None or stage not in self.artifacts_per_stage:
+            return
+        for name, artifacts in self.artifacts_per_stage[stage].items():
+            for artifact in artifacts:
+                if not artifact.in_memory or artifact.size < threshold:
+                    continue
+                artifact.spill(self._get_spill_filename(stage, name, artifact))
+
+    def _get_spill_filename(self, stage, name, artifact):
+        dest = self.dir / "artifacts" / RunStage(stage).name.lower()
+        if name not in ["", "default"]:
+            dest = dest / "sub" / name
+        filename = dest / artifact.name
+        count = 0
+        while filename.exists():  # Never overwrite files which might still be referenced
+            count += 1
+            filename = dest / f"{artifact.name}.{count}"
+        return filename
+
+    def compact(self):
+        """Shrink a finished run to its report and the paths of its artifacts to release its memory.
+
+        Artifacts which were neither exported nor spilled before are written to the run directory first.
+        Afterwards only the report (see get_report) and artifact_paths are available.
+        """
+        if self.compacted:
+            return
+        self.report = self.get_report()
+        artifact_paths = {}
+        for stage, artifacts_per_sub in self.artifacts_per_stage.items():
+            for name, artifacts in artifacts_per_sub.items():
+                paths = []
+                for artifact in artifacts:
+                    if artifact.path is not None and (
+                        artifact.fmt == ArtifactFormat.PATH or artifact.is_exported(artifact.path)
+                    ):
+                        paths.append(Path(artifact.path))
+                        continue
+                    if artifact.in_memory:
+                        artifact.spill(self._get_spill_filename(stage, name, artifact))
+                    paths.append(artifact.file)
+                artifact_paths[(RunStage(stage), name)] = paths
+        self.artifact_paths = artifact_paths
+        self.artifacts_per_stage = {}
+        self.compacted = True
+
+    def write_state_file(self, stages=None):
+        """Persist the state of the run after a completed stage, so that it can be resumed later.
+
+        The artifacts of every stage are written to a separate file only once, while the small run.pkl file
+        (config, features, completed stages, sub_parents,...) is replaced after every stage. The data of the
+        artifacts is spilled to the run directory first, hence the state files only hold references to these
+        files (and their digest) which are also reused when exporting the artifacts.
+
+        Parameters
+        ----------
+        stages : list
+            Stages whose artifacts should be written as well.
+        """
+        if not self.save_state or self.session is None:
+            return
+        state_dir = self.dir / "state"
+        state_dir.mkdir(exist_ok=True)
+
+        def _dump(value, dest):
+            with tempfile.NamedTemporaryFile(dir=state_dir, delete=False) as handle:
+                pickle.dump(value, handle)
+            os.replace(handle.name, dest)
+
+        try:
+            for stage in stages if stages is not None else []:
+                if stage in self.artifacts_per_stage:
+                    self.spill_artifacts(stage, threshold=0)
+                    _dump(self.artifacts_per_stage[stage], state_dir / f"{RunStage(stage).name.lower()}.pkl")
+            state = self.get_state(stages=[])
+            del state["artifacts_per_stage"]
+            _dump(state, state_dir / "run.pkl")  # Written last to not refer to missing stage files
+        except Exception as e:  # Resuming is optional and should not break the run itself
+            logger.warning("%s Unable to write run state: %s", self.prefix, e)
+
     def init_component(self, component_cls, context=None):
         """Helper function to create and configure a MLonMCU component instance for this run."""
         required_keys = component_cls.REQUIRED
@@ -556,10 +732,90 @@ class Run:
                         extract = artifact.fmt == ArtifactFormat.MLF
                         # extract = artifact.fmt == ArtifactFormat.MLF
                         # and not isinstance(self.platform, MicroTvmPlatform)
-                        artifact.export(dest)
-                        # Keep the tar as well as the extracted files
-                        if extract:
-                            artifact.export(dest, extract=True)
+                        # Keep the tar as well as the extracted files (unchanged artifacts are skipped)
+                        artifact.export(dest, extract=extract)
+
+    @property
+    def stage_cache(self):
+        """Get the stage cache of the session (None if disabled)."""
+        return self.session.stage_cache if self.session is not None else None
+
+    def get_stage_cache_key(self, stage):
+        """Compute the key for looking up the artifacts of a stage based on its inputs and the relevant configs."""
+        all_configs = self.get_all_configs()
+
+        def configs_helper(*components):
+            names = [component.name for component in components if component is not None]
+            return {key: value for key, value in all_configs.items() if key.split(".", 1)[0] in names}
+
+        def artifacts_helper(artifacts_per_sub):
+            # Metrics are omitted as they contain timing information
+            return {
+                name: [
+                    (artifact.name, hash_artifact(artifact))
+                    for artifact in artifacts
+                    if "metrics" not in artifact.flags
+                ]
+                for name, artifacts in artifacts_per_sub.items()
+            }
+
+        if stage == RunStage.LOAD:
+            model_hashes = [hash_file(path) for path in self.model.paths]
+            return self.stage_cache.compute_key(
+                stage.name,
+                self.model.name,
+                self.model.config,
+                model_hashes,
+                configs_helper(*self.frontends),
+            )
+        if stage == RunStage.BUILD:
+            return self.stage_cache.compute_key(
+                stage.name,
+                self.model.name,
+                self.get_stage_cache_key(RunStage.LOAD) if self.has_stage(RunStage.LOAD) else None,
+                artifacts_helper(self.artifacts_per_stage.get(RunStage.TUNE, {})),
+                configs_helper(self.backend, self.framework, self.build_platform),
+            )
+        raise NotImplementedError(f"Caching is not supported for stage {stage.name}")
+
+    def lookup_stage_cache(self, stage):
+        """Returns the cache key and the cached entry (None in case of a miss) for a stage."""
+        if self.stage_cache is None:
+            return None, None
+        key = self.get_stage_cache_key(stage)
+        entry = self.stage_cache.lookup(key)
+        if entry is not None:
+            logger.debug("%s Using cached artifacts for stage %s", self.prefix, stage.name)
+            for artifacts in entry["artifacts"].values():
+                for artifact in artifacts:
+                    artifact.path = None  # Has to be exported again
+        return key, entry
+
+    def update_stage_cache(self, stage, key):
+        """Store the artifacts of a stage in the stage cache."""
+        artifacts = self.artifacts_per_stage[stage]
+        if any(artifact.fmt == ArtifactFormat.PATH for artifacts_ in artifacts.values() for artifact in artifacts_):
+            logger.debug("%s Stage %s refers to external files and can not be cached", self.prefix, stage.name)
+            return
+        # The cache must not refer to files in the run directory
+        artifacts = {name: [artifact.materialize() for artifact in items] for name, items in artifacts.items()}
+        sub_parents = {key_: value for key_, value in self.sub_parents.items() if key_[0] == stage}
+        self.stage_cache.store(key, {"artifacts": artifacts, "sub_parents": sub_parents})
+
+    def add_stage_cache_metrics(self, stage, hit, duration=None):
+        """Record stage cache hits/misses as optional metrics of the stage.
+
+        In case of a hit, the cached stage time is replaced by the given duration of the lookup.
+        """
+        prefix = stage.name.capitalize()
+        for artifacts in self.artifacts_per_stage[stage].values():
+            for artifact in lookup_artifacts(artifacts, name=f"{stage.name.lower()}_metrics.csv"):
+                metrics = Metrics.from_csv(artifact.content)
+                metrics.add(f"{prefix} Cache Hits", int(hit), optional=True, overwrite=True)
+                metrics.add(f"{prefix} Cache Misses", int(not hit), optional=True, overwrite=True)
+                if hit and duration is not None:
+                    metrics.add(f"{prefix} Stage Time [s]", duration, optional=True, overwrite=True)
+                artifact.content = metrics.to_csv(include_optional=True)
 
     def postprocess(self):
         """Postprocess the 'run'."""
@@ -590,7 +846,8 @@ class Run:
             for postprocess in self.postprocesses:
                 if isinstance(postprocess, RunPostprocess):
                     before = self.get_all_sub_artifacts(name)
-                    artifacts = postprocess.post_run(temp_report, before)
+                    with span(postprocess.name, cat="postprocess", run=self.idx, sub=name):
+                        artifacts = postprocess.post_run(temp_report, before)
                     if artifacts is None:
                         artifacts = []
                     new = {}
@@ -715,6 +972,8 @@ class Run:
 
         self.export_stage(RunStage.LOAD, optional=self.export_optional)  # Not required anymore?
         self.artifacts_per_stage[RunStage.BUILD] = {}
+        start = time.time()
+        cache_key, cached = self.lookup_stage_cache(RunStage.BUILD)
         for name in self.artifacts_per_stage[RunStage.LOAD]:
             model_artifact = lookup_artifacts(self.artifacts_per_stage[RunStage.LOAD][name], flags=["model"])
             if len(model_artifact) == 0:
@@ -731,6 +990,8 @@ class Run:
                     if not tuning_artifact.exported:
                         tuning_artifact.export(self.dir)
                     self.backend.tuning_records = tuning_artifact.path
+            if cached is not None:
+                continue
 
             # TODO: allow raw data as well as filepath in backends
             artifacts = self.backend.generate_artifacts()
@@ -743,6 +1004,13 @@ class Run:
                 new = {name if name in ["", "default"] else f"{name}": artifacts}
             self.artifacts_per_stage[RunStage.BUILD].update(new)
             self.sub_parents.update({(RunStage.BUILD, key): (self.last_stage, name) for key in new.keys()})
+        if cache_key is not None:
+            if cached is None:
+                self.update_stage_cache(RunStage.BUILD, cache_key)
+            else:
+                self.artifacts_per_stage[RunStage.BUILD] = cached["artifacts"]
+                self.sub_parents.update(cached["sub_parents"])
+            self.add_stage_cache_metrics(RunStage.BUILD, cached is not None, duration=time.time() - start)
         self.sub_names.extend(self.artifacts_per_stage[RunStage.BUILD])
         self.sub_names = list(set(self.sub_names))
 
@@ -792,7 +1060,12 @@ class Run:
         self.lock()
         # assert self.completed[RunStage.NOP]
 
-        artifacts = self.frontend.generate_artifacts(self.model)
+        start = time.time()
+        cache_key, cached = self.lookup_stage_cache(RunStage.LOAD)
+        if cached is None:
+            artifacts = self.frontend.generate_artifacts(self.model)
+        else:
+            artifacts = cached["artifacts"]
         # The following is very very dirty but required to update arena sizes via model metadata...
         cfg_new = {}
         self.frontend.process_metadata(self.model, cfg=cfg_new)
@@ -815,6 +1088,10 @@ class Run:
         self.sub_parents.update(
             {(RunStage.LOAD, key): (None, None) for key in self.artifacts_per_stage[RunStage.LOAD].keys()}
         )
+        if cache_key is not None:
+            if cached is None:
+                self.update_stage_cache(RunStage.LOAD, cache_key)
+            self.add_stage_cache_metrics(RunStage.LOAD, cached is not None, duration=time.time() - start)
 
         self.completed[RunStage.LOAD] = True
         self.unlock()
@@ -866,14 +1143,25 @@ class Run:
             func = stage_funcs[stage]
             if func:
                 self.failing = False
+                self.failure_reason = None
                 try:
-                    func()
+                    session_idx = self.session.idx if self.session is not None else None
+                    start_time = time.time()
+                    with span(RunStage(stage).name, cat="stage", session=session_idx, run=self.idx):
+                        # Python code can not be interrupted, hence the timeout is enforced on all spawned processes
+                        with deadline(self.stage_timeout):
+                            func()
+                    if self.completed[stage]:
+                        self.stage_times[RunStage(stage)] = time.time() - start_time
+                        self.spill_artifacts(stage)
+                        self.write_state_file(stages=[stage])
                 except Exception as e:
                     self.failing = True
                     if self.locked:
                         self.unlock()
                     logger.exception(e)
                     run_stage = RunStage(stage).name
+                    self.handle_failure(e, run_stage)
                     logger.error("%s Run failed at stage '%s', aborting...", self.prefix, run_stage)
                     break
             # self.stage = stage  # FIXME: The stage_func should update the stage intead?
@@ -884,6 +1172,20 @@ class Run:
             report.export(report_file)
         return report
 
+    def handle_failure(self, exception, stage_name):
+        """Determine the failure reason and keep the partial output of processes which were killed."""
+        if isinstance(exception, ProcessTimeoutError):
+            self.failure_reason = "timeout"
+            if exception.output:
+                out_file = Path(self.dir) / f"{stage_name.lower()}_partial_out.log"
+                with open(out_file, "w", encoding="utf-8") as handle:
+                    handle.write(exception.output)
+                logger.error("%s Partial output of timed out process written to: %s", self.prefix, out_file)
+        elif isinstance(exception, ProcessCancelledError):
+            self.failure_reason = "cancelled"
+        else:
+            self.failure_reason = "error"
+
     def write_run_file(self):
         """Create a run.txt file which contains information used to reconstruct the run based
         on its properties at a later point in time."""
@@ -975,6 +1277,8 @@ class Run:
 
     def get_report(self):
         """Returns teh complete report of this run."""
+        if self.compacted:
+            return self.report
         if self.completed[RunStage.POSTPROCESS]:
             if self.report is not None:
                 return (
@@ -1007,6 +1311,8 @@ class Run:
         post["Comment"] = self.comment if len(self.comment) > 0 else "-"
         if self.failing:
             post["Failing"] = True
+            if self.failure_reason:
+                post["Reason"] = self.failure_reason
 
         self.export_stage(RunStage.RUN, optional=self.export_optional)
 
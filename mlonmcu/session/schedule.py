@@ -0,0 +1,424 @@
+#
+# Copyright (c) 2022 TUM Department of Electrical and Computer Engineering.
+#
+# This file is part of MLonMCU.
+# See https://github.com/tum-ei-eda/mlonmcu.git for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Definition of the scheduler which is used to process the runs of a session."""
+import time
+import heapq
+import threading
+import multiprocessing
+import concurrent.futures
+
+from tqdm import tqdm
+
+from mlonmcu.logging import get_logger
+from mlonmcu.setup.jobserver import get_active_jobserver
+from mlonmcu.setup.utils import cancel_processes, reset_cancel
+from mlonmcu.trace import get_active_tracer
+
+from .run import RunStage
+from .distributed import DirectoryQueue, QueueExecutor
+
+logger = get_logger()
+
+
+def _init_progress(total, msg="Processing...", position=None):
+    """Helper function to initialize a progress bar for the session."""
+    return tqdm(
+        total=total,
+        desc=msg,
+        ncols=100,
+        bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}s]",
+        leave=None,
+        position=position,
+    )
+
+
+def _close_progress(pbar):
+    """Helper function to close the session progressbar, if available."""
+    if pbar:
+        pbar.close()
+
+
+def _trace_queued(run, until, submitted):
+    """Record the time between the submission and the start of a job."""
+    tracer = get_active_tracer()
+    if tracer is not None and submitted is not None:
+        tracer.add("queued", "queue", submitted, time.time(), args={"run": run.idx, "until": RunStage(until).name})
+
+
+def _watch_cancel(event):
+    event.wait()
+    cancel_processes()
+
+
+def _init_worker(cancel_event):
+    """Initialize a worker process of the process pool. Setting the event kills the subprocesses of the worker."""
+    threading.Thread(target=_watch_cancel, args=(cancel_event,), daemon=True).start()
+
+
+def _process_remote(run, until, skip, export, submitted=None):
+    """Helper function to process a run in a worker process. Returns the updated state of the run."""
+    _trace_queued(run, until, submitted)
+    pending = [stage for stage in RunStage if not run.completed[stage]]
+    run.process(until=until, skip=skip, export=export)
+    return run.get_state(stages=pending)
+
+
+class SessionScheduler:
+    """Scheduler which processes the runs of a session using a pool of workers.
+
+    In the per-stage mode, every stage of a run is submitted as a separate job as soon as the previous stage
+    of the same run has completed. Hence there are no barriers between the stages of different runs.
+
+    Using the process_pool executor, the jobs are processed in worker processes instead of threads. The updated
+    state of a run is merged back into the original instance after every job.
+
+    Using the queue executor, the jobs are put into a shared directory (queue_dir) and processed by workers
+    on the same or other machines (see `mlonmcu worker`).
+
+    If a cost_func is provided, it is used to predict the remaining duration of a run in seconds. Runs with the
+    highest predicted cost are submitted first to reduce the overall makespan.
+
+    The processing can be cancelled by a KeyboardInterrupt or after max_failures runs have failed. Jobs which
+    have not been started yet are dropped and the subprocesses of running jobs are killed, including those started
+    by worker processes or queue workers. The state of the cancelled runs is kept, hence they can be resumed later.
+    """
+
+    EXECUTORS = ["thread_pool", "process_pool", "queue"]
+
+    def __init__(
+        self,
+        runs,
+        until=RunStage.DONE,
+        per_stage=False,
+        num_workers=1,
+        progress=False,
+        export=False,
+        prefix="",
+        executor="thread_pool",
+        queue_dir=None,
+        queue_timeout=300,
+        num_local_workers=0,
+        callback=None,
+        cost_func=None,
+        max_failures=0,
+    ):
+        assert num_workers > 0, "num_workers can not be < 1"
+        assert executor in self.EXECUTORS, f"Unsupported executor: {executor}"
+        assert executor != "queue" or queue_dir is not None, "The queue executor requires a queue_dir"
+        self.runs = runs
+        self.until = until
+        self.per_stage = per_stage
+        self.num_workers = num_workers
+        self.progress = progress
+        self.export = export
+        self.prefix = prefix
+        self.executor = executor
+        self.queue_dir = queue_dir
+        self.queue_timeout = queue_timeout
+        self.num_local_workers = num_local_workers
+        self.callback = callback
+        self.cost_func = cost_func
+        self.max_failures = max_failures
+        self.cancelled = False
+        self.num_cancelled = 0
+        self._cancel_workers = None  # Cancels the jobs running in other processes or machines
+        self.predicted_cost = 0.0
+        self.started_at = None
+        self.num_failures = 0
+        self.stage_failures = {}
+        self.used_stages = self.get_used_stages()
+        self.skipped_stages = [stage for stage in RunStage if stage not in self.used_stages]
+
+    def get_used_stages(self):
+        """Determines the stages which are used by at least one run."""
+        used = []
+        for stage_index in list(range(RunStage.LOAD, self.until + 1)) + [RunStage.POSTPROCESS]:
+            stage = RunStage(stage_index)
+            if any(run.has_stage(stage) for run in self.runs):
+                used.append(stage)
+        return used
+
+    def get_run_stages(self, run):
+        """Returns the stages which have to be processed for a given run in the per-stage mode."""
+        return [stage for stage in self.used_stages if run.has_stage(stage) and not run.completed[stage]]
+
+    def predict(self, run, stages):
+        """Return the predicted cost of the given stages of a run (0 if no cost function is used)."""
+        if self.cost_func is None:
+            return 0.0
+        return self.cost_func(run, stages)
+
+    def _update_eta(self, pbar, remaining_cost):
+        """Show the predicted remaining time next to the elapsed time in the progress bar."""
+        if pbar is None or self.cost_func is None:
+            return
+        pbar.set_postfix_str(f"predicted remaining: {remaining_cost / self.num_workers:.0f}s", refresh=False)
+
+    def check_threads(self):
+        """Warn if the number of used threads heavily exceeds the available CPU resources."""
+        if len(self.runs) == 0:
+            return
+        if get_active_jobserver() is not None:
+            # The number of concurrent processes is limited by the jobserver
+            return
+        run = self.runs[0]
+        total_threads = min(len(self.runs), self.num_workers)
+        cpu_count = multiprocessing.cpu_count()
+        if (
+            (self.until >= RunStage.COMPILE)
+            and run.compile_platform is not None
+            and run.compile_platform.name == "mlif"
+        ):
+            total_threads *= run.compile_platform.num_threads  # TODO: This should also be used for non-mlif platforms
+        if total_threads > 2 * cpu_count:
+            logger.warning(
+                "The chosen configuration leads to a maximum of %d threads being processed which"
+                + " heavily exceeds the available CPU resources (%d)."
+                + " It is recommended to lower the value of 'mlif.num_threads'!",
+                total_threads,
+                cpu_count,
+            )
+
+    def _process(self, run, until, submitted=None):
+        """Helper function to invoke the run."""
+        _trace_queued(run, until, submitted)
+        run.process(until=until, skip=self.skipped_stages, export=self.export)
+
+    def submit(self, executor, run, until):
+        """Submit a job which processes the given run until the given stage."""
+        submitted = time.time()
+        if self.executor in ["process_pool", "queue"]:
+            return executor.submit(_process_remote, run, until, self.skipped_stages, self.export, submitted=submitted)
+        return executor.submit(self._process, run, until, submitted=submitted)
+
+    def cancel(self, reason, workers):
+        """Stop processing further jobs and kill the subprocesses of the running ones."""
+        if self.cancelled:
+            return
+        self.cancelled = True
+        logger.warning("%s %s. Cancelling remaining runs...", self.prefix, reason)
+        for worker in workers:
+            worker.cancel()  # Only possible for jobs which are not running yet
+        num_killed = cancel_processes()
+        if num_killed > 0:
+            logger.debug("%s Killed %d subprocesses", self.prefix, num_killed)
+        if self._cancel_workers is not None:
+            self._cancel_workers()
+
+    def _check_failures(self, workers):
+        """Cancel the processing if the number of failed runs has reached max_failures."""
+        if self.max_failures and self.num_failures >= self.max_failures:
+            self.cancel(f"{self.num_failures} run(s) have failed", workers)
+
+    def _wait(self, workers):
+        """Wait for at least one job to complete. A KeyboardInterrupt cancels the processing."""
+        try:
+            done, _ = concurrent.futures.wait(workers, return_when=concurrent.futures.FIRST_COMPLETED)
+        except KeyboardInterrupt:
+            self.cancel("Interrupted by user", workers)
+            return []
+        return done
+
+    def _handle_result(self, run, worker):
+        """Collect the result of a single job. Returns False if the run has failed and None if it was cancelled."""
+        if worker.cancelled():
+            self.num_cancelled += 1
+            return None
+        try:
+            state = worker.result()
+            if state is not None:
+                run.update_state(state)
+        except Exception as e:
+            logger.exception(e)
+            logger.error("An exception was thrown by a worker during simulation")
+            run.failing = True
+        if run.failing and self.cancelled:
+            # Killed by the cancellation, the run can be resumed later
+            run.failing = False
+            self.num_cancelled += 1
+            return None
+        if run.failing:
+            self.num_failures += 1
+            failed_stage = RunStage(run.next_stage).name
+            self.stage_failures.setdefault(failed_stage, []).append(run.idx)
+            return False
+        return True
+
+    def _finish(self, run):
+        """Invoke the callback for a run which will not be processed any further."""
+        if self.callback is None:
+            return
+        try:
+            self.callback(run)
+        except Exception as e:  # The callback should not affect the processing of other runs
+            logger.exception(e)
+
+    def process_runs(self, executor):
+        """Process all stages of every run in a single job."""
+        pbar = None
+        if self.progress:
+            pbar = _init_progress(len(self.runs), msg="Processing all runs")
+        else:
+            logger.info(self.prefix + "Processing all stages")
+        costs = {run: self.predict(run, self.get_run_stages(run)) for run in self.runs}
+        remaining_cost = self.predicted_cost = sum(costs.values())
+        self._update_eta(pbar, remaining_cost)
+        # The executors process the jobs in the order of submission, hence the most expensive runs are started first
+        order = sorted(self.runs, key=lambda run: -costs[run])
+        workers = {self.submit(executor, run, self.until): run for run in order}
+        pending = set(workers)
+        while pending:
+            for worker in self._wait(pending):
+                pending.remove(worker)
+                run = workers[worker]
+                if self._handle_result(run, worker) is not None:
+                    self._finish(run)
+                self._check_failures(pending)
+                remaining_cost -= costs[run]
+                if pbar:
+                    self._update_eta(pbar, remaining_cost)
+                    pbar.update(1)
+        _close_progress(pbar)
+
+    def process_stages(self, executor):
+        """Process the stages of all runs without waiting for the other runs to finish a stage."""
+        pending = {}  # run index -> remaining stages
+        pbars = {}
+        for i, run in enumerate(self.runs):
+            if run.failing:
+                logger.warning("Skiping failed run %s", run.idx)
+                continue
+            stages = self.get_run_stages(run)
+            if len(stages) > 0:
+                pending[i] = stages
+        if self.progress:
+            for position, stage in enumerate(self.used_stages):
+                total = sum(stage in stages for stages in pending.values())
+                pbars[stage] = _init_progress(total, msg=f"Processing stage {stage.name}", position=position)
+        else:
+            logger.info("%s Processing stages %s", self.prefix, ", ".join(stage.name for stage in self.used_stages))
+
+        # Runs with the highest remaining cost are preferred to reduce the makespan. For runs with the same cost,
+        # those which are further advanced are preferred to get results (and free resources) as early as possible
+        costs = {i: self.predict(self.runs[i], stages) for i, stages in pending.items()}
+        remaining_cost = self.predicted_cost = sum(costs.values())
+        ready = [(-costs[i], -stages[0], i) for i, stages in pending.items()]
+        heapq.heapify(ready)
+        workers = {}
+        first_pbar = pbars[self.used_stages[0]] if len(pbars) > 0 else None
+        self._update_eta(first_pbar, remaining_cost)
+
+        def _submit():
+            while ready and len(workers) < self.num_workers and not self.cancelled:
+                _, _, i = heapq.heappop(ready)
+                stage = pending[i].pop(0)
+                workers[self.submit(executor, self.runs[i], stage)] = (i, stage)
+
+        _submit()
+        while workers:
+            for worker in self._wait(workers):
+                i, stage = workers.pop(worker)
+                if stage in pbars:
+                    pbars[stage].update(1)
+                success = self._handle_result(self.runs[i], worker)
+                self._check_failures(workers)
+                remaining_cost -= costs[i]
+                costs[i] = self.predict(self.runs[i], pending[i]) if success else 0.0
+                remaining_cost += costs[i]
+                self._update_eta(first_pbar, remaining_cost)
+                if success and len(pending[i]) > 0:
+                    heapq.heappush(ready, (-costs[i], -pending[i][0], i))
+                    continue
+                if success is not None:
+                    self._finish(self.runs[i])
+                if self.progress:
+                    # Remove the skipped stages of failed runs from the totals
+                    for remaining in pending[i]:
+                        pbars[remaining].total -= 1
+                        pbars[remaining].refresh()
+            _submit()
+        if self.cancelled:
+            self.num_cancelled += len(ready)
+        for pbar in pbars.values():
+            _close_progress(pbar)
+
+    def print_summary(self):
+        """Print a summary of failed runs grouped by stage."""
+        num_runs = len(self.runs)
+        if self.num_cancelled > 0:
+            logger.warning("%d runs have been cancelled and can be resumed later!", self.num_cancelled)
+        if self.num_failures == 0 and not self.cancelled:
+            logger.info("All runs completed successfuly!")
+        elif self.num_failures == num_runs:
+            logger.error("All runs have failed to complete!")
+        else:
+            num_success = num_runs - self.num_failures - self.num_cancelled
+            logger.warning("%d out or %d runs completed successfully!", num_success, num_runs)
+            summary = "\n".join(
+                [
+                    f"\t{stage}: \t{len(failed)} failed run(s): " + " ".join([str(idx) for idx in sorted(failed)])
+                    for stage, failed in self.stage_failures.items()
+                    if len(failed) > 0
+                ]
+            )
+            logger.info("Summary:\n%s", summary)
+
+    def create_executor(self):
+        """Create the pool of workers used to process the jobs."""
+        if self.executor == "process_pool":
+            start_method = multiprocessing.get_start_method()
+            if get_active_jobserver() is not None and start_method != "fork":
+                logger.warning("The jobserver is not available in worker processes using the '%s' method", start_method)
+            context = multiprocessing.get_context()
+            cancel_event = context.Event()
+            self._cancel_workers = cancel_event.set
+            return concurrent.futures.ProcessPoolExecutor(
+                self.num_workers, mp_context=context, initializer=_init_worker, initargs=(cancel_event,)
+            )
+        if self.executor == "queue":
+            queue = DirectoryQueue(self.queue_dir)
+            logger.info("%s Distributing jobs via %s", self.prefix, queue.directory)
+            executor = QueueExecutor(queue, timeout=self.queue_timeout, num_local_workers=self.num_local_workers)
+            self._cancel_workers = executor.cancel_running
+            return executor
+        self._cancel_workers = None
+        return concurrent.futures.ThreadPoolExecutor(self.num_workers)
+
+    def process(self):
+        """Process all runs. Returns True if none of the runs have failed."""
+        self.check_threads()
+        self.started_at = time.time()
+        reset_cancel()
+        try:
+            with self.create_executor() as executor:
+                if self.per_stage:
+                    self.process_stages(executor)
+                else:
+                    self.process_runs(executor)
+        finally:
+            reset_cancel()
+        if self.cost_func is not None:
+            logger.info(
+                "%s Predicted duration: %.1fs, actual duration: %.1fs",
+                self.prefix,
+                self.predicted_cost / self.num_workers,
+                time.time() - self.started_at,
+            )
+        self.print_summary()
+        return self.num_failures == 0 and not self.cancelled
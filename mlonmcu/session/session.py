@@ -18,23 +18,25 @@
 #
 """Definition of a MLonMCU Run which represents a set of benchmarks in a session."""
 import os
+import pickle
 import shutil
 import tempfile
-import multiprocessing
 from datetime import datetime
 from enum import Enum
 from pathlib import Path
-import concurrent.futures
-
-from tqdm import tqdm
 
 from mlonmcu.session.run import Run
 from mlonmcu.logging import get_logger
-from mlonmcu.report import Report
-from mlonmcu.config import filter_config
+from mlonmcu.report import Report, ReportWriter, check_report_fmt
+from mlonmcu.config import filter_config, str2bool
+from mlonmcu.setup.jobserver import use_jobserver
+from mlonmcu.trace import use_tracer, span
 
 from .postprocess.postprocess import SessionPostprocess
 from .run import RunStage
+from .schedule import SessionScheduler
+from .cache import StageCache
+from .history import CostHistory
 
 logger = get_logger()  # TODO: rename to get_mlonmcu_logger
 
@@ -53,9 +55,22 @@ class Session:
 
     DEFAULTS = {
         "report_fmt": "csv",
+        "report_streaming": True,  # Write the report rows of every run as soon as it is completed
+        "trace": False,  # Write a timeline of all stages and subprocesses to trace.json
+        "use_jobserver": True,
+        "num_jobs": None,  # Defaults to the number of cpu cores
+        "executor": "thread_pool",  # or process_pool, queue
+        "queue_dir": None,  # Defaults to a directory in the environments cache
+        "queue_timeout": 300,  # Seconds without a heartbeat before a job of a worker is put back into the queue
+        "queue_local_workers": 0,
+        "stage_cache": False,
+        "stage_cache_max_size": "10G",
+        "cost_history": True,  # Use the durations of previous runs to start the most expensive runs first
+        "max_failures": 0,  # Cancel the remaining runs after the given number of failed runs (0: disable)
+        "compact_runs": False,  # Only keep the report and artifact paths of finished runs in memory
     }
 
-    def __init__(self, label="", idx=None, archived=False, dir=None, config=None):
+    def __init__(self, label="", idx=None, archived=False, dir=None, config=None, cache_dir=None):
         self.timestamp = datetime.now().strftime("%Y%m%dT%H%M%S")
         self.label = (
             label if len(label) > 0 else ("unnamed" + "_" + self.timestamp)
@@ -79,12 +94,24 @@ class Session:
             self.dir = dir
             if not self.dir.is_dir():
                 self.dir.mkdir(parents=True)
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else self.dir / "cache"
+        self._stage_cache = None
+        self._cost_history = None
         self.runs_dir = self.dir / "runs"
         if not os.path.exists(self.runs_dir):
             os.mkdir(self.runs_dir)
         if not self.archived:
             self.open()
 
+    def __getstate__(self):
+        # Sessions are shipped to worker processes together with a single run, hence the other runs are omitted
+        state = self.__dict__.copy()
+        state["runs"] = []
+        state["tempdir"] = None
+        state["report"] = None
+        state["_cost_history"] = None
+        return state
+
     @property
     def prefix(self):
         """get prefix property."""
@@ -95,6 +122,84 @@ class Session:
         """get report_fmt property."""
         return str(self.config["report_fmt"])
 
+    @property
+    def report_streaming(self):
+        """get report_streaming property."""
+        value = self.config["report_streaming"]
+        return str2bool(value) if not isinstance(value, (bool, int)) else value
+
+    @property
+    def trace(self):
+        """get trace property."""
+        value = self.config["trace"]
+        return str2bool(value) if not isinstance(value, (bool, int)) else value
+
+    @property
+    def use_jobserver(self):
+        """get use_jobserver property."""
+        value = self.config["use_jobserver"]
+        return str2bool(value) if not isinstance(value, (bool, int)) else value
+
+    @property
+    def num_jobs(self):
+        """get num_jobs property."""
+        value = self.config["num_jobs"]
+        return int(value) if value is not None else None
+
+    @property
+    def executor(self):
+        """get executor property."""
+        return str(self.config["executor"])
+
+    @property
+    def queue_dir(self):
+        """get queue_dir property."""
+        value = self.config["queue_dir"]
+        return Path(value) if value is not None else self.cache_dir / "queue"
+
+    @property
+    def queue_timeout(self):
+        """get queue_timeout property."""
+        return float(self.config["queue_timeout"])
+
+    @property
+    def compact_runs(self):
+        """get compact_runs property."""
+        value = self.config["compact_runs"]
+        return str2bool(value) if not isinstance(value, (bool, int)) else value
+
+    @property
+    def max_failures(self):
+        """get max_failures property."""
+        return int(self.config["max_failures"])
+
+    @property
+    def queue_local_workers(self):
+        """get queue_local_workers property."""
+        return int(self.config["queue_local_workers"])
+
+    @property
+    def stage_cache(self):
+        """Get the cache for stage artifacts which is shared with other sessions (None if disabled)."""
+        value = self.config["stage_cache"]
+        enabled = str2bool(value) if not isinstance(value, (bool, int)) else value
+        if not enabled:
+            return None
+        if self._stage_cache is None:
+            self._stage_cache = StageCache(self.cache_dir / "stages", max_size=self.config["stage_cache_max_size"])
+        return self._stage_cache
+
+    @property
+    def cost_history(self):
+        """Get the history of stage durations which is shared with other sessions (None if disabled)."""
+        value = self.config["cost_history"]
+        enabled = str2bool(value) if not isinstance(value, (bool, int)) else value
+        if not enabled:
+            return None
+        if self._cost_history is None:
+            self._cost_history = CostHistory(self.cache_dir / "history.json")
+        return self._cost_history
+
     def create_run(self, *args, **kwargs):
         """Factory method to create a run and add it to this session."""
         idx = len(self.runs)
@@ -111,16 +216,58 @@ class Session:
     #  def update_run(self): # TODO TODO
     #      pass
 
+    def write_state_file(self):
+        """Persist the label and config of the session which are required to resume it later."""
+        state = {"label": self.label, "timestamp": self.timestamp, "config": self.config}
+        with open(self.dir / "session.pkl", "wb") as handle:
+            pickle.dump(state, handle)
+
+    def resume(self):
+        """Restore the runs of an archived session, so that the missing stages can be processed."""
+        state_file = self.dir / "session.pkl"
+        if state_file.is_file():
+            with open(state_file, "rb") as handle:
+                self.__dict__.update(pickle.load(handle))
+        runs = []
+        for name in sorted(os.listdir(self.runs_dir), key=lambda x: int(x) if x.isdigit() else -1):
+            run_file = self.runs_dir / name / "state" / "run.pkl"
+            if os.path.islink(self.runs_dir / name) or not run_file.is_file():
+                continue
+            try:
+                run = Run.from_file(run_file, session=self)
+            except Exception as e:
+                logger.warning("Unable to restore run %s: %s", name, e)
+                continue
+            run.archived = True  # Keeps the index and directory of the restored run
+            runs.append(run)
+        assert len(runs) > 0, f"No run of session {self.idx} can be restored"
+        num_pending = sum(run.next_stage < RunStage.DONE for run in runs)
+        logger.info("%sResuming session with %d runs (%d incomplete)", self.prefix, len(runs), num_pending)
+        self.runs = runs
+        self.archived = False
+        self.open()
+
     def get_reports(self):
         """Returns a full report which includes all runs in this session."""
         if self.report:
             return self.report
 
-        reports = [run.get_report() for run in self.runs]
+        reports = [self.get_run_report(run) for run in self.runs]
         merged = Report()
         merged.add(reports)
         return merged
 
+    def get_run_report(self, run):
+        """Returns the report of a single run. A minimal failing row is used if the report can not be generated."""
+        try:
+            return run.get_report()
+        except Exception as e:
+            logger.exception(e)
+            logger.error("%s Unable to generate the report of run %s", self.prefix, run.idx)
+        report = Report()
+        report.set(pre=[{"Session": self.idx, "Run": run.idx}], main=[], post=[{"Failing": True, "Reason": "report"}])
+        return report
+
     def enumerate_runs(self):
         """Update run indices."""
         # Find start index
@@ -154,167 +301,86 @@ class Session:
         context=None,
     ):
         """Process a runs in this session until a given stage."""
-
+        kwargs = {
+            "until": until,
+            "per_stage": per_stage,
+            "print_report": print_report,
+            "num_workers": num_workers,
+            "progress": progress,
+            "export": export,
+            "context": context,
+        }
+        if not self.trace:
+            return self._process_runs(**kwargs)
+        trace_file = self.dir / "trace.jsonl"
+        if trace_file.is_file():
+            trace_file.unlink()
+        with use_tracer(trace_file) as tracer:
+            with span("session", cat="session", session=self.idx, label=self.label):
+                success = self._process_runs(**kwargs)
+        tracer.export_chrome(self.dir / "trace.json")
+        logger.info("%sTrace written to %s", self.prefix, self.dir / "trace.json")
+        return success
+
+    def _process_runs(self, until, per_stage, print_report, num_workers, progress, export, context):
         # TODO: Add configurable callbacks for stage/run complete
 
+        check_report_fmt(self.report_fmt)  # Fail before processing any run
         self.enumerate_runs()
         self.report = None
-        assert num_workers > 0, "num_workers can not be < 1"
-        workers = []
-        # results = []
-        workers = []
-        pbar = None  # Outer progress bar
-        pbar2 = None  # Inner progress bar
-        num_runs = len(self.runs)
-        num_failures = 0
-        stage_failures = {}
-        worker_run_idx = []
-
-        def _init_progress(total, msg="Processing..."):
-            """Helper function to initialize a progress bar for the session."""
-            return tqdm(
-                total=total,
-                desc=msg,
-                ncols=100,
-                bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}s]",
-                leave=None,
-            )
-
-        def _update_progress(pbar, count=1):
-            """Helper function to update the progress bar for the session."""
-            pbar.update(count)
-
-        def _close_progress(pbar):
-            """Helper function to close the session progressbar, if available."""
-            if pbar:
-                pbar.close()
-
-        def _process(pbar, run, until, skip):
-            """Helper function to invoke the run."""
-            run.process(until=until, skip=skip, export=export)
-            if progress:
-                _update_progress(pbar)
-
-        def _join_workers(workers):
-            """Helper function to collect all worker threads."""
-            nonlocal num_failures
-            results = []
-            for i, w in enumerate(workers):
-                try:
-                    results.append(w.result())
-                except Exception as e:
-                    logger.exception(e)
-                    logger.error("An exception was thrown by a worker during simulation")
-                run_index = worker_run_idx[i]
-                run = self.runs[run_index]
-                if run.failing:
-                    num_failures += 1
-                    failed_stage = RunStage(run.next_stage).name
-                    if failed_stage in stage_failures:
-                        stage_failures[failed_stage].append(run_index)
-                    else:
-                        stage_failures[failed_stage] = [run_index]
-            if progress:
-                _close_progress(pbar)
-            return results
-
-        def _used_stages(runs, until):
-            """Determines the stages which are used by at least one run."""
-            used = []
-            for stage_index in list(range(RunStage.LOAD, until + 1)) + [RunStage.POSTPROCESS]:
-                stage = RunStage(stage_index)
-                if any(run.has_stage(stage) for run in runs):
-                    used.append(stage)
-            return used
-
-        used_stages = _used_stages(self.runs, until)
-        skipped_stages = [stage for stage in RunStage if stage not in used_stages]
-
-        with concurrent.futures.ThreadPoolExecutor(num_workers) as executor:
-            if per_stage:
-                if progress:
-                    pbar2 = _init_progress(len(used_stages), msg="Processing stages")
-                for stage in used_stages:
-                    run_stage = RunStage(stage).name
-                    if progress:
-                        pbar = _init_progress(len(self.runs), msg=f"Processing stage {run_stage}")
-                    else:
-                        logger.info("%s Processing stage %s", self.prefix, run_stage)
-                    for i, run in enumerate(self.runs):
-                        if i == 0:
-                            total_threads = min(len(self.runs), num_workers)
-                            cpu_count = multiprocessing.cpu_count()
-                            if (stage == RunStage.COMPILE) and run.compile_platform:
-                                total_threads *= run.compile_platform.num_threads
-                            if total_threads > 2 * cpu_count:
-                                if pbar2:
-                                    print()
-                                logger.warning(
-                                    "The chosen configuration leads to a maximum of %d threads being"
-                                    + " processed which heavily exceeds the available CPU resources (%d)."
-                                    + " It is recommended to lower the value of 'mlif.num_threads'!",
-                                    total_threads,
-                                    cpu_count,
-                                )
-                        if run.failing:
-                            logger.warning("Skiping stage '%s' for failed run", run_stage)
-                        else:
-                            worker_run_idx.append(i)
-                            workers.append(executor.submit(_process, pbar, run, until=stage, skip=skipped_stages))
-                    _join_workers(workers)
-                    workers = []
-                    worker_run_idx = []
-                    if progress:
-                        _update_progress(pbar2)
-                if progress:
-                    _close_progress(pbar2)
+        self.write_state_file()
+        for run in self.runs:
+            run.stage_times = {}  # Only record the stages processed in this session
+            if not (run.dir / "state" / "run.pkl").is_file():
+                run.write_state_file()  # Allows to resume runs which did not complete a single stage
+        history = self.cost_history
+        writer = None
+        if self.report_streaming:
+            writer = ReportWriter(self.dir)
+        compact = self.compact_runs
+
+        def _finish_run(run):
+            if writer is not None:
+                writer.append(self.get_run_report(run), key=run.idx)
+            if compact and (run.failing or run.next_stage == RunStage.DONE):
+                run.compact()
+
+        scheduler = SessionScheduler(
+            self.runs,
+            until=until,
+            per_stage=per_stage,
+            num_workers=num_workers,
+            progress=progress,
+            export=export,
+            prefix=self.prefix,
+            executor=self.executor,
+            queue_dir=self.queue_dir,
+            queue_timeout=self.queue_timeout,
+            num_local_workers=self.queue_local_workers,
+            callback=_finish_run if writer is not None or compact else None,
+            cost_func=history.predict if history is not None else None,
+            max_failures=self.max_failures,
+        )
+        with span("schedule", cat="session", executor=self.executor, num_workers=num_workers):
+            if self.use_jobserver:
+                # All processes spawned by the runs share a single pool of job tokens
+                with use_jobserver(self.num_jobs):
+                    success = scheduler.process()
             else:
-                if progress:
-                    pbar = _init_progress(len(self.runs), msg="Processing all runs")
-                else:
-                    logger.info(self.prefix + "Processing all stages")
-                for i, run in enumerate(self.runs):
-                    if i == 0:
-                        total_threads = min(len(self.runs), num_workers)
-                        cpu_count = multiprocessing.cpu_count()
-                        if (
-                            (until >= RunStage.COMPILE)
-                            and run.compile_platform is not None
-                            and run.compile_platform.name == "mlif"
-                        ):
-                            total_threads *= (
-                                run.compile_platform.num_threads
-                            )  # TODO: This should also be used for non-mlif platforms
-                        if total_threads > 2 * cpu_count:
-                            if pbar2:
-                                print()
-                            logger.warning(
-                                "The chosen configuration leads to a maximum of %d being processed which"
-                                + " heavily exceeds the available CPU resources (%d)."
-                                + " It is recommended to lower the value of 'mlif.num_threads'!",
-                                total_threads,
-                                cpu_count,
-                            )
-                    worker_run_idx.append(i)
-                    workers.append(executor.submit(_process, pbar, run, until=until, skip=skipped_stages))
-                _join_workers(workers)
-        if num_failures == 0:
-            logger.info("All runs completed successfuly!")
-        elif num_failures == num_runs:
-            logger.error("All runs have failed to complete!")
-        else:
-            num_success = num_runs - num_failures
-            logger.warning("%d out or %d runs completed successfully!", num_success, num_runs)
-            summary = "\n".join(
-                [
-                    f"\t{stage}: \t{len(failed)} failed run(s): " + " ".join([str(idx) for idx in failed])
-                    for stage, failed in stage_failures.items()
-                    if len(failed) > 0
-                ]
-            )
-            logger.info("Summary:\n%s", summary)
-
-        report = self.get_reports()
+                success = scheduler.process()
+        if history is not None:
+            for run in self.runs:
+                history.update(run)
+            history.save()
+
+        with span("report", cat="session"):
+            if writer is not None:
+                for run in self.runs:
+                    if run.idx not in writer:  # Not processed by the scheduler (e.g. already completed)
+                        writer.append(self.get_run_report(run), key=run.idx)
+                report = writer.read()
+            else:
+                report = self.get_reports()
         logger.info("Postprocessing session report")
         # Warning: currently we only support one instance of the same type of postprocess,
         # also it will be applied to all rows!
@@ -325,7 +391,8 @@ class Session:
                     if postprocess.name not in [p.name for p in session_postprocesses]:
                         session_postprocesses.append(postprocess)
         for postprocess in session_postprocesses:
-            artifacts = postprocess.post_session(report)
+            with span(postprocess.name, cat="postprocess", session=self.idx):
+                artifacts = postprocess.post_session(report)
             if artifacts is not None:
                 for artifact in artifacts:
                     # Postprocess has an artifact: write to disk!
@@ -341,7 +408,7 @@ class Session:
         if print_report:
             logger.info("Report:\n%s", str(report.df))
 
-        return num_failures == 0
+        return success
 
     def discard(self):
         """Discard a run and remove its directory."""
@@ -41,12 +41,17 @@ class TaskCache:
 
     def __init__(self):
         self._vars = {}
+        self._flags = {}  # name -> flag sets with an entry in the cache
+        self._matches = {}  # (name, flags) -> flag set of the best match (None if there is no match)
 
     def __repr__(self):
         return str(self._vars)
 
     def __setitem__(self, name, value):
         name = convert_key(name)
+        if name not in self._vars:
+            self._flags.setdefault(name[0], []).append(name[1])
+            self._matches = {}  # The new entry might be a better match for a previous lookup
         self._vars[name[0]] = value  # Holds latest value
         self._vars[name] = value
 
@@ -64,6 +69,9 @@ class TaskCache:
     def find_best_match(self, name: str, flags=[]) -> Any:
         """Utility whih tries to resolve the cache entry with the beste match.
 
+        The best match is the entry with the most flags which are all contained in the given flags. The result
+        is memoized for every combination of flags until a new entry is added to the cache.
+
         Parameters
         ----------
         name : str
@@ -71,38 +79,28 @@ class TaskCache:
         flags : list
             Optional flags used for the lookup.
         """
-        # print("find_best_match", name, flags)
-        keys = self._vars.keys()
-        # print("keys", keys)
-        matches = []
-        counts = []
-        for key in keys:
-            if not isinstance(key, tuple):
-                continue
-            assert len(key) == 2
-            name_, flags_ = key[0], key[1]
-            if name == name_:
-                count = 0
-                for flag in flags_:
-                    if flag not in flags:
-                        count = -1  # incompatible
-                        break
-                    count = count + 1
-                if count >= 0:
-                    matches.append(flags_)
-                    counts.append(count)
-        if len(counts) == 0:
+        key = (name, frozenset(flags))
+        if key not in self._matches:
+            self._matches[key] = self._lookup_best_flags(*key)
+        best = self._matches[key]
+        if best is None:
             raise RuntimeError("Unable to find a match in the cache")
+        return self._vars[name, best]
+
+    def _lookup_best_flags(self, name, flags):
+        matches = [flags_ for flags_ in self._flags.get(name, []) if flags_ <= flags]
+        if len(matches) == 0:
+            return None
+        counts = [len(flags_) for flags_ in matches]
         m = max(counts)
         assert counts.count(m) == 1, f"For the given set of flags, there are multiple cache matches for the name {name}"
-        idx = counts.index(m)
-        flag = matches[idx]
-        ret = self._vars[name, flag]
-        return ret
+        return matches[counts.index(m)]
 
     def read_from_file(self, filename, reset=True):
         if reset:
             self._vars = {}
+            self._flags = {}
+            self._matches = {}
         if not os.path.isfile(filename):
             raise RuntimeError(f"File not found: {filename}")
         cfg = configparser.ConfigParser()
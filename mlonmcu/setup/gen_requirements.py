@@ -129,6 +129,8 @@ REQUIREMENTS_BY_PIECE: RequirementsByPieceType = [
     ("moiopt", ("Requirements for moiopt", ["ortools"])),
     # Provide support for onnx.
     ("onnx", ("Requirements for onnx", ["onnx"])),
+    # Provide support for parquet reports.
+    ("parquet", ("Requirements for parquet reports", ["pyarrow"])),
     # Provide support for relay visualization.
     ("relay-visualization", ("Requirements for relay visualization", ["relayviz"])),
     # Provide support for tflite.
@@ -234,6 +236,7 @@ CONSTRAINTS = [
     ("pandas", None),
     ("prettytable", None),
     ("psutil", None),
+    ("pyarrow", None),
     ("pyelftools", None),
     ("pygdbmi", "<=0.9.0.2"),
     ("pyparsing", ">=2.0.3,<2.4.0"),
@@ -0,0 +1,146 @@
+#
+# Copyright (c) 2022 TUM Department of Electrical and Computer Engineering.
+#
+# This file is part of MLonMCU.
+# See https://github.com/tum-ei-eda/mlonmcu.git for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Implementation of a GNU make compatible jobserver which limits the total number of processes spawned in a session."""
+import os
+import select
+import multiprocessing
+from contextlib import contextmanager
+
+from mlonmcu.logging import get_logger
+
+logger = get_logger()
+
+_ACTIVE = None
+
+
+class JobServer:
+    """Pool of job tokens shared by all (sub-)processes of a session.
+
+    The tokens are stored in a pipe which can be passed to GNU make using the ``--jobserver-auth`` option. Every
+    process spawned by MLonMCU acquires a single token before it is started (this token takes the role of the
+    implicit token of a make process). Additional tokens are drawn from the pipe directly by make.
+
+    The read end of the pipe is non-blocking, as a token signalled by select can be taken by another thread or by a
+    make process before it is read.
+    """
+
+    TOKEN = b"+"
+
+    def __init__(self, num_jobs=None):
+        self.num_jobs = num_jobs if num_jobs else multiprocessing.cpu_count()
+        assert self.num_jobs > 0, "A jobserver needs at least a single token"
+        self.read_fd, self.write_fd = os.pipe()
+        os.write(self.write_fd, self.TOKEN * self.num_jobs)
+        os.set_blocking(self.read_fd, False)
+
+    def __repr__(self):
+        return f"JobServer(num_jobs={self.num_jobs})"
+
+    def acquire(self, block=True):
+        """Take a single token from the pool. Returns False if no token is available in the non-blocking case."""
+        while True:
+            try:
+                token = os.read(self.read_fd, 1)
+            except InterruptedError:
+                continue
+            except BlockingIOError:
+                if not block:
+                    return False
+                select.select([self.read_fd], [], [])
+                continue
+            assert len(token) == 1, "Jobserver pipe was closed"
+            return True
+
+    def release(self, count=1):
+        """Return tokens to the pool."""
+        if count > 0:
+            os.write(self.write_fd, self.TOKEN * count)
+
+    def acquire_many(self, max_jobs):
+        """Block until at least one token is available and take up to max_jobs tokens. Returns the number of tokens."""
+        self.acquire()
+        count = 1
+        while count < max_jobs and self.acquire(block=False):
+            count += 1
+        return count
+
+    @contextmanager
+    def slots(self, max_jobs=1):
+        """Context manager which holds up to max_jobs tokens while a process is running."""
+        count = self.acquire_many(max_jobs)
+        try:
+            yield count
+        finally:
+            self.release(count)
+
+    @property
+    def makeflags(self):
+        """Get the MAKEFLAGS which allow GNU make to use this jobserver."""
+        return f" -j --jobserver-auth={self.read_fd},{self.write_fd}"
+
+    def get_popen_kwargs(self, env=None):
+        """Return the Popen arguments which pass the jobserver to a child process."""
+        env = env.copy() if env is not None else os.environ.copy()
+        env["MAKEFLAGS"] = self.makeflags
+        env.pop("MFLAGS", None)
+        return {"env": env, "pass_fds": (self.read_fd, self.write_fd)}
+
+    def close(self):
+        """Close the underlying pipe."""
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+
+
+def get_active_jobserver():
+    """Return the jobserver of the currently processed session or None."""
+    return _ACTIVE
+
+
+@contextmanager
+def use_jobserver(num_jobs=None):
+    """Context manager which creates a jobserver and activates it for all subprocesses spawned by MLonMCU."""
+    global _ACTIVE
+    if os.name != "posix":
+        logger.warning("The jobserver is only supported on POSIX systems")
+        yield None
+        return
+    assert _ACTIVE is None, "Only a single jobserver can be active at a time"
+    server = JobServer(num_jobs)
+    logger.debug("Using jobserver with %d tokens", server.num_jobs)
+    _ACTIVE = server
+    try:
+        yield server
+    finally:
+        _ACTIVE = None
+        server.close()
+
+
+@contextmanager
+def job_slots(max_jobs=1, **kwargs):
+    """Hold tokens of the active jobserver (if any) while spawning a process.
+
+    Yields the number of acquired tokens together with the Popen keyword arguments to be used for the process.
+    """
+    server = get_active_jobserver()
+    if server is None:
+        yield max_jobs, kwargs
+        return
+    with server.slots(max_jobs) as count:
+        kwargs.update(server.get_popen_kwargs(kwargs.get("env")))
+        yield count, kwargs
@@ -17,10 +17,15 @@
 # limitations under the License.
 #
 import os
+import codecs
 import signal
 import sys
+import time
+import threading
 import multiprocessing
 import subprocess
+import contextlib
+from contextlib import contextmanager
 
 # import logging
 import tarfile
@@ -34,9 +39,139 @@ from git import Repo
 from tqdm import tqdm
 
 from mlonmcu import logging
+from mlonmcu.setup.jobserver import get_active_jobserver, job_slots
+from mlonmcu.trace import span, add_rusage, wait_process
 
 logger = logging.get_logger()
 
+_processes = set()  # Process groups started by exec_getout/execute which have not exited yet
+_processes_lock = threading.Lock()
+_cancelled = threading.Event()
+_deadlines = threading.local()
+
+
+class ProcessTimeoutError(TimeoutError):
+    """Raised if a subprocess was killed because it exceeded its timeout.
+
+    The output which was captured before the process was killed is available via the output attribute.
+    """
+
+    def __init__(self, args, timeout, output=None):
+        super().__init__(f"The process did not finish within {timeout}s and was killed! (CMD: `{' '.join(args)}`)")
+        self.cmd = args
+        self.timeout = timeout
+        self.output = output
+
+
+class ProcessCancelledError(RuntimeError):
+    """Raised if a subprocess was killed (or not started at all) because the session was cancelled."""
+
+
+@contextmanager
+def deadline(timeout):
+    """Limit the wall time of all subprocesses started by the current thread within this context.
+
+    The remaining time is used as timeout for every subprocess. Nested deadlines can only shorten the limit.
+    """
+    if timeout is None:
+        yield
+        return
+    previous = getattr(_deadlines, "value", None)
+    new = time.time() + timeout
+    _deadlines.value = new if previous is None else min(previous, new)
+    try:
+        yield
+    finally:
+        _deadlines.value = previous
+
+
+def get_timeout(timeout=None):
+    """Returns the effective timeout of a subprocess in seconds, taking the deadline of the thread into account."""
+    value = getattr(_deadlines, "value", None)
+    if value is None:
+        return timeout
+    remaining = max(value - time.time(), 0)
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+def kill_process_group(process, sig=signal.SIGKILL):
+    """Send a signal to all processes in the process group of a subprocess started via popen_group."""
+    if process.returncode is not None:
+        return
+    try:
+        os.killpg(process.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def cancel_processes():
+    """Kill all running subprocesses and prevent new ones from being started until reset_cancel is called."""
+    _cancelled.set()
+    with _processes_lock:
+        processes = list(_processes)
+    for process in processes:
+        kill_process_group(process)
+    return len(processes)
+
+
+def reset_cancel():
+    """Allow new subprocesses to be started after cancel_processes was called."""
+    _cancelled.clear()
+
+
+def is_cancelled():
+    """Check whether cancel_processes was called."""
+    return _cancelled.is_set()
+
+
+@contextmanager
+def popen_group(args, timeout=None, **kwargs):
+    """Start a subprocess in a new process group which can be killed as a whole.
+
+    The group is killed if the timeout (see get_timeout) expires, if an exception (including KeyboardInterrupt)
+    is raised while waiting for the process or if cancel_processes is called. The timed_out attribute of the
+    yielded process tells whether the timeout has expired.
+    """
+    if _cancelled.is_set():
+        raise ProcessCancelledError("The session was cancelled")
+    timeout = get_timeout(timeout)
+    process = subprocess.Popen(args, start_new_session=True, **kwargs)
+    process.timeout = timeout
+    process.timed_out = False
+    timer = None
+    if timeout is not None:
+
+        def _expire():
+            process.timed_out = True
+            kill_process_group(process)
+
+        timer = threading.Timer(timeout, _expire)
+        timer.daemon = True
+        timer.start()
+    with _processes_lock:
+        _processes.add(process)
+    try:
+        yield process
+    except BaseException:
+        kill_process_group(process)
+        raise
+    finally:
+        if timer is not None:
+            timer.cancel()
+        with _processes_lock:
+            _processes.discard(process)
+        if process.returncode is None:
+            kill_process_group(process)
+            process.wait()
+
+
+def check_process(process, output=None):
+    """Raise an exception if a process started via popen_group was killed due to a timeout or a cancellation."""
+    if process.timed_out:
+        raise ProcessTimeoutError([str(arg) for arg in process.args], process.timeout, output=output)
+    if process.returncode != 0 and _cancelled.is_set():
+        raise ProcessCancelledError("The session was cancelled")
+
 
 def makeFlags(*args):
     """Resolve tuple-like arguments to a list of string.
@@ -101,7 +236,112 @@ def exec(*args, **kwargs):
     subprocess.run([i for i in args], **kwargs, check=True)
 
 
-def exec_getout(*args, live: bool = False, print_output: bool = True, handle_exit=None, prefix="", **kwargs) -> str:
+def run_process(
+    args,
+    line_callback=None,
+    output_file=None,
+    capture: bool = True,
+    handle_exit=None,
+    timeout=None,
+    chunk_size: int = 65536,
+    **kwargs,
+):
+    """Run a subprocess and stream its (combined) stdout and stderr until it exits.
+
+    The output is read in chunks while blocking on the pipe, hence waiting for a process does not consume any CPU
+    time. Large outputs are collected in a list of chunks and joined once at the end.
+
+    Parameters
+    ----------
+    args
+        The command to be executed.
+    line_callback : Callable
+        Function called with every line of the output (without the trailing newline). If it returns True, the
+        process group is killed and no further output is processed.
+    output_file : Path
+        Write the raw output to the given file.
+    capture : bool
+        Return the output as string. Disable this to avoid holding large outputs in memory.
+    handle_exit : Callable
+        Function to post-process the exit code.
+    timeout : float
+        Kill the process (group) after the given number of seconds and raise a ProcessTimeoutError.
+    chunk_size : int
+        Maximum number of bytes read from the pipe at once.
+
+    Returns
+    -------
+    exit_code : int
+        The (handled) exit code of the process.
+    output : str
+        The text printed by the process (None if capture is disabled).
+    """
+    args = [str(arg) for arg in args]
+    logger.debug("- Executing: " + str(args))
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    chunks = []
+    partial = []
+
+    def _get_output():
+        return "".join(chunks) if capture else None
+
+    def _handle_text(text):
+        if not text:
+            return False
+        if capture:
+            chunks.append(text)
+        if line_callback is None:
+            return False
+        lines = text.split("\n")
+        if len(lines) == 1:
+            partial.append(text)
+            return False
+        partial.append(lines[0])
+        lines[0] = "".join(partial)
+        partial.clear()
+        if lines[-1]:
+            partial.append(lines[-1])
+        return any(line_callback(line) for line in lines[:-1])
+
+    with span(Path(args[0]).name, cat="subprocess", argv=args) as trace_args:
+        with contextlib.ExitStack() as stack:
+            out_file = stack.enter_context(open(output_file, "wb")) if output_file else None
+            process = stack.enter_context(
+                popen_group(args, timeout=timeout, **kwargs, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            )
+            fd = process.stdout.fileno()
+            try:
+                stop = False
+                while not stop:
+                    data = os.read(fd, chunk_size)
+                    if not data:
+                        stop = _handle_text(decoder.decode(b"", final=True))
+                        if partial and line_callback is not None and not stop:
+                            line_callback("".join(partial))
+                        break
+                    if out_file:
+                        out_file.write(data)
+                    stop = _handle_text(decoder.decode(data))
+                if stop:
+                    kill_process_group(process)
+            except KeyboardInterrupt:
+                logger.debug("Interrupted subprocess. Killing process group...")
+                raise
+            process.stdout.close()
+            # Do not use communicate() as it reaps the process before the resource usage can be queried
+            exit_code, rusage = wait_process(process)
+        add_rusage(trace_args, rusage)
+        trace_args["exit_code"] = exit_code
+        output = _get_output()
+        check_process(process, output=output)
+        if handle_exit is not None:
+            exit_code = handle_exit(exit_code)
+    return exit_code, output
+
+
+def exec_getout(
+    *args, live: bool = False, print_output: bool = True, handle_exit=None, prefix="", timeout=None, **kwargs
+) -> str:
     """Execute a process with the given args and using the given kwards as Popen arguments and return the output.
 
     Parameters
@@ -112,58 +352,31 @@ def exec_getout(*args, live: bool = False, print_output: bool = True, handle_exi
         If the stdout should be updated in real time.
     print_output : bool
         Print the output at the end on non-live mode.
+    prefix : str
+        Prefix for the printed lines.
+    timeout : float
+        Kill the process (group) after the given number of seconds and raise a ProcessTimeoutError.
 
     Returns
     -------
     output
         The text printed to the command line.
     """
-    logger.debug("- Executing: " + str(args))
-    outStr = ""
-    if live:
-        process = subprocess.Popen([i for i in args], **kwargs, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        try:
-            for line in process.stdout:
-                new_line = prefix + line.decode(errors="replace")
-                outStr = outStr + new_line
-                print(new_line.replace("\n", ""))
-            exit_code = None
-            while exit_code is None:
-                exit_code = process.poll()
-            if handle_exit is not None:
-                exit_code = handle_exit(exit_code)
-            assert exit_code == 0, "The process returned an non-zero exit code {}! (CMD: `{}`)".format(
-                exit_code, " ".join(list(map(str, args)))
-            )
-        except KeyboardInterrupt:
-            logger.debug("Interrupted subprocess. Sending SIGINT signal...")
-            pid = process.pid
-            os.kill(pid, signal.SIGINT)
 
-    else:
-        try:
-            p = subprocess.Popen([i for i in args], **kwargs, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-            outStr = p.communicate()[0].decode(errors="replace")
-            exit_code = p.poll()
-            # outStr = p.stdout.decode(errors="replace")
-            if print_output:
-                logger.debug(prefix + outStr)
-            if handle_exit is not None:
-                exit_code = handle_exit(exit_code)
-            if exit_code != 0:
-                logger.error(outStr)
-            assert exit_code == 0, "The process returned an non-zero exit code {}! (CMD: `{}`)".format(
-                exit_code, " ".join(list(map(str, args)))
-            )
-        except KeyboardInterrupt:
-            logger.debug("Interrupted subprocess. Sending SIGINT signal...")
-            pid = p.pid
-            os.kill(pid, signal.SIGINT)
-        except subprocess.CalledProcessError as e:
-            outStr = e.output.decode(errors="replace")
-            logger.error(outStr)
-            raise e
+    def _print(line):
+        print(prefix + line)
 
+    exit_code, outStr = run_process(
+        args, line_callback=_print if live else None, handle_exit=handle_exit, timeout=timeout, **kwargs
+    )
+    if not live:
+        if print_output:
+            logger.debug(prefix + outStr)
+        if exit_code != 0:
+            logger.error(outStr)
+    assert exit_code == 0, "The process returned an non-zero exit code {}! (CMD: `{}`)".format(
+        exit_code, " ".join(list(map(str, args)))
+    )
     return outStr
 
 
@@ -257,11 +470,18 @@ def make(*args, threads=multiprocessing.cpu_count(), use_ninja=False, cwd=None,
     if isinstance(cwd, Path):
         cwd = str(cwd.resolve())
     # TODO: make sure that ninja is installed?
-    extraArgs = []
     tool = "ninja" if use_ninja else "make"
-    extraArgs.append("-j" + str(threads))
-    cmd = [tool] + extraArgs + list(args)
-    return exec_getout(*cmd, cwd=cwd, print_output=False, **kwargs)
+    server = get_active_jobserver()
+    if server is not None and not use_ninja:
+        # Make draws additional job tokens from the session-wide jobserver on its own
+        with job_slots(1, **kwargs) as (_, kwargs):
+            cmd = [tool] + list(args)
+            return exec_getout(*cmd, cwd=cwd, print_output=False, **kwargs)
+    with job_slots(threads, **kwargs) as (threads, kwargs):
+        extraArgs = []
+        extraArgs.append("-j" + str(threads))
+        cmd = [tool] + extraArgs + list(args)
+        return exec_getout(*cmd, cwd=cwd, print_output=False, **kwargs)
 
 
 def cmake(src, *args, debug=False, use_ninja=False, cwd=None, **kwargs):
@@ -20,17 +20,19 @@
 
 import subprocess
 import argparse
+from pathlib import Path
 from typing import List, Callable
 
 from mlonmcu.cli.helper.parse import extract_feature_names, extract_config
 from mlonmcu.feature.type import FeatureType
 from mlonmcu.feature.features import get_available_features
 from mlonmcu.logging import get_logger
+from mlonmcu.setup.utils import popen_group, check_process, run_process, ProcessTimeoutError
+from mlonmcu.trace import span
 
 logger = get_logger()
 
 
-# TODO: merge together with mlonmcu.setup.utils.exec_getout
 def execute(
     *args: List[str],
     ignore_output: bool = False,
@@ -38,6 +40,9 @@ def execute(
     print_func: Callable = print,
     handle_exit=None,
     err_func: Callable = logger.error,
+    timeout: float = None,
+    line_callback: Callable = None,
+    parser=None,
     **kwargs,
 ) -> str:
     """Wrapper for running a program in a subprocess.
@@ -54,6 +59,14 @@ def execute(
         Function which should be used to print sysout messages.
     err_func : Callable
         Function which should be used to print errors.
+    timeout : float
+        Kill the process (group) after the given number of seconds and raise a ProcessTimeoutError.
+    line_callback : Callable
+        Function called with every line of the output while the process is running. If it returns True, the process
+        is killed.
+    parser : OutputParser
+        Process the lines of the output while the process is running (see mlonmcu.target.matcher). Only the lines
+        which were not consumed by the parser are returned (or attached to the ProcessTimeoutError).
     kwargs: dict
         Arbitrary keyword arguments passed through to the subprocess.
 
@@ -62,44 +75,49 @@ def execute(
     out : str
         The command line output of the command
     """
-    logger.debug("- Executing: %s", str(args))
     if ignore_output:
-        assert not live
-        subprocess.run(args, **kwargs, check=True)
+        assert not live and line_callback is None and parser is None
+        logger.debug("- Executing: %s", str(args))
+        with span(Path(str(args[0])).name, cat="subprocess", argv=[str(arg) for arg in args]):
+            with popen_group(args, timeout=timeout, **kwargs) as process:
+                exit_code = process.wait()
+                check_process(process)
+                if exit_code != 0:
+                    raise subprocess.CalledProcessError(exit_code, args)
         return None
 
-    out_str = ""
-    if live:
-        with subprocess.Popen(
+    def _handle_line(line):
+        if live:
+            print_func(line)
+        if parser is not None:
+            parser.feed(line)
+        if line_callback is not None:
+            return line_callback(line)
+        return False
+
+    try:
+        exit_code, out_str = run_process(
             args,
+            line_callback=_handle_line if (live or line_callback is not None or parser is not None) else None,
+            capture=parser is None,
+            handle_exit=handle_exit,
+            timeout=timeout,
             **kwargs,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-        ) as process:
-            for line in process.stdout:
-                new_line = line.decode(errors="replace")
-                out_str = out_str + new_line
-                print_func(new_line.replace("\n", ""))
-            exit_code = None
-            while exit_code is None:
-                exit_code = process.poll()
-            if handle_exit is not None:
-                exit_code = handle_exit(exit_code)
-            assert exit_code == 0, "The process returned an non-zero exit code {}! (CMD: `{}`)".format(
-                exit_code, " ".join(list(map(str, args)))
-            )
-    else:
-        p = subprocess.Popen([i for i in args], **kwargs, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        out_str = p.communicate()[0].decode(errors="replace")
-        exit_code = p.poll()
+        )
+    except ProcessTimeoutError as exc:
+        if parser is not None:
+            # The output is not captured if a parser is used, hence keep the lines which were not consumed
+            exc.output = parser.output
+        raise
+    if parser is not None:
+        out_str = parser.output
+    if not live:
         print_func(out_str)
-        if handle_exit is not None:
-            exit_code = handle_exit(exit_code)
         if exit_code != 0:
             err_func(out_str)
-        assert exit_code == 0, "The process returned an non-zero exit code {}! (CMD: `{}`)".format(
-            exit_code, " ".join(list(map(str, args)))
-        )
+    assert exit_code == 0, "The process returned an non-zero exit code {}! (CMD: `{}`)".format(
+        exit_code, " ".join(list(map(str, args)))
+    )
 
     return out_str
 
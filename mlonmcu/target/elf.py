@@ -23,6 +23,7 @@
 # import sys
 import csv
 import argparse
+import numpy as np
 from elftools.elf import elffile
 
 from mlonmcu.logging import get_logger
@@ -170,6 +171,36 @@ def parseElf(inFile):
     return m
 
 
+def get_functions(inFile):
+    """Build a sorted interval index of the function symbols of an ELF file (filename or file object).
+
+    Returns the start addresses, end addresses (exclusive) and names of the functions, sorted by start address.
+    Overlapping symbols (aliases) are only kept once.
+    """
+    def _helper(f):
+        e = elffile.ELFFile(f)
+        symtab = e.get_section_by_name(".symtab")
+        assert symtab is not None, "The ELF file does not contain a symbol table"
+        functions = {}
+        for sym in symtab.iter_symbols():
+            if sym["st_info"]["type"] != "STT_FUNC" or sym["st_size"] == 0:
+                continue
+            start = sym["st_value"] & ~1  # Clear the thumb bit (ARM)
+            if start not in functions or sym["st_size"] > functions[start][0]:
+                functions[start] = (sym["st_size"], sym.name)
+        return functions
+
+    if hasattr(inFile, "read"):
+        functions = _helper(inFile)
+    else:
+        with open(inFile, "rb") as f:
+            functions = _helper(f)
+    starts = np.array(sorted(functions), dtype=np.uint64)
+    ends = np.array([start + functions[start][0] for start in sorted(functions)], dtype=np.uint64)
+    names = [functions[start][1] for start in sorted(functions)]
+    return starts, ends, names
+
+
 def printSz(sz, unknown_msg=""):
     """Helper function for printing file sizes."""
     if sz is None:
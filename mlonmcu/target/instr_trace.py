@@ -0,0 +1,187 @@
+#
+# Copyright (c) 2022 TUM Department of Electrical and Computer Engineering.
+#
+# This file is part of MLonMCU.
+# See https://github.com/tum-ei-eda/mlonmcu.git for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Compact binary format for instruction traces.
+
+A trace is stored as uncompressed .npz archive with two members:
+
+- trace.npy: Structured array with the program counter, the encoding and the mnemonic id of every instruction
+  (see TRACE_DTYPE, 32-bit program counters are used if possible).
+- names.npy: String table which maps the mnemonic ids to the names of the instructions.
+
+Since the members are not compressed, the trace can be memory-mapped (see load_instruction_trace).
+"""
+
+import io
+import os
+import struct
+import shutil
+import tempfile
+import zipfile
+
+import numpy as np
+
+from mlonmcu.artifact import Artifact, ArtifactFormat
+from .matcher import LineMatcher
+
+TRACE_DTYPE = np.dtype([("pc", "<u8"), ("encoding", "<u4"), ("mnemonic", "<u2")])  # Packed: 14 bytes per entry
+TRACE_DTYPE_32 = np.dtype([("pc", "<u4"), ("encoding", "<u4"), ("mnemonic", "<u2")])  # Used if all PCs fit in 32 bits
+
+
+class InstructionTraceWriter:
+    """Write an instruction trace incrementally without holding it in memory."""
+
+    def __init__(self, filename, chunk_size=65536):
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self.names = {}
+        self.count = 0
+        self.max_pc = 0
+        self._pcs = []
+        self._encodings = []
+        self._ids = []
+        # Staged next to the archive, as the temporary directory might be held in memory (tmpfs)
+        self._data = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(filename)))
+
+    def append(self, pc, encoding, name):
+        """Add a single executed instruction."""
+        idx = self.names.get(name)
+        if idx is None:
+            idx = len(self.names)
+            self.names[name] = idx
+        self._pcs.append(pc)
+        self._encodings.append(encoding)
+        self._ids.append(idx)
+        if len(self._ids) >= self.chunk_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._ids:
+            return
+        chunk = np.empty(len(self._ids), dtype=TRACE_DTYPE)
+        chunk["pc"] = self._pcs
+        chunk["encoding"] = self._encodings
+        chunk["mnemonic"] = self._ids
+        self.max_pc = max(self.max_pc, int(chunk["pc"].max()))
+        self._data.write(chunk.tobytes())
+        self.count += len(chunk)
+        self._pcs, self._encodings, self._ids = [], [], []
+
+    def close(self):
+        """Write the archive."""
+        self._flush()
+        dtype = TRACE_DTYPE_32 if self.max_pc < 2**32 else TRACE_DTYPE
+        header = {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (self.count,)}
+        with zipfile.ZipFile(self.filename, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+            with archive.open("trace.npy", "w", force_zip64=True) as handle:
+                np.lib.format.write_array_header_2_0(handle, header)
+                self._data.seek(0)
+                if dtype == TRACE_DTYPE:
+                    shutil.copyfileobj(self._data, handle)
+                else:
+                    while True:
+                        data = self._data.read(self.chunk_size * TRACE_DTYPE.itemsize)
+                        if not data:
+                            break
+                        handle.write(np.frombuffer(data, dtype=TRACE_DTYPE).astype(dtype).tobytes())
+            with archive.open("names.npy", "w") as handle:
+                names = sorted(self.names, key=self.names.get)
+                np.lib.format.write_array(handle, np.array(names, dtype=str))
+        self._data.close()
+
+
+def _memmap_member(filename, info):
+    with open(filename, "rb") as handle:
+        # The local file header has a fixed size of 30 bytes followed by the file name and the extra field
+        handle.seek(info.header_offset)
+        local_header = handle.read(30)
+        name_len, extra_len = struct.unpack("<HH", local_header[26:30])
+        handle.seek(info.header_offset + 30 + name_len + extra_len)
+        version = np.lib.format.read_magic(handle)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(handle)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(handle)
+        offset = handle.tell()
+    if shape[0] == 0:
+        return np.empty(shape, dtype=dtype)  # Empty files can not be mapped
+    return np.memmap(filename, dtype=dtype, mode="r", offset=offset, shape=shape)
+
+
+def load_instruction_trace(source, mmap=True):
+    """Load an instruction trace written by InstructionTraceWriter.
+
+    Parameters
+    ----------
+    source : Path or bytes
+        The filename of the archive or its raw data.
+    mmap : bool
+        Memory-map the trace instead of reading it (only if a filename is given).
+
+    Returns
+    -------
+    trace : np.ndarray
+        Structured array (see TRACE_DTYPE and TRACE_DTYPE_32).
+    names : np.ndarray
+        The names of the instructions indexed by trace["mnemonic"].
+    """
+    is_file = not isinstance(source, bytes)
+    with zipfile.ZipFile(source if is_file else io.BytesIO(source)) as archive:
+        with archive.open("names.npy") as handle:
+            names = np.lib.format.read_array(handle)
+        info = archive.getinfo("trace.npy")
+        if mmap and is_file and info.compress_type == zipfile.ZIP_STORED:
+            trace = _memmap_member(source, info)
+        else:
+            with archive.open("trace.npy") as handle:
+                trace = np.lib.format.read_array(handle)
+    return trace, names
+
+
+class InstructionTraceMatcher(LineMatcher):
+    """Convert the matching lines into a binary instruction trace while the process is running.
+
+    The expression needs the named groups pc (hexadecimal), encoding and name.
+    """
+
+    def __init__(self, name, expr, file, encoding_base=16, flags=None):
+        super().__init__(name, expr, consume=True, file=file, flags=flags)
+        self.encoding_base = encoding_base
+        self.writer = None
+
+    def open(self, log_dir):
+        super().open(log_dir)
+        self.handle.close()  # Only the unique filename is used
+        self.writer = InstructionTraceWriter(self.path)
+        self.handle = self.writer  # Matching lines are passed to write()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            self.handle = None
+
+    def write(self, match, line):
+        pc = int(match.group("pc"), 16)
+        encoding = int(match.group("encoding"), self.encoding_base)
+        self.writer.append(pc, encoding, match.group("name"))
+
+    def get_artifact(self):
+        if self.path is None:
+            return None
+        return Artifact(self.file, file=self.path, fmt=ArtifactFormat.RAW, flags=self.flags)
@@ -0,0 +1,169 @@
+#
+# Copyright (c) 2022 TUM Department of Electrical and Computer Engineering.
+#
+# This file is part of MLonMCU.
+# See https://github.com/tum-ei-eda/mlonmcu.git for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Streaming extraction of metrics and logs from the output of a target."""
+
+import os
+import re
+import copy
+import tempfile
+from pathlib import Path
+
+from mlonmcu.artifact import Artifact, ArtifactFormat
+
+
+class LineMatcher:
+    """Match every line of the output of a target against a regular expression while the process is running.
+
+    Parameters
+    ----------
+    name : str
+        Used to look up the matches in the OutputParser.
+    expr : str
+        Regular expression which is searched in every line.
+    multiple : bool
+        Collect all matches instead of only the first one.
+    consume : bool
+        Remove the matching lines from the output returned by the OutputParser.
+    file : str
+        Write the matching lines to a file with the given name and provide it as artifact.
+    flags : list
+        Flags of the generated artifact.
+    metrics_func : Callable
+        Function called with the list of matches and the metrics of the execution to add custom metrics.
+    """
+
+    def __init__(self, name, expr, multiple=False, consume=False, file=None, flags=None, metrics_func=None):
+        self.name = name
+        self.expr = re.compile(expr)
+        self.multiple = multiple or consume or file is not None
+        self.consume = consume
+        self.file = file
+        self.flags = flags
+        self.metrics_func = metrics_func
+        self.matches = []
+        self.handle = None
+        self.path = None
+
+    def open(self, log_dir):
+        """Reset the state and create the file for the matching lines (if enabled)."""
+        self.matches = []
+        if self.file:
+            # Concurrent executions must not write to the same file
+            fd, path = tempfile.mkstemp(prefix=f"{self.file}.", dir=log_dir)
+            self.path = Path(path)
+            self.handle = os.fdopen(fd, "w", encoding="utf-8")
+
+    def close(self):
+        """Finish writing the file."""
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+    def write(self, match, line):
+        """Store a matching line in the file."""
+        self.handle.write(line + "\n")
+
+    def feed(self, line):
+        """Process a single line. Returns True if the line should be removed from the output."""
+        if self.matches and not self.multiple:
+            return False  # Only the first match is relevant
+        match = self.expr.search(line)
+        if match is None:
+            return False
+        if self.handle is not None:
+            self.write(match, line)
+        else:
+            self.matches.append(match)
+        return self.consume
+
+    def get_artifact(self):
+        """Get an artifact for the written file (None if no file was written)."""
+        if self.path is None:
+            return None
+        return Artifact(self.file, file=self.path, fmt=ArtifactFormat.TEXT, flags=self.flags)
+
+    @property
+    def match(self):
+        """Get the first match (or None)."""
+        return self.matches[0] if self.matches else None
+
+
+class OutputParser:
+    """Dispatch the lines of the output of a target to a set of matchers.
+
+    Lines which are consumed by a matcher are not kept in memory. The matchers are copied, hence the same
+    matchers can be used for several (concurrent) executions.
+
+    Parameters
+    ----------
+    matchers : list
+        The LineMatcher instances to be used.
+    log_dir : Path
+        Directory where the files written by the matchers are created.
+    """
+
+    def __init__(self, matchers, log_dir=None):
+        self.matchers = [copy.copy(matcher) for matcher in matchers]
+        self.log_dir = Path(log_dir) if log_dir is not None else Path(tempfile.gettempdir())
+        self.lines = []
+
+    def __enter__(self):
+        for matcher in self.matchers:
+            matcher.open(self.log_dir)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for matcher in self.matchers:
+            matcher.close()
+
+    def feed(self, line):
+        """Process a single line of the output (without the trailing newline)."""
+        keep = True
+        for matcher in self.matchers:
+            if matcher.feed(line):
+                keep = False
+        if keep:
+            self.lines.append(line)
+
+    @property
+    def output(self):
+        """Get the lines of the output which were not consumed by any matcher."""
+        return "".join(line + "\n" for line in self.lines)
+
+    def get(self, name, group=1, default=None):
+        """Get a group of the first match of the given matcher."""
+        for matcher in self.matchers:
+            if matcher.name == name and matcher.match is not None:
+                return matcher.match.group(group)
+        return default
+
+    def get_all(self, name):
+        """Get all matches of the given matcher."""
+        return [match for matcher in self.matchers if matcher.name == name for match in matcher.matches]
+
+    def add_metrics(self, metrics):
+        """Add the custom metrics of all matchers."""
+        for matcher in self.matchers:
+            if matcher.metrics_func is not None:
+                matcher.metrics_func(matcher.matches, metrics)
+
+    def get_artifacts(self):
+        """Get artifacts for the files written by the matchers. The data is only read on demand."""
+        artifacts = [matcher.get_artifact() for matcher in self.matchers]
+        return [artifact for artifact in artifacts if artifact is not None]
@@ -56,9 +56,12 @@ class Metrics:
     def add(self, name, value, optional=False, overwrite=False, prepend=False):
         if not overwrite:
             assert name not in self.data, "Column with the same name already exists in metrics"
+        exists = name in self.data
         self.data[name] = value
-        if optional:
+        if optional and name not in self.optional_keys:
             self.optional_keys.append(name)
+        if exists:
+            return
         if prepend:
             self.order.insert(0, name)
         else:
@@ -66,7 +69,14 @@ class Metrics:
 
     def get(self, name):
         value = self.data[name]
-        return (ast.literal_eval(value) if len(value) > 0 else None) if isinstance(value, str) else value
+        if not isinstance(value, str):
+            return value
+        if len(value) == 0:
+            return None
+        try:
+            return ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            return value  # Plain strings are not quoted in the CSV
 
     def has(self, name):
         return name in self.data
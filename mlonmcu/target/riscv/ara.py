@@ -154,6 +154,7 @@ class AraTarget(RISCVTarget):
             *ara_verilator_args,
             env=env,
             cwd=cwd,
+            timeout=self.timeout_sec if self.timeout_sec > 0 else None,
             *args,
             **kwargs,
         )
@@ -19,7 +19,6 @@
 """MLonMCU ETISS/Pulpino Target definitions"""
 
 import os
-import re
 import csv
 from pathlib import Path
 
@@ -29,6 +28,7 @@ from mlonmcu.artifact import Artifact, ArtifactFormat
 from mlonmcu.feature.features import SUPPORTED_TVM_BACKENDS
 from mlonmcu.target.common import cli, execute
 from mlonmcu.target.metrics import Metrics
+from mlonmcu.target.matcher import LineMatcher
 from .riscv import RISCVTarget
 from .util import update_extensions
 
@@ -42,6 +42,7 @@ class EtissPulpinoTarget(RISCVTarget):
 
     DEFAULTS = {
         **RISCVTarget.DEFAULTS,
+        "repeat_jobs": None,  # The simulation is deterministic, hence repetitions can run concurrently
         "gdbserver_enable": False,
         "gdbserver_attach": False,
         "gdbserver_port": 2222,
@@ -103,6 +104,11 @@ class EtissPulpinoTarget(RISCVTarget):
         value = self.config["debug_etiss"]
         return str2bool(value) if not isinstance(value, (bool, int)) else value
 
+    @property
+    def exclusive_execution(self):
+        # The interactive debugger can only attach to a single simulation
+        return super().exclusive_execution or self.debug_etiss
+
     @property
     def trace_memory(self):
         value = self.config["trace_memory"]
@@ -274,52 +280,57 @@ class EtissPulpinoTarget(RISCVTarget):
         for plugin in self.plugins:
             etiss_script_args.extend(["-p", plugin])
 
-        if self.timeout_sec > 0:
-            raise NotImplementedError
-        else:
-            ret = execute(
-                Path(self.etiss_script).resolve(),
-                program,
-                *etiss_script_args,
-                *args,
-                cwd=cwd,
-                **kwargs,
-            )
+        ret = execute(
+            Path(self.etiss_script).resolve(),
+            program,
+            *etiss_script_args,
+            *args,
+            cwd=cwd,
+            timeout=self.timeout_sec if self.timeout_sec > 0 else None,
+            **kwargs,
+        )
         return ret
 
-    def parse_stdout(self, out, handle_exit=None):
-        exit_match = re.search(r"exit called with code: (.*)", out)
-        if exit_match:
-            exit_code = int(exit_match.group(1))
+    def get_matchers(self):
+        if self.end_to_end_cycles:
+            cycles_expr = r"CPU Cycles \(estimated\): (.*)"
+        else:
+            cycles_expr = r"Total Cycles: (.*)"
+        return [
+            LineMatcher("exit", r"exit called with code: (.*)"),
+            LineMatcher("error", r"ETISS: Error: (.*)"),
+            LineMatcher("cycles", cycles_expr),
+            LineMatcher("mips", r"MIPS \(estimated\): (.*)"),
+        ]
+
+    def parse_output(self, parser, handle_exit=None):
+        exit_code = parser.get("exit")
+        if exit_code is not None:
+            exit_code = int(exit_code)
             if handle_exit is not None:
                 exit_code = handle_exit(exit_code)
             if exit_code != 0:
-                logger.error("Execution failed - " + out)
+                logger.error("Execution failed - " + parser.output)
                 raise RuntimeError(f"unexpected exit code: {exit_code}")
         else:
             exit_code = 0
-        error_match = re.search(r"ETISS: Error: (.*)", out)
-        if error_match:
-            error_msg = error_match.group(1)
+        error_msg = parser.get("error")
+        if error_msg is not None:
             raise RuntimeError(f"An ETISS Error occured during simulation: {error_msg}")
 
-        if self.end_to_end_cycles:
-            cpu_cycles = re.search(r"CPU Cycles \(estimated\): (.*)", out)
-        else:
-            cpu_cycles = re.search(r"Total Cycles: (.*)", out)
-        if not cpu_cycles:
+        cpu_cycles = parser.get("cycles")
+        if cpu_cycles is None:
             if exit_code == 0:
                 logger.warning("unexpected script output (cycles)")
             cycles = None
         else:
-            cycles = int(float(cpu_cycles.group(1)))
-        mips_match = re.search(r"MIPS \(estimated\): (.*)", out)
-        if not mips_match:
+            cycles = int(float(cpu_cycles))
+        mips = parser.get("mips")
+        if mips is None:
             if exit_code == 0:
-                raise logger.warning("unexpected script output (mips)")
-            mips = None
+                logger.warning("unexpected script output (mips)")
         else:
-            mips = int(float(mips_match.group(1)))
+            mips = int(float(mips))
 
         return cycles, mips
 
@@ -336,13 +347,20 @@ class EtissPulpinoTarget(RISCVTarget):
         if os.path.exists(metrics_file):
             os.remove(metrics_file)
 
-        if self.print_outputs:
-            out += self.exec(elf, *args, cwd=directory, live=True, handle_exit=handle_exit)
-        else:
-            out += self.exec(
-                elf, *args, cwd=directory, live=False, print_func=lambda *args, **kwargs: None, handle_exit=handle_exit
-            )
-        total_cycles, mips = self.parse_stdout(out, handle_exit=handle_exit)
+        with self.create_parser(elf) as parser:
+            if self.print_outputs:
+                out += self.exec(elf, *args, cwd=directory, live=True, handle_exit=handle_exit, parser=parser)
+            else:
+                out += self.exec(
+                    elf,
+                    *args,
+                    cwd=directory,
+                    live=False,
+                    print_func=lambda *args, **kwargs: None,
+                    handle_exit=handle_exit,
+                    parser=parser,
+                )
+        total_cycles, mips = self.parse_output(parser, handle_exit=handle_exit)
 
         get_metrics_args = [elf]
         etiss_ini = os.path.join(directory, "custom.ini")
@@ -365,6 +383,7 @@ class EtissPulpinoTarget(RISCVTarget):
         metrics = Metrics()
         metrics.add("Cycles", total_cycles)
         metrics.add("MIPS", mips, optional=True)
+        parser.add_metrics(metrics)
 
         metrics_file = os.path.join(directory, "metrics.csv")
         with open(metrics_file, "r") as handle:
@@ -414,7 +433,7 @@ class EtissPulpinoTarget(RISCVTarget):
                 metrics.add("RAM stack", ram_stack)
                 metrics.add("RAM heap", ram_heap)
 
-        artifacts = []
+        artifacts = parser.get_artifacts()
         ini_content = open(etiss_ini, "r").read()
         ini_artifact = Artifact("custom.ini", content=ini_content, fmt=ArtifactFormat.TEXT)
         artifacts.append(ini_artifact)
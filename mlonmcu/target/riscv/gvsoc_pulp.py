@@ -159,6 +159,7 @@ class GvsocPulpTarget(RISCVTarget):
             *gvsoc_simulating_arg,
             env=env,
             cwd=cwd,
+            timeout=self.timeout_sec if self.timeout_sec > 0 else None,
             *args,
             **kwargs,
         )
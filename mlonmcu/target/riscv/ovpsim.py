@@ -221,14 +221,12 @@ class OVPSimTarget(RISCVTarget):
                 extra_args = self.extra_args
             ovpsim_args.extend(extra_args)  # I rename args to extra_args because otherwise it overwrites *args
 
-        if self.timeout_sec > 0:
-            raise NotImplementedError
-
         ret = execute(
             self.ovpsim_exe.resolve(),
             *ovpsim_args,
             *args,  # Does this work?
             cwd=cwd,
+            timeout=self.timeout_sec if self.timeout_sec > 0 else None,
             **kwargs,
         )
         return ret
@@ -254,20 +252,29 @@ class OVPSimTarget(RISCVTarget):
 
     def get_metrics(self, elf, directory, *args, handle_exit=None):
         out = ""
-        if self.print_outputs:
-            out += self.exec(elf, *args, cwd=directory, live=True, handle_exit=handle_exit)
-        else:
-            out += self.exec(
-                elf, *args, cwd=directory, live=False, print_func=lambda *args, **kwargs: None, handle_exit=handle_exit
-            )
+        # The instruction trace is consumed by the matchers of the log_instrs feature
+        with self.create_parser(elf) as parser:
+            if self.print_outputs:
+                out += self.exec(elf, *args, cwd=directory, live=True, handle_exit=handle_exit, parser=parser)
+            else:
+                out += self.exec(
+                    elf,
+                    *args,
+                    cwd=directory,
+                    live=False,
+                    print_func=lambda *args, **kwargs: None,
+                    handle_exit=handle_exit,
+                    parser=parser,
+                )
         cycles, mips = self.parse_stdout(out)
 
         metrics = Metrics()
         metrics.add("Cycles", cycles)
         if mips:
             metrics.add("MIPS", mips, optional=True)
+        parser.add_metrics(metrics)
 
-        return metrics, out, []
+        return metrics, out, parser.get_artifacts()
 
     def get_platform_defs(self, platform):
         ret = super().get_platform_defs(platform)
@@ -113,15 +113,13 @@ class RiscvQemuTarget(RISCVTarget):
         assert len(args) == 0, "Qemu does not support passing arguments."
         qemu_args = self.get_qemu_args(program)
 
-        if self.timeout_sec > 0:
-            raise NotImplementedError
-        else:
-            ret = execute(
-                self.riscv32_qemu_exe,
-                *qemu_args,
-                cwd=cwd,
-                **kwargs,
-            )
+        ret = execute(
+            self.riscv32_qemu_exe,
+            *qemu_args,
+            cwd=cwd,
+            timeout=self.timeout_sec if self.timeout_sec > 0 else None,
+            **kwargs,
+        )
         return ret
 
     def parse_stdout(self, out, handle_exit=None):
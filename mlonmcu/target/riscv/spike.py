@@ -19,7 +19,6 @@
 """MLonMCU Spike Target definitions"""
 
 import os
-import re
 import time
 from pathlib import Path
 
@@ -28,6 +27,7 @@ from mlonmcu.config import str2bool
 from mlonmcu.feature.features import SUPPORTED_TVM_BACKENDS
 from mlonmcu.target.common import cli, execute
 from mlonmcu.target.metrics import Metrics
+from mlonmcu.target.matcher import LineMatcher
 from .riscv import RISCVTarget
 from .util import update_extensions
 
@@ -54,6 +54,7 @@ class SpikeTarget(RISCVTarget):
 
     DEFAULTS = {
         **RISCVTarget.DEFAULTS,
+        "repeat_jobs": None,  # The simulation is deterministic, hence repetitions can run concurrently
         "enable_vext": False,
         "vext_spec": 1.0,
         "embedded_vext": False,
@@ -170,9 +171,6 @@ class SpikeTarget(RISCVTarget):
         else:
             assert self.vlen == 0
 
-        if self.timeout_sec > 0:
-            raise NotImplementedError
-
         ret = execute(
             self.spike_exe.resolve(),
             *spike_args,
@@ -180,43 +178,56 @@ class SpikeTarget(RISCVTarget):
             *spikepk_args,
             program,
             *args,
+            timeout=self.timeout_sec if self.timeout_sec > 0 else None,
             **kwargs,
         )
         return ret
 
-    def parse_stdout(self, out):
+    def get_matchers(self):
         if self.end_to_end_cycles:
-            cpu_cycles = re.search(r"(\d*) cycles", out)
+            cycles_expr = r"(\d*) cycles"
         else:
-            cpu_cycles = re.search(r"Total Cycles: (.*)", out)
-        if not cpu_cycles:
+            cycles_expr = r"Total Cycles: (.*)"
+        return [LineMatcher("cycles", cycles_expr)]
+
+    def parse_output(self, parser):
+        cpu_cycles = parser.get("cycles")
+        if cpu_cycles is None:
             logger.warning("unexpected script output (cycles)")
             cycles = None
         else:
-            cycles = int(float(cpu_cycles.group(1)))
+            cycles = int(float(cpu_cycles))
         # mips = None  # TODO: parse mips?
         return cycles
 
     def get_metrics(self, elf, directory, *args, handle_exit=None):
         out = ""
         start_time = time.time()
-        if self.print_outputs:
-            out = self.exec(elf, *args, cwd=directory, live=True, handle_exit=handle_exit)
-        else:
-            out = self.exec(
-                elf, *args, cwd=directory, live=False, print_func=lambda *args, **kwargs: None, handle_exit=handle_exit
-            )
+        with self.create_parser(elf) as parser:
+            if self.print_outputs:
+                out = self.exec(elf, *args, cwd=directory, live=True, handle_exit=handle_exit, parser=parser)
+            else:
+                out = self.exec(
+                    elf,
+                    *args,
+                    cwd=directory,
+                    live=False,
+                    print_func=lambda *args, **kwargs: None,
+                    handle_exit=handle_exit,
+                    parser=parser,
+                )
         # TODO: do something with out?
         end_time = time.time()
         diff = end_time - start_time
         # size instead of readelf?
-        cycles = self.parse_stdout(out)
+        cycles = self.parse_output(parser)
 
         metrics = Metrics()
         metrics.add("Cycles", cycles)
         metrics.add("MIPS", (cycles / diff) / 1e6)
+        parser.add_metrics(metrics)
 
-        return metrics, out, []
+        return metrics, out, parser.get_artifacts()
 
     def get_platform_defs(self, platform):
         ret = super().get_platform_defs(platform)
@@ -21,6 +21,8 @@
 import os
 import tempfile
 import time
+import multiprocessing
+import concurrent.futures
 from pathlib import Path
 from typing import List, Tuple
 
@@ -31,11 +33,14 @@ from mlonmcu.feature.type import FeatureType
 from mlonmcu.feature.features import get_matching_features
 from mlonmcu.artifact import Artifact, ArtifactFormat
 from mlonmcu.config import str2bool
+from mlonmcu.setup.jobserver import job_slots, get_active_jobserver
+from mlonmcu.setup.utils import deadline, get_timeout
 
 
 # TODO: class TargetFactory:
 from .common import execute
 from .metrics import Metrics
+from .matcher import OutputParser
 
 
 class Target:
@@ -61,6 +66,7 @@ class Target:
     DEFAULTS = {
         "print_outputs": False,
         "repeat": None,
+        "repeat_jobs": 1,  # Max. number of concurrent repetitions (None: limited by the jobserver, 1 without)
     }
 
     REQUIRED = []
@@ -76,6 +82,7 @@ class Target:
         self.config = config if config else {}
         self.pre_callbacks = []
         self.post_callbacks = []
+        self.matchers = []
         self.features = self.process_features(features)
         self.config = filter_config(self.config, self.name, self.DEFAULTS, self.OPTIONAL, self.REQUIRED)
         self.inspect_program = "readelf"
@@ -92,6 +99,21 @@ class Target:
     def repeat(self):
         return self.config["repeat"]
 
+    @property
+    def exclusive_execution(self):
+        """Returns true if concurrent executions would share fixed resources (e.g. the port of a gdbserver)."""
+        return bool(getattr(self, "gdbserver_enable", False))
+
+    @property
+    def repeat_jobs(self):
+        if self.exclusive_execution:
+            return 1
+        value = self.config["repeat_jobs"]
+        if value is not None:
+            return int(value)
+        # Without a jobserver, there is no session-wide limit for the number of concurrent simulations
+        return multiprocessing.cpu_count() if get_active_jobserver() is not None else 1
+
     def __repr__(self):
         return f"Target({self.name})"
 
@@ -104,6 +126,7 @@ class Target:
             feature.used = True
             feature.add_target_config(self.name, self.config)
             feature.add_target_callbacks(self.name, self.pre_callbacks, self.post_callbacks)
+            feature.add_target_matchers(self.name, self.matchers)
         return features
 
     def exec(self, program: Path, *args, cwd=os.getcwd(), **kwargs):
@@ -114,38 +137,76 @@ class Target:
         """Use target to inspect a executable"""
         return execute(self.inspect_program, program, *self.inspect_program_args, *args, **kwargs)
 
+    def get_matchers(self):
+        """Get the LineMatcher instances used to parse the output of the target."""
+        return []
+
+    def create_parser(self, elf):
+        """Create an OutputParser for a single execution using the matchers of the target and its features.
+
+        Files written by the matchers are placed next to the executable.
+        """
+        return OutputParser(self.get_matchers() + self.matchers, log_dir=Path(elf).parent)
+
     def get_metrics(self, elf, directory, *args, handle_exit=None):
         # This should not be accurate, just a fallback which should be overwritten
         start_time = time.time()
-        if self.print_outputs:
-            out = self.exec(elf, *args, cwd=directory, live=True, handle_exit=handle_exit)
-        else:
-            out = self.exec(
-                elf, *args, cwd=directory, live=False, print_func=lambda *args, **kwargs: None, handle_exit=handle_exit
-            )
+        with self.create_parser(elf) as parser:
+            if self.print_outputs:
+                out = self.exec(elf, *args, cwd=directory, live=True, handle_exit=handle_exit, parser=parser)
+            else:
+                out = self.exec(
+                    elf,
+                    *args,
+                    cwd=directory,
+                    live=False,
+                    print_func=lambda *args, **kwargs: None,
+                    handle_exit=handle_exit,
+                    parser=parser,
+                )
         # TODO: do something with out?
         end_time = time.time()
         diff = end_time - start_time
         # size instead of readelf?
         metrics = Metrics()
         metrics.add("Runtime [s]", diff)
+        parser.add_metrics(metrics)
+
+        return metrics, out, parser.get_artifacts()
 
-        return metrics, out, []
+    def _generate_once(self, elf):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            args = []
+            for callback in self.pre_callbacks:
+                callback(temp_dir, args)
+            return self.get_metrics(elf, *args, temp_dir)
 
     def generate(self, elf) -> Tuple[dict, dict]:
         artifacts = []
-        metrics = []
         total = 1 + (self.repeat if self.repeat else 0)
         # We only save the stdout and artifacts of the last execution
         # Callect metrics from all runs to aggregate them in a callback with high priority
-        artifacts_ = []
-        for n in range(total):
-            with tempfile.TemporaryDirectory() as temp_dir:
-                args = []
-                for callback in self.pre_callbacks:
-                    callback(temp_dir, args)
-                metrics_, out, artifacts_ = self.get_metrics(elf, *args, temp_dir)
-            metrics.append(metrics_)
+        max_jobs = min(total, self.repeat_jobs)
+        if max_jobs > 1:
+            # The repetitions are independent, hence they are executed concurrently. The number of concurrent
+            # executions is limited by the tokens of the jobserver (if active).
+            timeout = get_timeout()  # The deadline of the stage only applies to the current thread
+
+            def _helper(n):
+                with deadline(timeout):
+                    return self._generate_once(elf)
+
+            with job_slots(max_jobs) as (num_jobs, _):
+                with concurrent.futures.ThreadPoolExecutor(num_jobs) as executor:
+                    results = list(executor.map(_helper, range(total)))
+        else:
+            results = [self._generate_once(elf) for n in range(total)]
+        metrics = [metrics_ for metrics_, _, _ in results]
+        _, out, artifacts_ = results[-1]
+        for _, _, artifacts__ in results[:-1]:
+            for artifact in artifacts__:
+                if artifact.file is not None:
+                    os.remove(artifact.file)  # Logs written by the matchers of discarded executions
         for callback in self.post_callbacks:
             out = callback(out, metrics, artifacts_)
         artifacts.extend(artifacts_)
@@ -0,0 +1,137 @@
+#
+# Copyright (c) 2022 TUM Department of Electrical and Computer Engineering.
+#
+# This file is part of MLonMCU.
+# See https://github.com/tum-ei-eda/mlonmcu.git for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Lightweight tracing of sessions, runs, stages and subprocesses.
+
+Spans are appended to a JSON-lines event log and can be converted to the Chrome trace format, which can be
+inspected using chrome://tracing or https://ui.perfetto.dev.
+"""
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+_ACTIVE = None
+
+
+class Tracer:
+    """Records spans in a JSON-lines file which may be shared by multiple threads and (forked) processes."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def __repr__(self):
+        return f"Tracer({self.path})"
+
+    def add(self, name, cat, start, end, args=None):
+        """Record a completed span (timestamps in seconds since the epoch)."""
+        event = {
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            "ts": round(start * 1e6),
+            "dur": round((end - start) * 1e6),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args if args is not None else {},
+        }
+        line = json.dumps(event, default=str) + "\n"
+        # A single write on a file opened in append mode is not interleaved with writes of other processes
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode())
+        finally:
+            os.close(fd)
+
+    def read(self):
+        """Return all recorded events."""
+        if not self.path.is_file():
+            return []
+        with open(self.path, "r", encoding="utf-8") as handle:
+            return [json.loads(line) for line in handle if len(line.strip()) > 0]
+
+    def export_chrome(self, dest):
+        """Write all recorded events to a file in the Chrome trace format."""
+        events = sorted(self.read(), key=lambda event: event["ts"])
+        with open(dest, "w", encoding="utf-8") as handle:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, handle)
+
+
+def get_active_tracer():
+    """Return the tracer of the current session (None if tracing is disabled)."""
+    return _ACTIVE
+
+
+@contextmanager
+def use_tracer(path):
+    """Context manager which activates a tracer writing to the given file."""
+    global _ACTIVE
+    previous = _ACTIVE
+    tracer = Tracer(path)
+    _ACTIVE = tracer
+    try:
+        yield tracer
+    finally:
+        _ACTIVE = previous
+
+
+@contextmanager
+def span(name, cat="mlonmcu", **kwargs):
+    """Record the enclosed code as a span of the active tracer (if any).
+
+    Yields a dictionary which can be used to add further arguments to the span.
+    """
+    args = dict(kwargs)
+    tracer = _ACTIVE
+    if tracer is None:
+        yield args
+        return
+    start = time.time()
+    try:
+        yield args
+    except BaseException as e:
+        args["error"] = type(e).__name__
+        raise
+    finally:
+        tracer.add(name, cat, start, time.time(), args=args)
+
+
+def add_rusage(args, rusage):
+    """Add the resource usage of a child process to the arguments of a span."""
+    if rusage is None:
+        return
+    args["utime"] = rusage.ru_utime
+    args["stime"] = rusage.ru_stime
+    args["maxrss_kb"] = rusage.ru_maxrss
+
+
+def wait_process(process):
+    """Wait for a subprocess to exit. Returns the exit code and the resource usage of the process (if available)."""
+    if not hasattr(os, "wait4") or process.returncode is not None:
+        return process.wait(), None
+    try:
+        _, status, rusage = os.wait4(process.pid, 0)
+    except ChildProcessError:  # Already reaped
+        return process.wait(), None
+    if os.WIFSIGNALED(status):
+        process.returncode = -os.WTERMSIG(status)
+    else:
+        process.returncode = os.WEXITSTATUS(status)
+    return process.returncode, rusage
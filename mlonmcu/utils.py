@@ -47,3 +47,14 @@ def get_base_prefix_compat():
 def in_virtualenv():
     """Detects if the current python interpreter is from a virtual environment."""
     return get_base_prefix_compat() != sys.prefix
+
+
+def parse_size(value):
+    """Convert a size given as string with an optional unit suffix (e.g. '10G', '512M') to a number of bytes."""
+    if isinstance(value, int):
+        return value
+    value = str(value).strip().upper().rstrip("B")
+    units = {"K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+    if len(value) > 0 and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
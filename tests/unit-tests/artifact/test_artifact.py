@@ -17,6 +17,10 @@
 # limitations under the License.
 #
 """Unit tests for the artifact submodule."""
+import os
+import pickle
+
+import mock
 
 from mlonmcu.artifact import Artifact, ArtifactFormat, lookup_artifacts
 
@@ -36,3 +40,37 @@ def test_lookup_artifacts():
     assert lookup_artifacts(artifacts, fmt=ArtifactFormat.RAW) == [third]
     assert lookup_artifacts(artifacts, flags={"test"}) == [third, fourth]
     assert lookup_artifacts(artifacts, flags={"test", "sw"}) == [third]
+
+
+def test_artifact_spill(tmp_path):
+    artifact = Artifact("foo.log", content="foo", fmt=ArtifactFormat.TEXT)
+    artifact.spill(tmp_path / "spilled" / "foo.log")
+    assert not artifact.in_memory
+    assert artifact.content == "foo"
+    assert artifact.size == 3
+    # Exporting creates a hardlink instead of writing the content again
+    artifact.export(tmp_path)
+    assert os.path.samefile(tmp_path / "foo.log", tmp_path / "spilled" / "foo.log")
+    # Overwriting the exported file does not modify the backing file of the artifact
+    other = Artifact("foo.log", content="bar", fmt=ArtifactFormat.TEXT)
+    other.export(tmp_path)
+    assert artifact.content == "foo"
+    copy = pickle.loads(pickle.dumps(artifact.materialize()))
+    assert copy.in_memory and copy.file is None and copy.content == "foo"
+    binary = Artifact("foo.bin", file=tmp_path / "spilled" / "foo.log", fmt=ArtifactFormat.RAW)
+    assert binary.raw == b"foo"
+
+
+def test_artifact_export_once(tmp_path):
+    artifact = Artifact("foo.c", content="int x;", fmt=ArtifactFormat.SOURCE)
+    with mock.patch.object(artifact, "_write", wraps=artifact._write) as write:
+        artifact.export(tmp_path)
+        artifact.export(tmp_path)
+        assert write.call_count == 1
+        artifact.content = "int y;"
+        artifact.export(tmp_path)
+        assert write.call_count == 2
+        (tmp_path / "foo.c").unlink()
+        artifact.export(tmp_path)
+        assert write.call_count == 3
+    assert (tmp_path / "foo.c").read_text() == "int y;"
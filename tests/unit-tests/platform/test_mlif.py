@@ -0,0 +1,171 @@
+#
+# Copyright (c) 2022 TUM Department of Electrical and Computer Engineering.
+#
+# This file is part of MLonMCU.
+# See https://github.com/tum-ei-eda/mlonmcu.git for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import shutil
+import subprocess
+
+import mock
+import pytest
+
+from mlonmcu.platform.mlif import MlifPlatform
+
+
+def _fake_compile(platform, calls):
+    def _compile(target, src=None, model=None, data_file=None, cmake_args=None):
+        calls.append(src)
+        (platform.build_dir / "bin").mkdir(parents=True, exist_ok=True)
+        shutil.copy(shutil.which("true"), platform.build_dir / "bin" / "generic_mlif")
+        return "build log", cmake_args[1]
+
+    return _compile
+
+
+def test_mlif_elf_cache(tmp_path):
+    calls = []
+    (tmp_path / "mlif").mkdir()
+    (tmp_path / "mlif" / "CMakeLists.txt").write_text("project(mlif)\n")
+    platform = MlifPlatform(config={"mlif.src_dir": tmp_path / "mlif", "mlif.elf_cache": True})
+    codegen_dir = tmp_path / "run"
+    codegen_dir.mkdir()
+    platform.init_directory(path=codegen_dir / "mlif")
+    platform.cache_dir = tmp_path / "cache"
+    (codegen_dir / "model.c").write_text("int x;")
+    (codegen_dir / "build_metrics.csv").write_text("Build Stage Time [s]\n1.0")
+    with mock.patch.object(platform, "compile", side_effect=_fake_compile(platform, calls)):
+        artifacts, metrics = platform.generate(codegen_dir, None)
+        assert len(calls) == 1
+        assert metrics["default"].get("Compile Cache Misses") == 1
+        # Irrelevant files are ignored
+        (codegen_dir / "build_metrics.csv").write_text("Build Stage Time [s]\n2.0")
+        artifacts_, metrics_ = platform.generate(codegen_dir, None)
+        assert len(calls) == 1
+        assert metrics_["default"].get("Compile Cache Hits") == 1
+        assert metrics_["default"].get("Total ROM") == metrics["default"].get("Total ROM")
+        assert artifacts_["default"][0].raw == artifacts["default"][0].raw
+        # Changed sources or definitions lead to a rebuild
+        (codegen_dir / "model.c").write_text("int y;")
+        platform.generate(codegen_dir, None)
+        assert len(calls) == 2
+        platform.definitions["FOO"] = 1
+        platform.generate(codegen_dir, None)
+        assert len(calls) == 3
+        # Updating the MLIF sources in place leads to a rebuild as well
+        (tmp_path / "mlif" / "CMakeLists.txt").write_text("project(mlif_updated)\n")
+        platform.generate(codegen_dir, None)
+        assert len(calls) == 4
+
+
+def test_mlif_shared_build(tmp_path):
+    build_dirs = []
+
+    def _fake_make(*args, cwd=None, **kwargs):
+        build_dirs.append(cwd)
+        (cwd / "bin").mkdir(exist_ok=True)
+        shutil.copy(shutil.which("true"), cwd / "bin" / "generic_mlif")
+        return ""
+
+    config = {"mlif.src_dir": tmp_path / "mlif", "mlif.shared_build": True}
+    with mock.patch("mlonmcu.setup.utils.cmake", return_value=""), mock.patch(
+        "mlonmcu.setup.utils.make", side_effect=_fake_make
+    ):
+        for i, optimize in enumerate(["s", "s", "3"]):
+            platform = MlifPlatform(config={**config, "mlif.optimize": optimize})
+            codegen_dir = tmp_path / str(i)
+            codegen_dir.mkdir()
+            platform.init_directory(path=codegen_dir / "mlif")
+            platform.cache_dir = tmp_path / "cache"
+            platform.generate(codegen_dir, None)
+            assert (platform.build_dir / "bin" / "generic_mlif").is_file()
+    assert build_dirs[0] == build_dirs[1]
+    assert build_dirs[0] != build_dirs[2]
+    assert (tmp_path / "cache" / "builds") in build_dirs[0].parents
+
+
+def test_mlif_ccache(tmp_path):
+    platform = MlifPlatform(config={"mlif.src_dir": tmp_path / "mlif", "mlif.ccache": True, "mlif.ccache_exe": "true"})
+    platform.cache_dir = tmp_path / "cache"
+    env = platform.get_ccache_vars(tmp_path, base_dir=tmp_path)
+    assert env["CMAKE_C_COMPILER_LAUNCHER"] == "true"
+    assert env["CCACHE_DIR"] == str(tmp_path / "cache" / "ccache")
+    assert env["CCACHE_BASEDIR"] == str(tmp_path)
+    assert "-DCMAKE_CXX_COMPILER_LAUNCHER=true" in platform.get_common_cmake_args()
+    assert platform.get_ccache_metrics() is None
+    stats = "# main.c\ndirect_cache_hit\n# model.c\ncache_miss\npreprocessed_cache_hit\n"
+    (tmp_path / "ccache_stats.log").write_text(stats)
+    assert platform.get_ccache_metrics() == (2, 1)
+
+
+def test_mlif_ccache_missing(tmp_path):
+    config = {"mlif.src_dir": tmp_path / "mlif", "mlif.ccache": True, "mlif.ccache_exe": "not-a-ccache"}
+    platform = MlifPlatform(config=config)
+    assert platform.get_ccache_vars(tmp_path) == {}
+    assert "-DCMAKE_C_COMPILER_LAUNCHER=" in platform.get_common_cmake_args()
+
+
+@pytest.mark.skipif(
+    any(shutil.which(tool) is None for tool in ["cmake", "make", "cc"]), reason="requires cmake, make and cc"
+)
+def test_mlif_shared_build_cmake(tmp_path):
+    # Only the framework library is built in the shared directory, the model specific targets in the run directory
+    mlif_dir = tmp_path / "mlif"
+    (mlif_dir / "lib").mkdir(parents=True)
+    (mlif_dir / "CMakeLists.txt").write_text(
+        "cmake_minimum_required(VERSION 3.14)\n"
+        "project(fake_mlif C)\n"
+        "add_library(framework STATIC lib/framework.c)\n"
+        "add_library(model STATIC ${SRC_DIR}/model.c)\n"
+        "target_link_libraries(model PUBLIC framework)\n"
+        "add_executable(generic_mlif main.c)\n"
+        "target_link_libraries(generic_mlif PRIVATE model)\n"
+        "set_target_properties(generic_mlif PROPERTIES RUNTIME_OUTPUT_DIRECTORY ${CMAKE_BINARY_DIR}/bin)\n"
+    )
+    (mlif_dir / "lib" / "framework.c").write_text("int framework(void) { return 1; }\n")
+    (mlif_dir / "main.c").write_text("int model(void);\nint main(void) { return model(); }\n")
+    config = {"mlif.src_dir": mlif_dir, "mlif.shared_build": True, "mlif.num_threads": 2}
+    for i in range(2):
+        platform = MlifPlatform(config=config)
+        codegen_dir = tmp_path / str(i)
+        codegen_dir.mkdir()
+        (codegen_dir / "model.c").write_text(f"int framework(void);\nint model(void) {{ return framework() + {i}; }}\n")
+        platform.init_directory(path=codegen_dir / "mlif")
+        platform.cache_dir = tmp_path / "cache"
+        platform.compile(None, src=codegen_dir)
+        assert subprocess.run([platform.build_dir / "bin" / "generic_mlif"]).returncode == 1 + i
+        assert not list(platform.build_dir.glob("**/framework.c.o"))
+    shared_dirs = [path for path in (tmp_path / "cache" / "builds").iterdir() if path.is_dir()]
+    assert len(shared_dirs) == 1
+    assert len(list(shared_dirs[0].glob("**/framework.c.o"))) == 1
+    assert not list(shared_dirs[0].glob("**/model.c.o"))
+
+
+def test_mlif_build_inputs(tmp_path):
+    platform = MlifPlatform(config={"mlif.src_dir": tmp_path / "mlif"})
+    (tmp_path / "gcc" / "bin").mkdir(parents=True)
+    compiler = tmp_path / "gcc" / "bin" / "riscv32-unknown-elf-gcc"
+    compiler.write_text("v1")
+    (tmp_path / "support").mkdir()
+    (tmp_path / "support" / "support.c").write_text("int x;")
+    args = [f"-DRISCV_ELF_GCC_PREFIX={tmp_path / 'gcc'}", f"-DMODEL_SUPPORT_DIR={tmp_path / 'support'}"]
+    inputs = platform.get_build_inputs(args)
+    assert inputs["mlif"] is None  # Missing directory
+    compiler.write_text("v2.0")  # Toolchain updated in place
+    inputs_ = platform.get_build_inputs(args)
+    assert inputs_["RISCV_ELF_GCC_PREFIX"] != inputs["RISCV_ELF_GCC_PREFIX"]
+    assert inputs_["MODEL_SUPPORT_DIR"] == inputs["MODEL_SUPPORT_DIR"]
+    (tmp_path / "support" / "support.c").write_text("int y = 1;")
+    assert platform.get_build_inputs(args)["MODEL_SUPPORT_DIR"] != inputs["MODEL_SUPPORT_DIR"]
@@ -0,0 +1,48 @@
+#
+# Copyright (c) 2022 TUM Department of Electrical and Computer Engineering.
+#
+# This file is part of MLonMCU.
+# See https://github.com/tum-ei-eda/mlonmcu.git for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import pytest
+
+from mlonmcu.setup.cache import TaskCache
+
+
+def test_task_cache_find_best_match(tmp_path):
+    cache = TaskCache()
+    cache["tvm.src_dir", ()] = "default"
+    cache["tvm.src_dir", ("debug",)] = "debug"
+    cache["tvm.src_dir", ("debug", "cmsisnn")] = "debug_cmsisnn"
+    cache["etiss.exe", ("debug",)] = "etiss_debug"
+    assert cache.find_best_match("tvm.src_dir") == "default"
+    assert cache.find_best_match("tvm.src_dir", ["debug", "foo"]) == "debug"
+    assert cache.find_best_match("tvm.src_dir", ["cmsisnn", "debug"]) == "debug_cmsisnn"
+    with pytest.raises(RuntimeError):
+        cache.find_best_match("etiss.exe")
+    with pytest.raises(RuntimeError):
+        cache.find_best_match("unknown")
+    # New entries invalidate the memoized matches
+    cache["etiss.exe", ()] = "etiss"
+    assert cache.find_best_match("etiss.exe") == "etiss"
+    cache["tvm.src_dir", ("cmsisnn",)] = "cmsisnn"
+    assert cache.find_best_match("tvm.src_dir", ["cmsisnn"]) == "cmsisnn"
+    cache["tvm.src_dir", ("foo",)] = "foo"
+    with pytest.raises(AssertionError):
+        cache.find_best_match("tvm.src_dir", ["debug", "foo"])
+    cache.write_to_file(tmp_path / "cache.ini")
+    restored = TaskCache()
+    restored.read_from_file(tmp_path / "cache.ini")
+    assert restored.find_best_match("tvm.src_dir", ["cmsisnn", "debug"]) == "debug_cmsisnn"
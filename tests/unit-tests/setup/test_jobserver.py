@@ -0,0 +1,82 @@
+#
+# Copyright (c) 2022 TUM Department of Electrical and Computer Engineering.
+#
+# This file is part of MLonMCU.
+# See https://github.com/tum-ei-eda/mlonmcu.git for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import os
+import sys
+import threading
+
+import pytest
+
+from mlonmcu.setup.jobserver import JobServer, use_jobserver, get_active_jobserver, job_slots
+from mlonmcu.setup import utils
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="jobserver requires a POSIX system")
+
+
+def test_jobserver_tokens():
+    server = JobServer(3)
+    assert server.acquire_many(5) == 3
+    assert not server.acquire(block=False)
+    server.release(2)
+    with server.slots(4) as count:
+        assert count == 2
+    assert server.acquire_many(3) == 2
+    server.release(3)
+    assert server.acquire_many(3) == 3
+    server.close()
+
+
+def test_jobserver_blocking_acquire():
+    server = JobServer(1)
+    assert server.acquire()
+    acquired = threading.Event()
+    thread = threading.Thread(target=lambda: server.acquire() and acquired.set())
+    thread.start()
+    assert not acquired.wait(0.2)
+    server.release()
+    thread.join(timeout=10)
+    assert acquired.is_set()
+    assert not server.acquire(block=False)
+    server.close()
+
+
+def test_jobserver_active():
+    assert get_active_jobserver() is None
+    with job_slots(4, env={"FOO": "bar"}) as (count, kwargs):
+        assert count == 4
+        assert kwargs == {"env": {"FOO": "bar"}}
+    with use_jobserver(2) as server:
+        assert get_active_jobserver() is server
+        with job_slots(4, env={"FOO": "bar"}) as (count, kwargs):
+            assert count == 2
+            assert "--jobserver-auth" in kwargs["env"]["MAKEFLAGS"]
+            assert kwargs["env"]["FOO"] == "bar"
+            assert set(kwargs["pass_fds"]) == {server.read_fd, server.write_fd}
+            assert not server.acquire(block=False)
+    assert get_active_jobserver() is None
+
+
+def test_jobserver_subprocess():
+    # A child process takes a token from the pipe and returns it
+    script = "import os; fds = os.environ['MAKEFLAGS'].split('=')[-1].split(','); "
+    script += "r, w = map(int, fds); os.write(w, os.read(r, 1))"
+    with use_jobserver(2) as server:
+        with job_slots(1) as (_, kwargs):
+            utils.exec_getout(sys.executable, "-c", script, **kwargs)
+        assert server.acquire_many(2) == 2
+        server.release(2)
@@ -16,6 +16,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import time
+
+import pytest
+
+from mlonmcu.setup.utils import exec_getout, run_process, deadline, ProcessTimeoutError
 
 # from mlonmcu.setup.utils import (
 #     makeFlags,
@@ -35,6 +40,42 @@
 # )
 
 
+@pytest.mark.parametrize("live", [False, True])
+def test_setup_exec_getout_timeout(live, tmp_path):
+    # The sleep is started in the background to ensure that the whole process group is killed
+    marker = tmp_path / "marker"
+    script = f"echo started; (sleep 2; touch {marker}) & wait"
+    start = time.time()
+    with pytest.raises(ProcessTimeoutError) as excinfo:
+        exec_getout("sh", "-c", script, live=live, timeout=0.5)
+    assert time.time() - start < 1.5
+    assert "started" in excinfo.value.output
+    time.sleep(2)
+    assert not marker.exists()
+    with deadline(0.5):
+        with pytest.raises(ProcessTimeoutError):
+            exec_getout("sleep", "2", timeout=10)
+    assert exec_getout("echo", "done", timeout=10).strip() == "done"
+
+
+def test_setup_run_process(tmp_path):
+    out_file = tmp_path / "out.txt"
+    lines = []
+    script = "printf 'a\\nb'; sleep 0.1; printf 'c\\n\\303'; printf '\\244\\nd'"
+    exit_code, output = run_process(["sh", "-c", script], line_callback=lines.append, output_file=out_file)
+    assert exit_code == 0
+    assert output == "a\nbc\n\u00e4\nd"
+    assert lines == ["a", "bc", "\u00e4", "d"]
+    assert out_file.read_text() == output
+
+    # Returning True from the callback stops the process
+    start = time.time()
+    exit_code, output = run_process(["sh", "-c", "echo stop; sleep 5"], line_callback=lambda line: line == "stop")
+    assert time.time() - start < 2
+    assert exit_code != 0
+    assert output == "stop\n"
+
+
 def test_setup_utils_makeFlags():
     pass
 
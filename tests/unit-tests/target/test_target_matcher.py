@@ -0,0 +1,74 @@
+#
+# Copyright (c) 2022 TUM Department of Electrical and Computer Engineering.
+#
+# This file is part of MLonMCU.
+# See https://github.com/tum-ei-eda/mlonmcu.git for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import numpy as np
+
+from mlonmcu.target.common import execute
+from mlonmcu.target.instr_trace import InstructionTraceMatcher, load_instruction_trace
+from mlonmcu.target.matcher import LineMatcher, OutputParser
+from mlonmcu.target.metrics import Metrics
+
+
+def test_target_output_parser(tmp_path):
+    def _add_metrics(matches, metrics):
+        metrics.add("Count", len(matches))
+
+    matchers = [
+        LineMatcher("cycles", r"Total Cycles: (\d+)"),
+        LineMatcher("instrs", r"^core\s+\d+: ", consume=True, file="instrs.log", flags=("log_instrs",)),
+        LineMatcher("count", r"count", multiple=True, metrics_func=_add_metrics),
+    ]
+    script = "echo 'core   0: addi'; echo 'Total Cycles: 42'; echo 'core   0: ret'; echo count; echo count"
+    with OutputParser(matchers, log_dir=tmp_path) as parser:
+        out = execute("sh", "-c", script, parser=parser, print_func=lambda *args, **kwargs: None)
+    assert out == "Total Cycles: 42\ncount\ncount\n"
+    assert parser.get("cycles") == "42"
+    assert parser.get("missing") is None
+    assert len(parser.get_all("count")) == 2
+    metrics = Metrics()
+    parser.add_metrics(metrics)
+    assert metrics.get_data()["Count"] == 2
+    artifacts = parser.get_artifacts()
+    assert len(artifacts) == 1
+    assert artifacts[0].name == "instrs.log"
+    assert artifacts[0].content == "core   0: addi\ncore   0: ret\n"
+    assert matchers[2].matches == []  # The parser works on copies of the matchers
+
+
+def test_target_instruction_trace(tmp_path):
+    expr = r"^core\s+\d+: 0x(?P<pc>[0-9a-fA-F]+) \(0x(?P<encoding>[0-9a-fA-F]+)\) (?P<name>[\w.]+)"
+    matcher = InstructionTraceMatcher("instrs", expr, "spike_instrs.npz", flags=("log_instrs", "spike"))
+    lines = [
+        "core   0: 0x0000000080000000 (0x00000297) auipc   t0, 0x0",
+        "core   0: 0x0000000080000004 (0x4502) c.li    a0, 0",
+        "Total Cycles: 3",
+        "core   0: 0x0000000080000006 (0x00000297) auipc   t0, 0x0",
+    ]
+    with OutputParser([matcher], log_dir=tmp_path) as parser:
+        for line in lines:
+            parser.feed(line)
+    assert parser.output == "Total Cycles: 3\n"
+    artifact = parser.get_artifacts()[0]
+    assert artifact.name == "spike_instrs.npz"
+    for source in [artifact.file, artifact.raw]:
+        trace, names = load_instruction_trace(source)
+        assert trace["pc"].tolist() == [0x80000000, 0x80000004, 0x80000006]
+        assert trace["encoding"].tolist() == [0x297, 0x4502, 0x297]
+        assert names[trace["mnemonic"]].tolist() == ["auipc", "c.li", "auipc"]
+    trace, _ = load_instruction_trace(artifact.file)
+    assert isinstance(trace, np.memmap)
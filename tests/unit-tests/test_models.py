@@ -16,12 +16,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import os
+
 import mock
 import pytest
 import yaml
 import re
 from mlonmcu.environment.environment import PathConfig
-from mlonmcu.models.lookup import print_summary
+from mlonmcu.models.model import ModelFormats
+from mlonmcu.models.lookup import print_summary, lookup_models_and_groups
 
 # def test_models_get_model_directories():
 #     pass
@@ -224,3 +227,21 @@ def test_models_print_summary(detailed, capsys, fake_context, fake_environment_d
         )
     # TODO: group name conflicts with modelname
     # TODO: duplicate groups
+
+
+def test_models_lookup_cached(tmp_path):
+    models_dir = tmp_path / "models"
+    _create_fake_models(models_dir, ["model0", "model1"], with_metadata=True)
+    models, _, _, _ = lookup_models_and_groups([models_dir], [ModelFormats.TFLITE])
+    assert [model.name for model in models] == ["model0", "model1"]
+    models_, _, _, _ = lookup_models_and_groups([models_dir], [ModelFormats.TFLITE])
+    assert models_ is models  # The metadata is not parsed again
+    _create_fake_models(models_dir, ["model2"])
+    models, _, _, _ = lookup_models_and_groups([models_dir], [ModelFormats.TFLITE])
+    assert [model.name for model in models] == ["model0", "model1", "model2"]
+    # Metadata which is edited in place is parsed again
+    metadata_file = models_dir / "model0" / "metadata.yaml"
+    metadata_file.write_text("{}\n")
+    os.utime(metadata_file, ns=(0, 0))
+    models_, _, _, _ = lookup_models_and_groups([models_dir], [ModelFormats.TFLITE])
+    assert models_ is not models
@@ -0,0 +1,209 @@
+#
+# Copyright (c) 2022 TUM Department of Electrical and Computer Engineering.
+#
+# This file is part of MLonMCU.
+# See https://github.com/tum-ei-eda/mlonmcu.git for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import io
+import shutil
+import subprocess
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from mlonmcu.artifact import Artifact, ArtifactFormat
+from mlonmcu.report import Report
+from mlonmcu.target.elf import get_functions
+from mlonmcu.target.instr_trace import InstructionTraceWriter
+from mlonmcu.target.metrics import Metrics
+from mlonmcu.session.postprocess.postprocesses import (
+    RISCV_MAJOR_OPCODES,
+    RISCV_RVC_MAJOR_OPCODES,
+    AnalyseInstructionsPostprocess,
+    ProfilePostprocess,
+    attribute_pcs,
+    classify_riscv_major_opcodes,
+    count_sequences,
+)
+
+
+def test_postprocess_classify_riscv_major_opcodes():
+    # addi, c.li, lw, c.lw, custom
+    encodings = np.array([0x00150513, 0x4501, 0x00052503, 0x4108, 0x0000000B], dtype=np.uint32)
+    majors, labels = classify_riscv_major_opcodes(encodings)
+    assert [labels[major] for major in majors] == [
+        "OP-IMM",
+        "OP-IMM (Compressed)",
+        "LOAD",
+        "LOAD (Compressed)",
+        "custom-0",
+    ]
+
+
+def test_postprocess_count_sequences():
+    ids = np.array([0, 1, 0, 1, 2])
+    sequences, counts = count_sequences(ids, 2, 3)
+    assert dict(zip(map(tuple, sequences.tolist()), counts.tolist())) == {(0, 1): 2, (1, 0): 1, (1, 2): 1}
+    sequences, counts = count_sequences(ids, 6, 3)
+    assert len(sequences) == 0
+    # Fallback for sequences which can not be encoded as 64-bit integers
+    sequences, counts = count_sequences(ids, 2, 2**40)
+    assert dict(zip(map(tuple, sequences.tolist()), counts.tolist())) == {(0, 1): 2, (1, 0): 1, (1, 2): 1}
+
+
+def test_postprocess_attribute_pcs():
+    starts = np.array([0x100, 0x200], dtype=np.uint64)
+    ends = np.array([0x110, 0x280], dtype=np.uint64)
+    pcs = np.array([0x100, 0x104, 0x110, 0x200, 0x27E, 0x280, 0x50], dtype=np.uint32)
+    assert attribute_pcs(pcs, starts, ends).tolist() == [2, 2, 3]
+    # Large code sections are looked up without the per-address histogram
+    assert attribute_pcs(pcs, starts, ends, chunk_size=2, max_histogram_size=0).tolist() == [2, 2, 3]
+    assert attribute_pcs(pcs, starts[:0], ends[:0]).tolist() == [7]
+
+
+def _analyse_instructions_reference(names, encodings, top, max_len=3):
+    """The implementation of analyse_instructions before it was vectorized (one string per instruction)."""
+
+    def _helper(x):
+        counts = pd.Series(x, dtype=object).value_counts()
+        probs = counts / len(x)
+        return dict(counts.head(top)), dict(probs.head(top))
+
+    def _gen_csv(label, counts, probs):
+        lines = [f"{label},Count,Probablity"]
+        for x in counts:
+            lines.append(f"{x},{counts[x]},{probs[x]:.3f}")
+        return "\n".join(lines)
+
+    def _extract_major_opcode(enc):
+        opcode = enc & 0b1111111
+        lsbs = opcode & 0b11
+        if lsbs == 0b11:
+            return RISCV_MAJOR_OPCODES.get(opcode, "UNKNOWN")
+        msbs = (enc & 0b1110000000000000) >> 13
+        return f"{RISCV_RVC_MAJOR_OPCODES[msbs << 2 | lsbs]} (Compressed)"
+
+    ret = {"analyse_instructions_majors.csv": _gen_csv("Major", *_helper(list(map(_extract_major_opcode, encodings))))}
+    for length in range(1, max_len + 1):
+        sublists = [";".join(names[i : i + length]) for i in range(len(names) - length + 1)]
+        ret[f"analyse_instructions_seq{length}.csv"] = _gen_csv("Sequence", *_helper(sublists))
+    return ret
+
+
+def _split_csv(content):
+    # The order of entries with the same count was not defined by the previous implementation
+    lines = content.split("\n")
+    return lines[0], sorted(lines[1:]), [line.split(",")[1] for line in lines[1:]]
+
+
+@pytest.mark.parametrize("fmt", ["txt", "npz"])
+def test_postprocess_analyse_instructions_equivalence(fmt, tmp_path):
+    instructions = [
+        ("addi", 0x00150513),
+        ("c.li", 0x4501),
+        ("lw", 0x00052503),
+        ("c.lw", 0x4108),
+        ("sw", 0x00A12023),
+        ("c.j", 0xA001),
+        ("bne", 0x00B51463),
+        ("custom", 0x0000000B),
+    ]
+    probs = [0.3, 0.2, 0.15, 0.1, 0.1, 0.07, 0.05, 0.03]
+    trace = [instructions[idx] for idx in np.random.default_rng(42).choice(len(instructions), 2000, p=probs)]
+    flags = ("log_instrs", "spike")
+    if fmt == "txt":
+        lines = [f"core   0: 0x{0x80000000 + 4 * i:08x} (0x{enc:08x}) {name} a0" for i, (name, enc) in enumerate(trace)]
+        content = "\n".join(lines)
+        log_artifact = Artifact("spike_instrs.log", content=content, fmt=ArtifactFormat.TEXT, flags=flags)
+    else:
+        filename = tmp_path / "spike_instrs.npz"
+        writer = InstructionTraceWriter(filename, chunk_size=512)
+        for i, (name, enc) in enumerate(trace):
+            writer.append(0x80000000 + 4 * i, enc, name)
+        writer.close()
+        log_artifact = Artifact(filename.name, file=filename, fmt=ArtifactFormat.RAW, flags=flags)
+    top = 1000  # Large enough to include all sequences
+    expected = _analyse_instructions_reference([name for name, _ in trace], [enc for _, enc in trace], top=top)
+    postprocess = AnalyseInstructionsPostprocess(features=[], config={"analyse_instructions.top": top})
+    ret = {artifact.name: artifact.content for artifact in postprocess.post_run(None, [log_artifact])}
+    assert ret.keys() == expected.keys()
+    for name, content in ret.items():
+        assert _split_csv(content) == _split_csv(expected[name])
+
+
+@pytest.mark.skipif(shutil.which("gcc") is None, reason="requires gcc")
+def test_postprocess_profile(tmp_path):
+    layers = ["tvmgen_default_fused_add", "tvmgen_default_fused_conv2d_compute_", "tvmgen_default_fused_relu"]
+    src = tmp_path / "main.c"
+    src.write_text(
+        "".join(f"int {name}(int x) {{ return x * {i + 2}; }}\n" for i, name in enumerate(layers))
+        + "int helper(int x) { return x + 1; }\n"
+        + "int main(void) { return 0; }\n"
+    )
+    elf = tmp_path / "generic_mlif"
+    subprocess.run(["gcc", "-O0", "-o", str(elf), str(src)], check=True)
+    starts, _, names = get_functions(elf)
+    # Distinct number of executed instructions per function (conv2d > add > relu > helper > main)
+    executions = {
+        "tvmgen_default_fused_conv2d_compute_": 40,
+        "tvmgen_default_fused_add": 30,
+        "tvmgen_default_fused_relu": 20,
+        "helper": 6,
+        "main": 4,
+    }
+    filename = tmp_path / "spike_instrs.npz"
+    writer = InstructionTraceWriter(filename)
+    for name, count in executions.items():
+        for _ in range(count):
+            writer.append(int(starts[names.index(name)]), 0x00000013, "addi")
+    writer.close()
+    metrics = Metrics()
+    metrics.add("Cycles", 200)
+    artifacts = [
+        Artifact(filename.name, file=filename, fmt=ArtifactFormat.RAW, flags=("log_instrs", "spike")),
+        Artifact("generic_mlif", raw=elf.read_bytes(), fmt=ArtifactFormat.BIN),
+        Artifact("run_metrics.csv", content=metrics.to_csv(), fmt=ArtifactFormat.TEXT, flags=["metrics"]),
+    ]
+    report = Report()
+    report.set(pre=[{"Run": 0}], main=[{"Cycles": 200}], post=[{}])
+    postprocess = ProfilePostprocess(features=[], config={"profile.to_metrics": True, "profile.top": 2})
+    ret = {artifact.name: artifact.content for artifact in postprocess.post_run(report, artifacts)}
+
+    functions_df = pd.read_csv(io.StringIO(ret["profile_functions.csv"]))
+    assert list(functions_df.columns) == ["Function", "Instructions", "Fraction", "Est. Cycles"]
+    assert dict(zip(functions_df["Function"], functions_df["Instructions"])) == executions
+    assert functions_df["Est. Cycles"].tolist() == [80, 60, 40, 12, 8]  # 2 cycles per instruction
+    layers_df = pd.read_csv(io.StringIO(ret["profile_layers.csv"]))
+    assert layers_df["Layer"].tolist() == [
+        "tvmgen_default_fused_conv2d",
+        "tvmgen_default_fused_add",
+        "tvmgen_default_fused_relu",
+    ]
+    assert layers_df["Fraction"].tolist() == [0.4, 0.3, 0.2]
+
+    # Only the top functions and layers are added to the report
+    columns = [column for column in report.main_df.columns if column != "Cycles"]
+    assert columns == [
+        "Function tvmgen_default_fused_conv2d_compute_ Instructions",
+        "Function tvmgen_default_fused_conv2d_compute_ Est. Cycles",
+        "Function tvmgen_default_fused_add Instructions",
+        "Function tvmgen_default_fused_add Est. Cycles",
+        "Layer tvmgen_default_fused_conv2d Instructions",
+        "Layer tvmgen_default_fused_conv2d Est. Cycles",
+        "Layer tvmgen_default_fused_add Instructions",
+        "Layer tvmgen_default_fused_add Est. Cycles",
+    ]
+    assert report.main_df["Layer tvmgen_default_fused_add Est. Cycles"][0] == 60
@@ -0,0 +1,58 @@
+#
+# Copyright (c) 2022 TUM Department of Electrical and Computer Engineering.
+#
+# This file is part of MLonMCU.
+# See https://github.com/tum-ei-eda/mlonmcu.git for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import pandas as pd
+import pytest
+
+from mlonmcu.report import Report, ReportWriter, check_report_fmt
+
+
+def _create_report(run, **metrics):
+    report = Report()
+    report.set(pre=[{"Session": 0, "Run": run}], main=[metrics], post=[{"Comment": "-"}])
+    return report
+
+
+def test_report_add():
+    report = Report()
+    report.add([_create_report(0, Cycles=10), _create_report(1, Cycles=20, ROM=5)])
+    assert list(report.df["Cycles"]) == [10, 20]
+    assert pd.isna(report.df["ROM"][0])
+
+
+def test_report_writer(tmp_path):
+    writer = ReportWriter(tmp_path)
+    writer.append(_create_report(1, Cycles=20), key=1)
+    assert (tmp_path / "report.csv").read_text().splitlines() == ["Session,Run,Cycles,Comment", "0,1,20,-"]
+    writer.append(_create_report(0, Cycles=10, ROM=5), key=0)
+    # The header is not extended while the rows are appended
+    lines = (tmp_path / "report.csv").read_text().splitlines()
+    assert lines == ["Session,Run,Cycles,Comment", "0,1,20,-", "0,0,10,-"]
+    assert 0 in writer and 2 not in writer
+    report = writer.read()
+    assert list(report.df["Run"]) == [0, 1]
+    assert list(report.df.columns) == ["Session", "Run", "Cycles", "ROM", "Comment"]
+    lines = (tmp_path / "report.csv").read_text().splitlines()
+    assert lines == ["Session,Run,Cycles,Comment,ROM", "0,0,10,-,5", "0,1,20,-,"]
+
+
+def test_check_report_fmt(monkeypatch):
+    check_report_fmt("csv")
+    monkeypatch.setattr("importlib.util.find_spec", lambda name: None)
+    with pytest.raises(RuntimeError, match="pyarrow"):
+        check_report_fmt("parquet")
@@ -16,3 +16,355 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import os
+import time
+import threading
+from pathlib import Path
+
+from mlonmcu.artifact import Artifact, ArtifactFormat
+from mlonmcu.session.run import RunStage
+from mlonmcu.session.session import Session
+from mlonmcu.session.schedule import SessionScheduler
+from mlonmcu.session.cache import StageCache
+from mlonmcu.session.distributed import DirectoryQueue
+from mlonmcu.session.history import CostHistory
+from mlonmcu.target.common import execute
+from mlonmcu.target.metrics import Metrics
+from mlonmcu.target.matcher import LineMatcher, OutputParser
+
+
+class FakeRun:
+    def __init__(self, idx, stages, fail_at=None, events=None):
+        self.idx = idx
+        self.stages = stages
+        self.fail_at = fail_at
+        self.events = events
+        self.completed = {stage: stage == RunStage.NOP for stage in RunStage}
+        self.failing = False
+        self.compile_platform = None
+
+    def has_stage(self, stage):
+        return stage in self.stages
+
+    @property
+    def next_stage(self):
+        for stage in self.stages:
+            if not self.completed[stage]:
+                return stage
+        return RunStage.DONE
+
+    def process(self, until=RunStage.RUN, skip=None, export=False):
+        for stage in self.stages:
+            if stage > until or self.completed[stage]:
+                continue
+            if stage == self.fail_at:
+                self.failing = True
+                return
+            if self.events is not None:
+                self.events.append((self.idx, stage))
+            self.completed[stage] = True
+
+    def get_state(self, stages=None):
+        return {"completed": self.completed, "failing": self.failing, "pid": os.getpid()}
+
+    def update_state(self, state):
+        self.__dict__.update(state)
+
+
+def test_session_scheduler_per_stage():
+    events = []
+    stages = [RunStage.LOAD, RunStage.BUILD, RunStage.COMPILE]
+    runs = [FakeRun(i, stages, events=events) for i in range(3)]
+    runs.append(FakeRun(3, stages, fail_at=RunStage.BUILD, events=events))
+    scheduler = SessionScheduler(runs, until=RunStage.COMPILE, per_stage=True, num_workers=2)
+    assert not scheduler.process()
+    assert all(run.completed[RunStage.COMPILE] for run in runs[:3])
+    assert scheduler.num_failures == 1
+    assert scheduler.stage_failures == {"BUILD": [3]}
+    for idx in range(3):
+        order = [stage for i, stage in events if i == idx]
+        assert order == stages
+
+
+def test_session_scheduler_no_barrier():
+    # The second run must be able to finish all of its stages while the first one is still stuck in LOAD
+    blocker = threading.Event()
+    stages = [RunStage.LOAD, RunStage.BUILD]
+
+    class BlockingRun(FakeRun):
+        def process(self, until=RunStage.RUN, skip=None, export=False):
+            if self.idx == 0 and until == RunStage.LOAD:
+                assert blocker.wait(timeout=10)
+            super().process(until=until, skip=skip, export=export)
+            if self.idx == 1 and self.completed[RunStage.BUILD]:
+                blocker.set()
+
+    runs = [BlockingRun(i, stages) for i in range(2)]
+    scheduler = SessionScheduler(runs, until=RunStage.BUILD, per_stage=True, num_workers=2)
+    assert scheduler.process()
+    assert all(run.completed[RunStage.BUILD] for run in runs)
+
+
+def test_session_scheduler_process_pool():
+    stages = [RunStage.LOAD, RunStage.BUILD]
+    runs = [FakeRun(i, stages) for i in range(2)]
+    runs.append(FakeRun(2, stages, fail_at=RunStage.LOAD))
+    scheduler = SessionScheduler(runs, until=RunStage.BUILD, per_stage=True, num_workers=2, executor="process_pool")
+    assert not scheduler.process()
+    assert all(run.completed[RunStage.BUILD] for run in runs[:2])
+    assert all(run.pid != os.getpid() for run in runs)
+    assert scheduler.stage_failures == {"LOAD": [2]}
+
+
+def test_session_scheduler_max_failures():
+    stages = [RunStage.LOAD, RunStage.BUILD]
+    runs = [FakeRun(i, stages, fail_at=RunStage.LOAD if i < 2 else None) for i in range(6)]
+    # In the per-stage mode, jobs are only submitted if a worker is available
+    scheduler = SessionScheduler(runs, until=RunStage.BUILD, per_stage=True, max_failures=2)
+    assert not scheduler.process()
+    assert scheduler.cancelled
+    assert scheduler.num_failures == 2
+    assert scheduler.num_cancelled == 4
+    assert not any(run.completed[RunStage.BUILD] for run in runs)
+
+
+class SlowRun(FakeRun):
+    def process(self, until=RunStage.RUN, skip=None, export=False):
+        try:
+            if self.fail_at is None:
+                execute("sleep", "30", print_func=lambda *args, **kwargs: None)
+            else:
+                time.sleep(1)  # Give the other jobs the chance to start their subprocesses
+        except Exception:
+            pass
+        self.failing = True
+
+
+def test_session_scheduler_cancel_workers(tmp_path):
+    # The subprocesses of the running jobs have to be killed in the worker processes as well
+    for executor in ["process_pool", "queue"]:
+        runs = [SlowRun(i, [RunStage.LOAD], fail_at=RunStage.LOAD if i == 0 else None) for i in range(3)]
+        scheduler = SessionScheduler(
+            runs,
+            until=RunStage.LOAD,
+            num_workers=3,
+            executor=executor,
+            queue_dir=tmp_path / "queue",
+            num_local_workers=3,
+            max_failures=1,
+            queue_timeout=10,
+        )
+        start = time.time()
+        assert not scheduler.process()
+        assert time.time() - start < 20
+        assert scheduler.num_failures == 1
+        assert scheduler.num_cancelled == 2
+
+
+def test_session_scheduler_cost_order():
+    stages = [RunStage.LOAD, RunStage.BUILD]
+    costs = {0: 1.0, 1: 5.0, 2: 3.0}
+    for per_stage in [False, True]:
+        events = []
+        runs = [FakeRun(i, stages, events=events) for i in range(3)]
+        scheduler = SessionScheduler(
+            runs, until=RunStage.BUILD, per_stage=per_stage, cost_func=lambda run, stages_: costs[run.idx]
+        )
+        assert scheduler.process()
+        assert [idx for idx, stage in events if stage == RunStage.LOAD] == [1, 2, 0]
+        assert scheduler.predicted_cost == 9.0
+
+
+class FakeComponent:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeHistoryRun:
+    def __init__(self, model, target, stage_times=None):
+        self.model = FakeComponent(model)
+        self.backend = FakeComponent("tvmaot")
+        self.target = FakeComponent(target)
+        self.stage_times = stage_times if stage_times is not None else {}
+
+    def get_all_feature_names(self):
+        return []
+
+
+def test_cost_history(tmp_path):
+    history = CostHistory(tmp_path / "history.json")
+    assert history.predict(FakeHistoryRun("aww", "spike"), [RunStage.RUN]) == CostHistory.DEFAULT_COST
+    history.update(FakeHistoryRun("aww", "spike", {RunStage.RUN: 10.0}))
+    history.update(FakeHistoryRun("aww", "spike", {RunStage.RUN: 20.0}))
+    history.update(FakeHistoryRun("vww", "ara", {RunStage.RUN: 100.0}))
+    history.save()
+    history = CostHistory(tmp_path / "history.json")
+    assert history.predict(FakeHistoryRun("aww", "spike"), [RunStage.RUN]) == 15.0
+    # Unknown combinations fall back to the durations of the same target
+    assert history.predict(FakeHistoryRun("resnet", "ara"), [RunStage.RUN]) == 100.0
+
+
+def test_session_scheduler_queue(tmp_path):
+    stages = [RunStage.LOAD, RunStage.BUILD]
+    runs = [FakeRun(i, stages) for i in range(3)]
+    runs.append(FakeRun(3, stages, fail_at=RunStage.BUILD))
+    scheduler = SessionScheduler(
+        runs,
+        until=RunStage.BUILD,
+        per_stage=True,
+        num_workers=2,
+        executor="queue",
+        queue_dir=tmp_path,
+        num_local_workers=2,
+    )
+    assert not scheduler.process()
+    assert all(run.completed[RunStage.BUILD] for run in runs[:3])
+    assert all(run.pid != os.getpid() for run in runs)
+    assert scheduler.stage_failures == {"BUILD": [3]}
+
+
+def test_directory_queue_requeue(tmp_path):
+    queue = DirectoryQueue(tmp_path)
+    job_id = queue.put((print, ("foo",), {}))
+    assert queue.claim()[0] == job_id
+    assert queue.claim() is None
+    assert queue.requeue_stale(timeout=60) == []
+    # The worker died without sending a heartbeat
+    os.utime(queue.claimed_dir / f"{job_id}.pkl", (0, 0))
+    assert queue.requeue_stale(timeout=60) == [job_id]
+    assert queue.num_pending == 1
+    job_id_, payload = queue.claim()
+    assert job_id_ == job_id and payload[1] == ("foo",)
+    queue.complete(job_id, result=42)
+    assert queue.collect([job_id]) == {job_id: (42, None)}
+
+
+def test_stage_cache(tmp_path):
+    cache = StageCache(tmp_path / "cache", max_size=None)
+    key = cache.compute_key("BUILD", {"foo.bar": Path("/x"), "foo.baz": 1})
+    assert key == cache.compute_key("BUILD", {"foo.baz": 1, "foo.bar": Path("/x")})
+    assert key != cache.compute_key("BUILD", {"foo.baz": 2, "foo.bar": Path("/x")})
+    assert cache.lookup(key) is None
+    artifact = Artifact("foo.c", content="int x;", fmt=ArtifactFormat.SOURCE)
+    cache.store(key, {"artifacts": {"default": [artifact]}})
+    entry = cache.lookup(key)
+    assert entry["artifacts"]["default"][0].content == "int x;"
+
+
+def test_stage_cache_eviction(tmp_path):
+    cache = StageCache(tmp_path / "cache", max_size="4K")
+    keys = [cache.compute_key(i) for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.store(key, b"0" * 1024)
+        os.utime(cache.get_path(key), (i, i))
+    cache.lookup(keys[0])  # Mark as recently used
+    cache.store(cache.compute_key(3), b"0" * 1024)
+    assert cache.lookup(keys[0]) is not None
+    assert cache.lookup(keys[1]) is None
+    assert cache.lookup(keys[2]) is not None
+    assert cache.size <= 4 * 1024
+
+
+def test_session_resume(tmp_path):
+    session = Session(idx=0, label="foo", dir=tmp_path / "0", config={"session.report_fmt": "txt"})
+    runs = [session.create_run() for _ in range(2)]
+    session.enumerate_runs()
+    session.write_state_file()
+    for run in runs:
+        run.write_state_file()
+    artifact = Artifact("foo.c", content="int x;", fmt=ArtifactFormat.SOURCE)
+    runs[1].artifacts_per_stage[RunStage.LOAD] = {"default": [artifact]}
+    runs[1].completed[RunStage.LOAD] = True
+    runs[1].write_state_file(stages=[RunStage.LOAD])
+    # Only a reference to the spilled data is stored in the state file
+    assert b"int x;" not in (runs[1].dir / "state" / "load.pkl").read_bytes()
+    assert not artifact.in_memory
+    session.close()
+
+    restored = Session(idx=0, archived=True, dir=tmp_path / "0")
+    restored.resume()
+    assert restored.active
+    assert restored.label == "foo"
+    assert restored.report_fmt == "txt"
+    assert [run.idx for run in restored.runs] == [0, 1]
+    assert not restored.runs[0].completed[RunStage.LOAD]
+    assert restored.runs[1].completed[RunStage.LOAD]
+    assert restored.runs[1].artifacts_per_stage[RunStage.LOAD]["default"][0].content == "int x;"
+    assert restored.runs[1].session is restored
+
+
+def test_run_compact(tmp_path):
+    session = Session(idx=0, label="foo", dir=tmp_path / "0")
+    run = session.create_run()
+    session.enumerate_runs()
+    exported = Artifact("foo.c", content="int x;", fmt=ArtifactFormat.SOURCE)
+    exported.export(run.dir)
+    log = Artifact("out.log", content="Total Cycles: 42", fmt=ArtifactFormat.TEXT)
+    run.artifacts_per_stage[RunStage.LOAD] = {"default": [exported]}
+    run.artifacts_per_stage[RunStage.RUN] = {"default": [log]}
+    run.completed[RunStage.LOAD] = True
+    report = run.get_report()
+    run.compact()
+    assert run.compacted
+    assert run.artifacts_per_stage == {}
+    assert run.get_report().df.equals(report.df)
+    paths = run.artifact_paths
+    assert paths[(RunStage.LOAD, "default")] == [run.dir / "foo.c"]
+    assert paths[(RunStage.RUN, "default")][0].read_text() == "Total Cycles: 42"
+    session.close()
+
+
+def test_run_failure_reason(tmp_path):
+    session = Session(idx=0, label="foo", dir=tmp_path / "0")
+    run = session.create_run()
+    session.enumerate_runs()
+
+    def _timeout():
+        script = "echo 'partial output'; echo 'core   0: addi'; sleep 5"
+        matchers = [LineMatcher("instrs", r"^core\s+\d+: ", consume=True)]
+        with OutputParser(matchers, log_dir=tmp_path) as parser:
+            execute("sh", "-c", script, parser=parser, timeout=1, print_func=lambda *args, **kwargs: None)
+
+    run.artifacts_per_stage[RunStage.LOAD] = {"default": []}
+    run.completed[RunStage.LOAD] = True
+    run.has_stage = lambda stage: stage == RunStage.BUILD
+    run.build = _timeout
+    run.process(until=RunStage.BUILD)
+    assert run.failing
+    assert run.failure_reason == "timeout"
+    assert (run.dir / "build_partial_out.log").read_text() == "partial output\n"
+    assert run.get_report().df["Reason"][0] == "timeout"
+    session.close()
+
+
+def test_session_run_report_error(tmp_path):
+    session = Session(idx=0, label="foo", dir=tmp_path / "0")
+    run = session.create_run()
+    session.enumerate_runs()
+
+    def _error():
+        raise RuntimeError("broken metrics")
+
+    run.get_report = _error
+    df = session.get_run_report(run).df
+    assert df["Run"][0] == run.idx
+    assert df["Failing"][0]
+    assert df["Reason"][0] == "report"
+    assert len(session.get_reports().df) == 1
+    session.close()
+
+
+def test_run_stage_cache_metrics(tmp_path):
+    session = Session(idx=0, label="foo", dir=tmp_path / "0")
+    run = session.create_run()
+    session.enumerate_runs()
+    metrics = Metrics()
+    metrics.add("Load Stage Time [s]", 5.0, True)
+    artifact = Artifact("load_metrics.csv", content=metrics.to_csv(include_optional=True), fmt=ArtifactFormat.TEXT)
+    run.artifacts_per_stage[RunStage.LOAD] = {"default": [artifact]}
+    # A cache hit reports the time of the lookup instead of the one of the cached stage
+    run.add_stage_cache_metrics(RunStage.LOAD, True, duration=0.25)
+    metrics = Metrics.from_csv(artifact.content)
+    assert metrics.get("Load Stage Time [s]") == 0.25
+    assert metrics.get("Load Cache Hits") == 1
+    session.close()
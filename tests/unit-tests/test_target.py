@@ -16,11 +16,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import multiprocessing
+
 import pytest
 import mock
 
+from mlonmcu.setup.jobserver import use_jobserver
 from mlonmcu.target.common import execute, cli
 from mlonmcu.target.target import Target
+from mlonmcu.target.metrics import Metrics
 from mlonmcu.target import EtissPulpinoTarget, HostX86Target
 
 
@@ -129,3 +133,48 @@ def test_target_host_x86(features, example_elf_file, capsys):
     t.exec("/bin/date")
 
     t.inspect(example_elf_file)
+
+
+class RepeatTarget(Target):
+    def __init__(self, config={}):
+        super().__init__("repeat", config=config)
+        self.dirs = []
+
+    def get_metrics(self, elf, directory):
+        self.dirs.append(directory)
+        metrics = Metrics()
+        metrics.add("Cycles", len(self.dirs))
+        return metrics, str(len(self.dirs)), []
+
+
+@pytest.mark.parametrize("repeat_jobs", [1, 3])
+def test_target_repeat_jobs(repeat_jobs):
+    target = RepeatTarget(config={"repeat.repeat_jobs": repeat_jobs, "repeat.repeat": 2})
+    collected = []
+
+    def _aggregate(out, metrics, artifacts):
+        collected.extend(metrics)
+        del metrics[1:]
+        return out
+
+    target.post_callbacks.append(_aggregate)
+    target.generate("dummy.elf")
+    assert len(collected) == 3
+    assert len(set(target.dirs)) == 3  # Every repetition uses its own working directory
+
+
+def test_target_repeat_jobs_default():
+    target = RepeatTarget(config={"repeat.repeat_jobs": None})
+    assert target.repeat_jobs == 1  # No session-wide limit without a jobserver
+    with use_jobserver(2):
+        assert target.repeat_jobs == multiprocessing.cpu_count()
+
+
+def test_target_repeat_jobs_exclusive():
+    config = {"host_x86.repeat_jobs": 4, "host_x86.gdbserver_enable": True}
+    assert HostX86Target(config=config).repeat_jobs == 1  # The gdbserver port is fixed
+    config["host_x86.gdbserver_enable"] = False
+    assert HostX86Target(config=config).repeat_jobs == 4
+    config = {key: "foo" for key in EtissPulpinoTarget.REQUIRED}
+    config.update({"etiss_pulpino.repeat_jobs": 4, "etiss_pulpino.debug_etiss": True})
+    assert EtissPulpinoTarget(config=config).repeat_jobs == 1
@@ -0,0 +1,41 @@
+#
+# Copyright (c) 2022 TUM Department of Electrical and Computer Engineering.
+#
+# This file is part of MLonMCU.
+# See https://github.com/tum-ei-eda/mlonmcu.git for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import json
+
+from mlonmcu.setup.utils import exec_getout
+from mlonmcu.trace import use_tracer, span, get_active_tracer
+
+
+def test_trace(tmp_path):
+    assert get_active_tracer() is None
+    with use_tracer(tmp_path / "trace.jsonl") as tracer:
+        with span("BUILD", cat="stage", run=0):
+            out = exec_getout("echo", "foo", print_output=False)
+    assert out == "foo\n"
+    assert get_active_tracer() is None
+    events = {event["name"]: event for event in tracer.read()}
+    assert events["BUILD"]["args"] == {"run": 0}
+    assert events["echo"]["cat"] == "subprocess"
+    assert events["echo"]["args"]["argv"] == ["echo", "foo"]
+    assert events["echo"]["args"]["exit_code"] == 0
+    assert "maxrss_kb" in events["echo"]["args"]
+    assert events["BUILD"]["dur"] >= events["echo"]["dur"]
+    tracer.export_chrome(tmp_path / "trace.json")
+    with open(tmp_path / "trace.json", "r") as handle:
+        assert len(json.load(handle)["traceEvents"]) == 2